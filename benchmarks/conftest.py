@@ -0,0 +1,35 @@
+import copy
+import os
+import sys
+
+import pytest
+from loguru import logger
+
+from data_exchange.baserow import get_baserow_table
+from data_exchange.synthetic import generate
+
+pytest.importorskip("pytest_benchmark")
+
+# comma separated numbers of cases to benchmark with
+BENCHMARK_CASES = [int(n) for n in os.environ.get("BENCHMARK_CASES", "1000").split(",")]
+
+
+@pytest.fixture(scope="session", autouse=True)
+def quiet_logging():
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+
+@pytest.fixture(scope="session", params=BENCHMARK_CASES, ids=lambda n: f"{n}cases")
+def synthetic_data(request):
+    return generate(num_cases=request.param, seed=request.param)
+
+
+@pytest.fixture
+def tables(synthetic_data):
+    """Fresh copy of all baserow tables by name, as stages may modify entries."""
+    all_tables = copy.deepcopy(synthetic_data.baserow_tables())
+    return {
+        name: get_baserow_table(all_tables, name)
+        for name in ("Cases", "Patients", "LB-Metadata", "Personnel", "Findings")
+    }
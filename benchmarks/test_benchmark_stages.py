@@ -0,0 +1,95 @@
+"""Benchmarks of the matching, validation and merge stages on synthetic data.
+
+Run with `python -m pytest benchmarks`, results are saved as JSON to
+.benchmarks and can be compared with --benchmark-compare.
+"""
+import copy
+
+import pytest
+
+from data_exchange import (
+    apply_validations,
+    create_validation_updates,
+    merge_entries,
+    update_baserow_from_lb,
+    update_baserow_from_sams,
+    update_baserow_from_sodar,
+    update_baserow_from_varfish,
+    update_baserow_from_varfish_variants,
+    update_baserow_relatives,
+    update_entry_status,
+)
+
+ROUNDS = 3
+
+
+@pytest.fixture
+def case_updates(synthetic_data, tables):
+    cases = tables["Cases"]
+    updates = update_baserow_from_lb(cases, tables["LB-Metadata"])
+    updates += update_baserow_from_sodar(cases, synthetic_data.sodar)
+    updates += update_baserow_from_varfish(cases, synthetic_data.varfish)
+    updates += update_baserow_from_sams(cases, synthetic_data.sams)
+    return updates
+
+
+@pytest.fixture
+def findings_updates(synthetic_data, tables):
+    return update_baserow_from_varfish_variants(tables["Cases"], tables["Findings"], synthetic_data.sources()["varfish_findings"])
+
+
+def test_update_baserow_from_lb(benchmark, tables):
+    benchmark.pedantic(update_baserow_from_lb, args=(tables["Cases"], tables["LB-Metadata"]), rounds=ROUNDS)
+
+
+def test_update_baserow_from_sodar(benchmark, synthetic_data, tables):
+    benchmark.pedantic(update_baserow_from_sodar, args=(tables["Cases"], synthetic_data.sodar), rounds=ROUNDS)
+
+
+def test_update_baserow_from_varfish(benchmark, synthetic_data, tables):
+    benchmark.pedantic(update_baserow_from_varfish, args=(tables["Cases"], synthetic_data.varfish), rounds=ROUNDS)
+
+
+def test_update_baserow_from_sams(benchmark, synthetic_data, tables):
+    benchmark.pedantic(update_baserow_from_sams, args=(tables["Cases"], synthetic_data.sams), rounds=ROUNDS)
+
+
+def test_update_baserow_from_varfish_variants(benchmark, synthetic_data, tables):
+    def setup():
+        # matching fills in missing annotations on the varfish variants
+        variants = copy.deepcopy(synthetic_data.varfish_findings)
+        getter = lambda uuids: {u: variants[u] for u in uuids}
+        return (tables["Cases"], tables["Findings"], getter), {}
+
+    benchmark.pedantic(update_baserow_from_varfish_variants, setup=setup, rounds=ROUNDS)
+
+
+def test_update_baserow_relatives(benchmark, synthetic_data, tables):
+    def setup():
+        # relatives are merged into existing patient entries
+        return (tables["Cases"], copy.deepcopy(tables["Patients"]), tables["LB-Metadata"], synthetic_data.sodar, synthetic_data.varfish), {}
+
+    benchmark.pedantic(update_baserow_relatives, setup=setup, rounds=ROUNDS)
+
+
+def test_apply_validations(benchmark, tables, case_updates, findings_updates):
+    benchmark.pedantic(
+        apply_validations,
+        args=(tables["Personnel"], tables["Cases"], case_updates, tables["Findings"], findings_updates),
+        rounds=ROUNDS,
+    )
+
+
+def test_merge_entries(benchmark, tables, case_updates, findings_updates):
+    benchmark.pedantic(
+        merge_entries,
+        args=(tables["Cases"], case_updates, "Findings", tables["Findings"], findings_updates, "Cases"),
+        rounds=ROUNDS,
+    )
+
+
+def test_update_entry_status(benchmark, tables, case_updates, findings_updates):
+    errors = apply_validations(tables["Personnel"], tables["Cases"], case_updates, tables["Findings"], findings_updates)
+    all_updates = case_updates + create_validation_updates(tables["Cases"], errors)
+    full_data = merge_entries(tables["Cases"], all_updates, "Findings", tables["Findings"], findings_updates, "Cases")
+    benchmark.pedantic(update_entry_status, args=(tables["Cases"], full_data), rounds=ROUNDS)
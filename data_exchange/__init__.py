@@ -1,7 +1,14 @@
-from . import sams, varfish, baserow, sodar
 from .baserow import get_baserow_table, apply_updates, merge_entries
-from .updates import update_baserow_from_lb, update_baserow_from_sodar, update_baserow_from_varfish, update_baserow_from_sams, update_baserow_from_varfish_variants, update_entry_status, update_baserow_relatives
+from .updates import update_baserow_from_lb, update_baserow_from_sodar, update_baserow_from_varfish, update_baserow_from_sams, update_baserow_from_varfish_variants, update_entry_status, update_baserow_relatives, update_finding_terms
 from .validation import apply_validations, create_validation_updates
+from .profiling import profile_stage
+from .checkpoint import checkpoint_stage
+from .ontology import get_ontology
+from .resilience import SourceUnavailableError
+
+import importlib
+from pathlib import Path
+from typing import Callable, Dict, Optional
 
 from loguru import logger
 
@@ -9,23 +16,60 @@ BASEROW = "baserow"
 VARFISH = "varfish"
 SODAR = "sodar"
 SAMS = "sams"
+VARFISH_FINDINGS = "varfish_findings"
 
 CASE_TABLE_NAME = "Cases"
 FINDINGS_TABLE_NAME = "Findings"
+PATIENTS_TABLE_NAME = "Patients"
 
 DATA_EXCHANGE_VERSION = "1"
 
+
+def lazy_getter(module: str, name: str) -> Callable:
+    """Source getter importing its module and client libraries on first call."""
+    def getter(*args, **kwargs):
+        return getattr(importlib.import_module(module, __name__), name)(*args, **kwargs)
+    getter.__name__ = name
+    getter.__qualname__ = f"{module.lstrip('.')}.{name}"
+    return getter
+
+
 ALL_DATA = {
-    SAMS: sams.get_data,
-    BASEROW: baserow.get_data,
-    VARFISH: varfish.get_data,
-    SODAR: sodar.get_data,
+    SAMS: lazy_getter(".sams", "get_data"),
+    BASEROW: lazy_getter(".baserow", "get_data"),
+    VARFISH: lazy_getter(".varfish", "get_data"),
+    SODAR: lazy_getter(".sodar", "get_data"),
+    VARFISH_FINDINGS: lazy_getter(".varfish", "get_findings"),
 }
 
-def run(dry_run: bool, get_sodar: bool, get_varfish: bool, get_sams: bool):
-    """Fetch data from all data sources and create updates and validations.
+def set_stage(stage: str, updates: list) -> list:
+    """Record the pipeline stage that created the updates, eg for update plans."""
+    for update in updates:
+        update.stage = update.stage or stage
+    return updates
+
+
+def optional_stage(name: str, func: Callable, default):
+    """Run the stage of an optional source, skipping it if the source is unavailable."""
+    try:
+        return checkpoint_stage(name, func)
+    except SourceUnavailableError as err:
+        logger.warning("Skipping stage {name}: {err}", name=name, err=err)
+        return default
+
+
+def create_updates(get_sodar: bool, get_varfish: bool, get_sams: bool, sources: Optional[Dict[str, Callable]] = None, workers: int = 1):
+    """Fetch data from all data sources and create updates and validations without applying them.
+
+    Returns merged case data, updates of the Cases, Findings and Patients
+    tables and validation errors. With checkpoints enabled, stages completed
+    by a previous attempt of the run are loaded instead of run again. With
+    more than one worker, LB matching, VarFish findings matching and
+    validation run in worker processes sharded by family.
     """
-    all_baserow_data = ALL_DATA[BASEROW]()
+    sources = sources or ALL_DATA
+    with profile_stage("baserow"):
+        all_baserow_data = checkpoint_stage("baserow", sources[BASEROW])
 
     phenotips_data = get_baserow_table(all_baserow_data, "Cases")
     relatives_data = get_baserow_table(all_baserow_data, "Patients")
@@ -33,8 +77,54 @@ def run(dry_run: bool, get_sodar: bool, get_varfish: bool, get_sams: bool):
     personnel_data = get_baserow_table(all_baserow_data, "Personnel")
     findings_data = get_baserow_table(all_baserow_data, "Findings")
 
+    shards = None
+    if workers > 1:
+        from . import shards as sharding
+
+        shards = sharding.plan_shards(phenotips_data, pel_data, findings_data, workers * sharding.SHARDS_PER_WORKER)
+        logger.info("Running per case stages in {workers} processes with {shards} shards", workers=workers, shards=len(shards))
+
+    def lb():
+        if shards:
+            return sharding.sharded_lb_updates(phenotips_data, pel_data, shards, workers)
+        return update_baserow_from_lb(phenotips_data, pel_data)
+
+    def sodar():
+        data = sources[SODAR]()
+        return data, set_stage("sodar", update_baserow_from_sodar(phenotips_data, data))
+
+    def varfish():
+        data = sources[VARFISH]()
+        return data, set_stage("varfish", update_baserow_from_varfish(phenotips_data, data))
+
+    def varfish_findings():
+        if shards:
+            return sharding.sharded_varfish_variant_updates(phenotips_data, findings_data, sources[VARFISH_FINDINGS], shards, workers)
+        return update_baserow_from_varfish_variants(phenotips_data, findings_data, sources[VARFISH_FINDINGS])
+
+    def sams():
+        return update_baserow_from_sams(phenotips_data, sources[SAMS]())
+
+    def relatives():
+        return update_baserow_relatives(phenotips_data, relatives_data, pel_data, sodar_data, varfish_data)
+
+    def terms():
+        return update_finding_terms(findings_data, findings_updates, get_ontology())
+
+    def validation():
+        if shards:
+            errors = sharding.sharded_validations(personnel_data, phenotips_data, all_updates, findings_data, findings_updates, shards, workers)
+        else:
+            errors = apply_validations(personnel_data, phenotips_data, all_updates, findings_data, findings_updates)
+        return errors, set_stage("validation", create_validation_updates(phenotips_data, errors))
+
+    def merge():
+        merged = merge_entries(phenotips_data, all_updates, "Findings", findings_data, findings_updates, "Cases")
+        return merged, set_stage("status", update_entry_status(phenotips_data, merged))
+
     all_updates = []
-    all_updates += update_baserow_from_lb(phenotips_data, pel_data)
+    with profile_stage("lb"):
+        all_updates += set_stage("lb", checkpoint_stage("lb", lb))
 
     sodar_data = None
     varfish_data = None
@@ -42,30 +132,77 @@ def run(dry_run: bool, get_sodar: bool, get_varfish: bool, get_sams: bool):
 
     if get_sodar:
         logger.info("Loading SODAR data")
-        sodar_data = ALL_DATA[SODAR]()
-        all_updates += update_baserow_from_sodar(phenotips_data, sodar_data)
+        with profile_stage("sodar"):
+            sodar_data, sodar_updates = optional_stage("sodar", sodar, (None, []))
+            all_updates += sodar_updates
 
     if get_varfish:
         logger.info("Loading VarFish data")
-        varfish_data = ALL_DATA[VARFISH]()
-        all_updates += update_baserow_from_varfish(phenotips_data, varfish_data)
-        findings_updates += update_baserow_from_varfish_variants(phenotips_data, findings_data)
+        with profile_stage("varfish"):
+            varfish_data, varfish_updates = optional_stage("varfish", varfish, (None, []))
+            all_updates += varfish_updates
+        with profile_stage("varfish_findings"):
+            findings_updates += set_stage("varfish_findings", optional_stage("varfish_findings", varfish_findings, []))
 
     if get_sams:
         logger.info("Loading SAMS data")
-        all_updates += update_baserow_from_sams(phenotips_data, ALL_DATA[SAMS]())
+        with profile_stage("sams"):
+            all_updates += set_stage("sams", optional_stage("sams", sams, []))
+
+    with profile_stage("relatives"):
+        relatives_updates = set_stage("relatives", checkpoint_stage("relatives", relatives))
 
-    relatives_updates = update_baserow_relatives(phenotips_data, relatives_data, pel_data, sodar_data, varfish_data)
+    if get_ontology() is not None:
+        with profile_stage("terms"):
+            findings_updates += set_stage("terms", checkpoint_stage("terms", terms))
 
     # perform validation steps
-    validation_errors = apply_validations(personnel_data, phenotips_data, all_updates, findings_data, findings_updates)
-    all_updates += create_validation_updates(phenotips_data, validation_errors)
+    with profile_stage("validation"):
+        validation_errors, validation_updates = checkpoint_stage("validation", validation)
+        all_updates += validation_updates
+
+    with profile_stage("merge"):
+        full_data, status_updates = checkpoint_stage("merge", merge)
+        all_updates += status_updates
+
+    return full_data, all_updates, findings_updates, relatives_updates, validation_errors
+
+
+def run(
+    dry_run: bool,
+    get_sodar: bool,
+    get_varfish: bool,
+    get_sams: bool,
+    sources: Optional[Dict[str, Callable]] = None,
+    plan: Optional[Path] = None,
+    parquet: Optional[Path] = None,
+    workers: int = 1,
+):
+    """Fetch data from all data sources, create updates and validations and apply them.
+
+    sources replaces the getters in ALL_DATA, eg to record or replay data.
+    plan is a file to write all updates to before applying them.
+    parquet is a directory to write the merged cases and findings and the
+    validation errors to as Parquet files.
+    workers is the number of processes running the per case stages.
+    """
+    full_data, all_updates, findings_updates, relatives_updates, validation_errors = create_updates(get_sodar, get_varfish, get_sams, sources, workers)
+
+    if plan is not None:
+        from .plan import write_plan
+
+        write_plan(plan, {CASE_TABLE_NAME: all_updates, FINDINGS_TABLE_NAME: findings_updates, PATIENTS_TABLE_NAME: relatives_updates})
+
+    if parquet is not None:
+        from .parquet import write_parquet
 
-    full_data = merge_entries(phenotips_data, all_updates, "Findings", findings_data, findings_updates, "Cases")
-    all_updates += update_entry_status(phenotips_data, full_data)
+        with profile_stage("parquet"):
+            write_parquet(parquet, full_data, validation_errors)
 
-    apply_updates(CASE_TABLE_NAME, all_updates, dry_run=dry_run)
-    apply_updates(FINDINGS_TABLE_NAME, findings_updates, dry_run=dry_run)
-    apply_updates("Patients", relatives_updates, dry_run=dry_run)
+    with profile_stage("apply_updates"):
+        # tables uploaded before a failure are not uploaded again on resume
+        checkpoint_stage("apply_cases", lambda: apply_updates(CASE_TABLE_NAME, all_updates, dry_run=dry_run))
+        checkpoint_stage("apply_findings", lambda: apply_updates(FINDINGS_TABLE_NAME, findings_updates, dry_run=dry_run))
+        checkpoint_stage("apply_patients", lambda: apply_updates(PATIENTS_TABLE_NAME, relatives_updates, dry_run=dry_run))
 
     return full_data, all_updates, findings_updates, validation_errors
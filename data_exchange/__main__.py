@@ -1,17 +1,314 @@
-from data_exchange.report import to_text_report_by_responsible
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
 
-from . import run
+from loguru import logger
 import typer
 
+from data_exchange.report import write_validation_report
+
+from . import run, ALL_DATA, DATA_EXCHANGE_VERSION
+from .recording import record_sources, replay_sources
+from . import checkpoint, profiling
+from .checkpoint import Checkpoints
+from .resilience import DegradationReport, guard_configured_sources
+from .profiling import ProfileMode
+from .query import QueryEngine
+
 
 app = typer.Typer(pretty_exceptions_show_locals=False)
 
 
-@app.command()
-def main(dry_run: bool = False, sodar: bool = False, varfish: bool = False, sams: bool = False):
-    _, _, _, errors = run(dry_run=dry_run, get_sodar=sodar, get_varfish=varfish, get_sams=sams)
+@app.callback(invoke_without_command=True)
+def main(
+    ctx: typer.Context,
+    dry_run: bool = False,
+    sodar: bool = False,
+    varfish: bool = False,
+    sams: bool = False,
+    record: Optional[Path] = typer.Option(None, help="Save all fetched source data to this directory."),
+    replay: Optional[Path] = typer.Option(None, help="Run from source data recorded to this directory without network access."),
+    profile: Optional[ProfileMode] = typer.Option(None, help="Profile cpu time, memory allocations or both of every pipeline stage."),
+    profile_dir: Path = typer.Option(Path("profiles"), help="Directory for profiles, each run writes to a timestamped subdirectory."),
+    resume: Optional[str] = typer.Option(None, help="Resume a failed run by its run id, skipping all stages it completed."),
+    checkpoint_dir: Optional[Path] = typer.Option(None, help="Save stage outputs to this directory to resume failed runs, they hold patient data."),
+    checkpoint_keep_days: int = typer.Option(7, min=0, help="Remove checkpoints of failed runs after this many days."),
+    plan: Optional[Path] = typer.Option(None, help="Write all updates to this JSON Lines plan file, eg with --dry-run to apply them later using apply-plan."),
+    parquet: Optional[Path] = typer.Option(None, help="Write merged cases and findings and validation errors as Parquet files to this directory, requires pyarrow."),
+    full_report: bool = typer.Option(False, help="Report all open validation errors, not only the new and resolved ones."),
+    workers: int = typer.Option(1, min=1, help="Processes running LB matching, VarFish findings matching and validation, sharded by family."),
+):
+    if record and replay:
+        raise typer.BadParameter("--record and --replay can not be combined")
+    if resume and ctx.invoked_subcommand is not None:
+        raise typer.BadParameter("--resume can only be used for a full run")
+    if resume and checkpoint_dir is None:
+        raise typer.BadParameter("--resume needs the --checkpoint-dir of the failed run")
+
+    degradation = DegradationReport()
+    if replay:
+        sources = replay_sources(ALL_DATA, replay)
+        if not dry_run:
+            logger.warning("Replaying recorded data, no data will be uploaded.")
+            dry_run = True
+    else:
+        sources = record_sources(ALL_DATA, record, DATA_EXCHANGE_VERSION) if record else ALL_DATA
+        sources = guard_configured_sources(sources, degradation)
+
+    if profile:
+        profiling.enable(profile, profile_dir / datetime.now().strftime("%Y%m%d-%H%M%S"))
+
+    if ctx.invoked_subcommand is not None:
+        ctx.obj = {"dry_run": dry_run, "get_sodar": sodar, "get_varfish": varfish, "get_sams": sams, "sources": sources, "degradation": degradation}
+        ctx.meta.update(record=record, replay=replay)
+        return
+
+    checkpoints = None
+    if resume:
+        checkpoints = Checkpoints.resume(checkpoint_dir, resume)
+        logger.info("Resuming run {run_id} with its options {options}", run_id=resume, options=checkpoints.options)
+        dry_run, sodar, varfish, sams = (checkpoints.options[k] for k in ("dry_run", "sodar", "varfish", "sams"))
+    elif checkpoint_dir is not None:
+        checkpoint.prune(checkpoint_dir, checkpoint_keep_days)
+        checkpoints = Checkpoints.create(checkpoint_dir, {"dry_run": dry_run, "sodar": sodar, "varfish": varfish, "sams": sams})
+    if checkpoints is not None:
+        checkpoint.enable(checkpoints)
+
+    try:
+        _, _, _, errors = run(dry_run=dry_run, get_sodar=sodar, get_varfish=varfish, get_sams=sams, sources=sources, plan=plan, parquet=parquet, workers=workers)
+    except Exception:
+        if checkpoints is not None:
+            logger.error("Run failed, continue it with --checkpoint-dir {dir} --resume {run_id}", dir=checkpoint_dir, run_id=checkpoints.run_id)
+        raise
+    if checkpoints is not None:
+        checkpoints.remove()
+    if degradation_text := degradation.to_text():
+        print(degradation_text)
     # text_vali_report = to_text_report(errors)
-    report_text = to_text_report_by_responsible(errors)
-    print(report_text)
+    # errors of sources that were skipped would be saved as resolved
+    write_validation_report(errors, print, save=not dry_run and not degradation.degradations, full=full_report)
+
+
+@app.command()
+def serve(
+    ctx: typer.Context,
+    host: Optional[str] = typer.Option(None, help="Address of the health and metrics endpoint, defaults to serve.host setting."),
+    port: Optional[int] = typer.Option(None, help="Port of the health and metrics endpoint, defaults to serve.port setting."),
+    webhook: Optional[bool] = typer.Option(None, help="Sync rows from Baserow webhooks incrementally, defaults to webhook.enabled setting."),
+):
+    """Run the sync and the appointment sync on the schedules in the serve settings.
+
+    Source options are given before the command, eg --sodar --varfish --sams serve.
+    """
+    from .config import settings
+    from .daemon import serve as serve_daemon
+
+    serve_daemon(
+        host=host or settings.serve.host,
+        port=settings.serve.port if port is None else port,
+        webhook=settings.webhook.enabled if webhook is None else webhook,
+        **ctx.obj,
+    )
+
+
+
+@app.command("apply-plan")
+def apply_plan(
+    ctx: typer.Context,
+    plan: Path = typer.Argument(..., exists=True, dir_okay=False, help="Plan file written with --plan."),
+    force: bool = typer.Option(False, help="Apply the plan even if fields were changed since it was written, keeping the changed fields."),
+):
+    """Upload the updates of a saved plan without recomputing them.
+
+    Fields changed since the plan was written are reported and the plan is
+    not applied, unless --force is given. Use --dry-run before the command to
+    only check the plan, eg --dry-run apply-plan plan.jsonl.
+    """
+    from .plan import PlanConflictError, apply_plan as apply_saved_plan
+
+    try:
+        updates, conflicts = apply_saved_plan(plan, dry_run=ctx.obj["dry_run"], force=force)
+    except PlanConflictError as err:
+        for c in err.conflicts:
+            print(f"Conflict {c.table} {c.id} {c.field}: planned {c.old!r} -> {c.new!r}, now {c.current!r}")
+        print(f"{err}, not applied. Use --force to apply all other fields.")
+        raise typer.Exit(1)
+    for c in conflicts:
+        print(f"Skipped {c.table} {c.id} {c.field}: planned {c.old!r} -> {c.new!r}, now {c.current!r}")
+    for table_name, table_updates in updates.items():
+        print(f"{table_name}: {sum(u.has_updates for u in table_updates)} rows")
+
+
+def read_password(password_file: Optional[Path]) -> Optional[bytes]:
+    """Read the password for exports and backups, by default from export.password_file."""
+    from .config import settings
+
+    password_file = password_file or settings.export.get("password_file")
+    return Path(password_file).read_bytes().strip() if password_file else None
+
+
+@app.command()
+def export(
+    output: Optional[Path] = typer.Argument(None, help="Archive to write, defaults to a timestamped file in the export.directory setting."),
+    password_file: Optional[Path] = typer.Option(None, help="File with the archive password, defaults to export.password_file setting."),
+    workers: int = typer.Option(4, help="Number of tables fetched concurrently."),
+):
+    """Export the tables of the export settings as XLSX files to an encrypted zip archive."""
+    from .config import settings
+    from .export import export_tables
+
+    if output is None:
+        output = Path(settings.export.directory) / f"baserow_export_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.zip"
+    password = read_password(password_file)
+    if password is None:
+        logger.warning("No password file configured, the archive will not be encrypted.")
+    tables = [(table.id, table.name) for table in settings.export.tables]
+    for member in export_tables(output, tables, password=password, workers=workers):
+        print(f"{output}: {member}")
+
+
+@app.command()
+def backup(
+    password_file: Optional[Path] = typer.Option(None, help="File with the backup password, defaults to export.password_file setting."),
+    workers: int = typer.Option(4, help="Number of tables fetched concurrently."),
+):
+    """Back up the tables of the export settings to the deduplicated store in backup.directory.
+
+    Only changed row chunks are written. Backups outside of the retention
+    settings are removed afterwards, together with chunks no backup uses.
+    """
+    from .backups import BackupStore
+    from .config import settings
+    from .export import fetch_tables
+
+    store = BackupStore(Path(settings.backup.directory), read_password(password_file))
+    tables = [(table.id, table.name) for table in settings.export.tables]
+    manifest = store.write_backup(fetch_tables(tables, workers), int(settings.backup.chunk_rows))
+    removed = store.prune(int(settings.backup.keep_days), int(settings.backup.keep_months))
+    chunks = store.collect_garbage()
+    print(f"Backup {manifest.id}: {sum(t.rows for t in manifest.tables.values())} rows, removed {len(removed)} old backups and {chunks} chunks")
+
+
+@app.command("restore-backup")
+def restore_backup(
+    output: Path = typer.Argument(..., help="Zip archive to write the tables of the backup to as XLSX files."),
+    backup_id: str = typer.Option("latest", "--backup", help="Backup to restore, eg 2024-05-01_02-00-00."),
+    password_file: Optional[Path] = typer.Option(None, help="File with the backup password, defaults to export.password_file setting."),
+):
+    """Rebuild the full tables of a backup into an archive, encrypted like exports."""
+    from .backups import BackupStore
+    from .config import settings
+    from .export import open_archive, write_xlsx_member
+
+    password = read_password(password_file)
+    store = BackupStore(Path(settings.backup.directory), password)
+    manifest = store.manifest(backup_id)
+    with open_archive(output, password) as archive:
+        for name, table in manifest.tables.items():
+            write_xlsx_member(archive, name, table.columns, store.read_table(manifest, name))
+            print(f"{output}: {name} with {table.rows} rows of backup {manifest.id}")
+
+
+@app.command("list-backups")
+def list_backups(
+    password_file: Optional[Path] = typer.Option(None, help="File with the backup password, defaults to export.password_file setting."),
+):
+    """List all backups in backup.directory with their tables."""
+    from .backups import BackupStore
+    from .config import settings
+
+    store = BackupStore(Path(settings.backup.directory), read_password(password_file))
+    for backup_id in store.backup_ids():
+        tables = store.manifest(backup_id).tables
+        print(backup_id, ", ".join(f"{name} ({table.rows} rows)" for name, table in tables.items()))
+
+
+@app.command("build-ontology")
+def build_ontology(
+    obo_files: List[Path] = typer.Argument(..., help="Downloaded OBO files, eg hp.obo and mondo.obo."),
+    output: Optional[Path] = typer.Option(None, help="Index file to write, defaults to ontology.index_file setting."),
+):
+    """Build the offline index of HPO, MONDO, OMIM and ORPHA terms used to validate findings."""
+    from .config import settings
+    from .ontology import build_index
+    from .varfish import HPO_INHERITANCE_MAPPING
+
+    if output is None:
+        if not settings.ontology.index_file:
+            raise typer.BadParameter("Give --output or set ontology.index_file")
+        output = Path(settings.ontology.index_file)
+    build_index(obo_files, output, HPO_INHERITANCE_MAPPING)
+
+
+@app.command()
+def query(
+    sql: Optional[str] = typer.Argument(None, help="SQL query, eg 'SELECT case_status, count(*) FROM cases GROUP BY 1'."),
+    snapshots: Optional[Path] = typer.Option(None, help="Directory with snapshots or a recording, defaults to degradation.snapshot_dir setting."),
+    engine: QueryEngine = typer.Option(QueryEngine.AUTO, help="Database to load the snapshots into, auto uses DuckDB if installed."),
+    csv: bool = typer.Option(False, help="Print results as CSV."),
+    tables: bool = typer.Option(False, help="List all tables with their columns."),
+):
+    """Run SQL on the latest local snapshots of Baserow, SODAR, VarFish and SAMS without API requests."""
+    import csv as csv_module
+    import sys
+
+    from .config import settings
+    from .query import connect, format_rows, run_query, snapshot_tables
+
+    query_tables = snapshot_tables(snapshots or Path(settings.degradation.snapshot_dir))
+    if tables:
+        for name, table in query_tables.items():
+            print(f"{name}({', '.join(table.columns)})")
+        return
+    if not sql:
+        raise typer.BadParameter("Give a query or use --tables")
+
+    columns, rows = run_query(connect(query_tables, engine), sql)
+    if csv:
+        writer = csv_module.writer(sys.stdout)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    else:
+        print(format_rows(columns, rows))
+
+
+@app.command("sync-case")
+def sync_case(
+    ctx: typer.Context,
+    case_id: str = typer.Argument(..., help="Case to sync, eg SV-1234."),
+    apply: bool = typer.Option(False, help="Upload the updates instead of only printing them."),
+):
+    """Run all stages for a single case and print the resulting changes.
+
+    Source options are given before the command, eg --sodar --varfish --sams sync-case SV-1234.
+    With --record the data of the case is recorded, which can be replayed
+    with --replay like a full run.
+    """
+    from .single_case import format_diff, format_errors, load_case, parse_case_id, sync_case as sync_single_case
+
+    try:
+        row_id = parse_case_id(case_id)
+    except ValueError as err:
+        raise typer.BadParameter(str(err))
+    replay = ctx.meta["replay"] is not None
+    if replay and apply:
+        raise typer.BadParameter("--apply can not be used with --replay")
+    options = ctx.obj
+    data = load_case(
+        row_id,
+        get_sodar=options["get_sodar"],
+        get_varfish=options["get_varfish"],
+        get_sams=options["get_sams"],
+        sources=options["sources"],
+        recorded=replay,
+    )
+    sources = None
+    if record := ctx.meta["record"]:
+        sources = record_sources(data.sources(), record, DATA_EXCHANGE_VERSION)
+    updates, errors = sync_single_case(data, apply=apply, sources=sources)
+    print(format_diff(updates))
+    print()
+    print(format_errors(errors))
+
 
 app()
@@ -0,0 +1,525 @@
+"""Create and complete cases from CADS appointments in the appointment planner."""
+import os
+import re
+import json
+import subprocess
+import datetime
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+from dataclasses import asdict, dataclass, field
+
+from enum import Enum
+
+from .baserow import get_client, get_table
+from .config import settings
+from .planner_match import is_cads
+from .records import to_plain
+
+DB_PATH = "/media/WMG/WMG-LZG/klinische Genetik/Terminplaner v.240/Arztpra2.MDB"
+
+CASE_TABLE_ID = 579
+
+# only fields used for name matching and filled from appointments
+CASE_FIELDS = ["Firstname", "Lastname", "Birthdate", "Clinician", "Datum Einschluss"]
+
+# appointments before are never synced
+FIRST_APPOINTMENT_DATE = datetime.date(2023, 1, 1)
+RECENT_TIMESPAN = datetime.timedelta(days=30)
+
+# begin date of a raw Termine row as written by mdb-json, eg "Datum_Beginn":"03/14/24 09:30:00"
+RAW_DATE_BEGIN = re.compile(rb'"Datum_Beginn"\s*:\s*"(\d{2})/(\d{2})/(\d{2}) ')
+
+
+def iter_mdb(mdbPath, table, keep_line: Optional[Callable[[bytes], bool]] = None) -> Iterator[dict]:
+    """Decode the rows of an MDB table while mdb-json is still writing them.
+
+    Lines rejected by keep_line are skipped without decoding them.
+    """
+    proc = subprocess.Popen(["mdb-json", mdbPath, table], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        for line in proc.stdout:
+            if line.strip() and (keep_line is None or keep_line(line)):
+                yield json.loads(line)
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            # generator closed before all rows were read
+            proc.kill()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise RuntimeError(f"mdb-json failed to read {table} with exit code {returncode}")
+
+
+def queryMdb(mdbPath, table):
+    return list(iter_mdb(mdbPath, table))
+
+
+def parseDate(datestring):
+    if datestring:
+        date = datetime.datetime.strptime(datestring, "%m/%d/%y %H:%M:%S")
+        return date
+    return None
+
+
+class PresentEnum(Enum):
+    NONE = 0
+    PRESENT = 1
+    CANCELED = 12
+
+
+@dataclass
+class Appointment:
+    status: int
+    info: str
+    name: str
+    color_id: int
+    date_begin: Optional[datetime.datetime]
+    date_end: Optional[datetime.datetime]
+    resources: list
+    raw: dict
+    present: int
+    patient_id: Optional[int]
+
+    @property
+    def identifier(self):
+        if self.date_begin is None or self.date_end is None or self.patient_id is None:
+            return None
+        return f"{self.patient_id}:{self.date_begin.isoformat()}{self.date_end.isoformat()}"
+
+    @classmethod
+    def from_raw_json(cls, data):
+        try:
+            date_begin = parseDate(data["Datum_Beginn"])
+            date_end = parseDate(data["Datum_Ende"])
+            color_id = data["Farb_Id"]
+            resources = [r for r in data["Resources"].split(";") if r]
+            info = data.get("Info", None)
+            name = data.get("Name", None)
+            patient_id = data.get('Patient_Id')
+            status = data["Status_Id"]
+            present = data.get("Anwesend", 0)
+            raw = data
+            return cls(status=status, info=info, color_id=color_id, date_begin=date_begin, date_end=date_end, name=name, raw=raw, resources=resources, present=present, patient_id=patient_id)
+        except KeyError:
+            return None
+
+
+@dataclass
+class NameInfo:
+    firstname: Optional[str]
+    lastname: Optional[str]
+    dob: Optional[datetime.date]
+
+
+def is_cads_appointment(app):
+    return is_cads(app.info) and app.present == PresentEnum.PRESENT.value
+
+
+def is_recent_appointment(app):
+    today = datetime.date.today()
+    return app.date_begin.date() <= today and today - app.date_begin.date() <= RECENT_TIMESPAN
+
+
+def begins_between(line: bytes, first: datetime.date, last: datetime.date) -> bool:
+    """Check the begin date of a raw Termine row without decoding it.
+
+    Rows without a readable begin date are kept and filtered after decoding.
+    """
+    if m := RAW_DATE_BEGIN.search(line):
+        month, day, year = (int(g) for g in m.groups())
+        # same pivot year as %y in parseDate
+        year += 2000 if year < 69 else 1900
+        try:
+            return first <= datetime.date(year, month, day) <= last
+        except ValueError:
+            return True
+    return True
+
+
+@dataclass
+class AppointmentState:
+    """Watermark of the appointment sync saved between runs.
+
+    Holds the modification time and size of the MDB file at the last run and
+    the identifiers of all recent appointments already synced.
+    """
+    mtime: Optional[float] = None
+    size: Optional[int] = None
+    day: Optional[str] = None
+    # identifier -> begin date of synced appointments
+    processed: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> "AppointmentState":
+        if not path.exists():
+            return cls()
+        try:
+            return cls(**json.loads(path.read_text()))
+        except (ValueError, TypeError):
+            return cls()
+
+    def save(self, path: Path):
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(json.dumps(asdict(self)))
+        tmp_path.replace(path)
+
+    def is_current(self, stat: os.stat_result, today: datetime.date) -> bool:
+        """Check whether the MDB file is unchanged since the last run of today.
+
+        Runs on another day have to read the file again, as appointments
+        become recent when their day is reached.
+        """
+        return (self.mtime, self.size, self.day) == (stat.st_mtime, stat.st_size, today.isoformat())
+
+    def update(self, stat: os.stat_result, today: datetime.date):
+        self.mtime = stat.st_mtime
+        self.size = stat.st_size
+        self.day = today.isoformat()
+        first = (today - RECENT_TIMESPAN).isoformat()
+        self.processed = {k: v for k, v in self.processed.items() if v >= first}
+
+
+def get_state_path() -> Optional[Path]:
+    if state_file := settings.get("appointments", {}).get("state_file"):
+        return Path(state_file)
+    return None
+
+
+def extract_patient_name(name_text):
+    if name_text is None:
+        return None, None, None
+    name = name_text
+    dob = None
+    if m := re.search(r"\d{2}.\d{2}.\d{4}", name_text):
+        name = name_text[:m.start()]
+        dob = datetime.datetime.strptime(m.group(0), "%d.%m.%Y").date()
+    elif m := re.search(r"\d{2}.\d{2}.\d{2}", name_text):
+        name = name_text[:m.start()]
+        dob = datetime.datetime.strptime(m.group(0), "%d.%m.%y").date()
+
+    name = name.replace("geb. am", "")
+    name = name.strip(", *")
+    if "," in name:
+        lastname, firstname, *_ = name.split(",")
+    else:
+        lastname = name
+        firstname = None
+
+    if firstname:
+        firstname = firstname.strip()
+    if lastname:
+        lastname = lastname.strip()
+
+    return NameInfo(firstname=firstname, lastname=lastname, dob=dob)
+
+
+def create_name_info_baserow_data(data):
+    firstname = data["Firstname"]
+    lastname = data["Lastname"]
+    if data["Birthdate"]:
+        dob = datetime.date.fromisoformat(data["Birthdate"])
+    else:
+        dob = None
+    return NameInfo(firstname=firstname, lastname=lastname, dob=dob)
+
+
+def match_patient_name(n1, n2):
+    lastname_exists = n1.lastname not in (None, "") and n2.lastname not in (None, "")
+    if lastname_exists:
+        lastname_matches = n1.lastname == n2.lastname
+    else:
+        lastname_matches = False
+    firstname_exists = n1.firstname not in (None, "") and n2.firstname not in (None, "")
+    if firstname_exists:
+        fn = n1.firstname.split()[0]
+        fn2 = n2.firstname.split()[0]
+        firstname_matches = fn == fn2
+    else:
+        firstname_matches = False
+
+    dob_exists = n1.dob is not None and n2.dob is not None
+    if dob_exists:
+        dob_matches = n1.dob == n2.dob
+    else:
+        dob_matches = False
+
+    reversed_matches = False
+    if firstname_exists and lastname_exists:
+        reversed_matches = n1.firstname == n2.lastname and n1.lastname == n2.firstname
+
+    if firstname_matches and lastname_matches and dob_matches:
+        return True
+    elif dob_matches and lastname_matches:
+        return True
+    elif firstname_matches and lastname_matches:
+        return True
+    elif dob_matches and firstname_matches:
+        return True
+    elif dob_matches and reversed_matches:
+        return True
+    elif lastname_matches and not (firstname_exists and dob_exists):
+        return True
+    elif dob_matches:
+        ...
+    return False
+
+
+class CaseNameIndex:
+    """Cases by last name and birthdate to look up candidates for match_patient_name.
+
+    Every matching rule requires equal last names or equal birthdates, so the
+    cases found in both indexes are all cases that can match.
+    """
+
+    def __init__(self, cases: Dict[int, dict]):
+        self.cases = cases
+        self.positions = {}
+        self.by_lastname = defaultdict(set)
+        self.by_dob = defaultdict(set)
+        for entry_id in cases:
+            self.add(entry_id)
+
+    def add(self, entry_id: int):
+        """Index a case, again after its names or birthdate were filled."""
+        self.positions.setdefault(entry_id, len(self.positions))
+        info = create_name_info_baserow_data(self.cases[entry_id])
+        if info.lastname not in (None, ""):
+            self.by_lastname[info.lastname].add(entry_id)
+        if info.dob is not None:
+            self.by_dob[info.dob].add(entry_id)
+
+    def find(self, name_info: NameInfo) -> Optional[int]:
+        """Get the last matching case in table order, same as scanning all cases."""
+        candidates = set()
+        if name_info.lastname not in (None, ""):
+            candidates |= self.by_lastname.get(name_info.lastname, set())
+        if name_info.dob is not None:
+            candidates |= self.by_dob.get(name_info.dob, set())
+        matches = [
+            entry_id for entry_id in candidates
+            if match_patient_name(name_info, create_name_info_baserow_data(self.cases[entry_id]))
+        ]
+        return max(matches, key=self.positions.__getitem__, default=None)
+
+
+def get_responsible_physician(active_doctors, app):
+    for doctor in active_doctors:
+        doctor_id = f"D{doctor['Kennummer']}"
+        if doctor_id in app.resources:
+            return doctor
+
+    # match by color if we can't find the person id, this might happen if users
+    # manually set the color to match the person
+    app_color = app.raw["Farb_Id"]
+    for doctor in active_doctors:
+        if doctor["Farb_Id"] == app_color:
+            return doctor
+
+    return None
+
+
+def get_baserow_physician_id(doctor, baserow_physicians):
+    for person_id, person_data in baserow_physicians.items():
+        if doctor["Name"].endswith(person_data["Lastname"]):
+            return person_id
+    return None
+
+
+def get_empty_rows(existing_case_data):
+    empty_row_ids = []
+    empty_criteria = ["Firstname", "Lastname", "Birthdate"]
+
+    for row_id, row_data in existing_case_data.items():
+        if all(row_data[c] is None or row_data[c] == "" for c in empty_criteria):
+            empty_row_ids.append(row_id)
+    return empty_row_ids
+
+
+def update_entry(app, matched_entry_id, existing_data, active_doctors, personnel_data):
+    """Fill empty fields of a case from an appointment, returns a report line if any changed."""
+    doctor = get_responsible_physician(active_doctors, app)
+    if doctor is not None:
+        matched_doctor_id = get_baserow_physician_id(doctor, personnel_data)
+    else:
+        matched_doctor_id = None
+
+    name_info = extract_patient_name(app.name)
+    fmt_date = app.date_begin.date().isoformat()
+
+    updated_fields = []
+    if existing_data["Firstname"] in (None, ""):
+        if name_info.firstname is not None:
+            existing_data["Firstname"] = name_info.firstname
+            updated_fields.append("Firstname")
+    if existing_data["Lastname"] in (None, ""):
+        if name_info.lastname is not None:
+            existing_data["Lastname"] = name_info.lastname
+            updated_fields.append("Lastname")
+    if existing_data["Birthdate"] in (None, ""):
+        if name_info.dob is not None:
+            existing_data["Birthdate"] = name_info.dob.isoformat()
+            updated_fields.append("Birthdate")
+    if not existing_data["Clinician"]:
+        if matched_doctor_id is not None:
+            existing_data["Clinician"] = [matched_doctor_id]
+            updated_fields.append("Clinician")
+    if existing_data["Datum Einschluss"] in (None, ""):
+        if app.date_begin is not None:
+            existing_data["Datum Einschluss"] = fmt_date
+            updated_fields.append("Datum Einschluss")
+
+    if not updated_fields:
+        return None
+
+    return f"{matched_entry_id}: {existing_data['Firstname']} {existing_data['Lastname']} {existing_data['Birthdate']} - Termin {fmt_date}: {updated_fields=}"
+
+
+def create_entry(app, active_doctors, personnel_data):
+    """Get the data of a new case for an appointment."""
+    doctor = get_responsible_physician(active_doctors, app)
+    if doctor is not None:
+        matched_doctor_id = get_baserow_physician_id(doctor, personnel_data)
+    else:
+        matched_doctor_id = None
+    name_info = extract_patient_name(app.name)
+
+    if name_info.dob:
+        dob = name_info.dob.isoformat()
+    else:
+        dob = None
+
+    fmt_date = app.date_begin.date().isoformat()
+
+    return {
+        "Firstname": name_info.firstname,
+        "Lastname": name_info.lastname,
+        "Birthdate": dob,
+        "Clinician": [matched_doctor_id],
+        "Datum Einschluss": fmt_date,
+    }
+
+
+def created_entry_line(entry_id, new_data):
+    return f"{entry_id}: {new_data['Firstname']} {new_data['Lastname']} {new_data['Birthdate']} - Termin {new_data['Datum Einschluss']}"
+
+
+def load_doctors(db_path: str):
+    doctors = queryMdb(db_path, "DocRooms")
+
+    active_doctors = [d for d in doctors if not d['hidden'] and d['Type'] == 0]
+
+    if not active_doctors:
+        raise RuntimeError("Database empty")
+    return active_doctors
+
+
+def iter_recent_appointments(db_path: str) -> Iterator[Appointment]:
+    """Get CADS appointments of the last 30 days, older rows are skipped undecoded."""
+    today = datetime.date.today()
+    first = max(FIRST_APPOINTMENT_DATE, today - RECENT_TIMESPAN)
+    for data in iter_mdb(db_path, "Termine", lambda line: begins_between(line, first, today)):
+        app = Appointment.from_raw_json(data)
+        if app and app.date_begin and app.date_begin.year >= FIRST_APPOINTMENT_DATE.year:
+            if is_cads_appointment(app) and is_recent_appointment(app):
+                yield app
+
+
+def load_appointments(db_path: str):
+    """Get active doctors and CADS appointments of the last 30 days."""
+    return load_doctors(db_path), list(iter_recent_appointments(db_path))
+
+
+def sync_appointments(db_path: str = DB_PATH, state_path: Optional[Path] = None) -> List[str]:
+    """Create or complete cases for recent CADS appointments.
+
+    Appointments synced before are skipped using the state saved to
+    state_path, by default appointments.state_file of the settings. Nothing
+    is read if the MDB file did not change since the last run of the day.
+
+    Returns report lines of all created and updated cases.
+    """
+    state_path = state_path or get_state_path()
+    state = AppointmentState.load(state_path) if state_path else AppointmentState()
+    today = datetime.date.today()
+    stat = os.stat(db_path)
+    if state_path and state.is_current(stat, today):
+        return []
+
+    hsa_appointments = [
+        app for app in iter_recent_appointments(db_path)
+        if app.identifier is None or app.identifier not in state.processed
+    ]
+    if hsa_appointments:
+        report = sync_new_appointments(db_path, hsa_appointments, state)
+    else:
+        report = []
+
+    if state_path:
+        state.update(stat, today)
+        state.save(state_path)
+    return report
+
+
+def sync_new_appointments(db_path: str, hsa_appointments: List[Appointment], state: AppointmentState) -> List[str]:
+    """Create or complete cases for the given appointments and add them to the state.
+
+    All created and updated cases are written in a single batch.
+    """
+    active_doctors = load_doctors(db_path)
+
+    br = get_client()
+    existing_case_data = get_table("Cases", include=CASE_FIELDS)
+    personnel_data = get_table("Personnel", include=["Lastname"])
+
+    empty_row_ids = get_empty_rows(existing_case_data)
+    case_index = CaseNameIndex(existing_case_data)
+
+    updated_ids = []
+    created = []
+    # report lines or the position of a created case, its id is only known after writing
+    new_entry_lines = []
+    updated_entry_lines = []
+    for app in hsa_appointments:
+        name_info = extract_patient_name(app.name)
+        matched_entry_id = case_index.find(name_info)
+        if matched_entry_id or empty_row_ids:
+            if matched_entry_id:
+                lines = updated_entry_lines
+            else:
+                matched_entry_id = empty_row_ids.pop(0)
+                lines = new_entry_lines
+            l = update_entry(app, matched_entry_id, existing_case_data[matched_entry_id], active_doctors, personnel_data)
+            if l is not None:
+                lines.append(l)
+                if matched_entry_id not in updated_ids:
+                    updated_ids.append(matched_entry_id)
+                case_index.add(matched_entry_id)
+        else:
+            created.append(create_entry(app, active_doctors, personnel_data))
+            new_entry_lines.append(len(created) - 1)
+        if app.identifier is not None:
+            state.processed[app.identifier] = app.date_begin.date().isoformat()
+
+    entries = [{**to_plain(existing_case_data[entry_id]), "id": entry_id} for entry_id in updated_ids] + created
+    if entries:
+        row_ids = br.add_data_batch(CASE_TABLE_ID, entries)
+        created_ids = row_ids[len(updated_ids):]
+        new_entry_lines = [
+            created_entry_line(created_ids[l], created[l]) if isinstance(l, int) else l
+            for l in new_entry_lines
+        ]
+
+    new_entries = len(new_entry_lines)
+    updated_entries = len(updated_entry_lines)
+    report = []
+    if new_entry_lines or updated_entries:
+        report.append(f"Terminland Baserow Sync: {new_entries=} {updated_entries=}")
+    if len(new_entry_lines):
+        report.append("Created new entries:")
+        report += new_entry_lines
+
+    if len(updated_entry_lines):
+        report.append("Updated entries:")
+        report += updated_entry_lines
+    return report
@@ -0,0 +1,221 @@
+"""Deduplicated table backups in a content addressed store.
+
+Rows of every table are split into chunks by row id, so that a change to a
+row only changes the chunk holding it. Chunks are stored by the hash of their
+content and only written if no earlier backup contains them. Each backup is a
+small manifest listing the chunks of all tables:
+
+<directory>/store.json            salt and password check of an encrypted store
+<directory>/manifests/<id>.json   tables with their columns and chunk hashes
+<directory>/chunks/ab/abcd...     gzipped JSON list of [row id, row] pairs
+
+Chunks are AES-GCM encrypted if the store is created with a password, their
+names are then keyed hashes. Removing manifests by the retention settings and
+collecting unreferenced chunks keeps history at the cost of the changed rows.
+"""
+import datetime
+import gzip
+import hashlib
+import hmac
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from attrs import define, field
+from loguru import logger
+
+from .records import to_plain
+
+STORE_VERSION = 1
+CHUNK_ROWS = 500
+MANIFEST_SUFFIX = ".json"
+
+
+class BackupNotFoundError(Exception):
+    pass
+
+
+class InvalidPasswordError(Exception):
+    pass
+
+
+def write_atomic(path: Path, data: bytes):
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
+
+
+def chunk_rows(rows: Mapping[int, Mapping], chunk_rows: int = CHUNK_ROWS) -> List[List[Tuple[int, dict]]]:
+    """Split rows into chunks of fixed row id ranges, sorted by row id."""
+    chunks = {}
+    for row_id in sorted(rows):
+        chunks.setdefault(row_id // chunk_rows, []).append((row_id, to_plain(rows[row_id])))
+    return [chunks[k] for k in sorted(chunks)]
+
+
+@define
+class TableBackup:
+    columns: List[str]
+    chunks: List[str]
+    rows: int
+
+
+@define
+class Manifest:
+    id: str
+    created: str
+    tables: Dict[str, TableBackup]
+
+    @property
+    def chunks(self) -> Set[str]:
+        return {h for table in self.tables.values() for h in table.chunks}
+
+    def to_json(self) -> bytes:
+        tables = {name: {"columns": t.columns, "chunks": t.chunks, "rows": t.rows} for name, t in self.tables.items()}
+        return json.dumps({"backup": STORE_VERSION, "id": self.id, "created": self.created, "tables": tables}, indent=1).encode()
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "Manifest":
+        data = json.loads(data)
+        tables = {name: TableBackup(**t) for name, t in data["tables"].items()}
+        return cls(data["id"], data["created"], tables)
+
+
+@define
+class BackupStore:
+    directory: Path
+    password: Optional[bytes] = None
+    _key: Optional[bytes] = field(default=None, init=False)
+
+    def __attrs_post_init__(self):
+        (self.directory / "manifests").mkdir(parents=True, exist_ok=True)
+        (self.directory / "chunks").mkdir(exist_ok=True)
+        config_path = self.directory / "store.json"
+        if not config_path.exists():
+            config = {"store": STORE_VERSION, "salt": None, "check": None}
+            if self.password:
+                config["salt"] = os.urandom(16).hex()
+                config["check"] = self._derive_key(bytes.fromhex(config["salt"])).hex()
+            write_atomic(config_path, json.dumps(config).encode())
+            return
+
+        config = json.loads(config_path.read_text())
+        if config["salt"] is None:
+            if self.password:
+                raise InvalidPasswordError(f"{self.directory} is not encrypted")
+        elif not self.password:
+            raise InvalidPasswordError(f"{self.directory} is encrypted, a password is needed")
+        elif not hmac.compare_digest(self._derive_key(bytes.fromhex(config["salt"])), bytes.fromhex(config["check"])):
+            raise InvalidPasswordError(f"Wrong password for {self.directory}")
+
+    def _derive_key(self, salt: bytes) -> bytes:
+        """Derive the key from the password, returns a check value to detect wrong passwords."""
+        from Cryptodome.Protocol.KDF import scrypt
+
+        self._key = scrypt(self.password, salt, 32, N=2**15, r=8, p=1)
+        return hmac.new(self._key, b"backup store", hashlib.sha256).digest()
+
+    def chunk_path(self, chunk_hash: str) -> Path:
+        return self.directory / "chunks" / chunk_hash[:2] / chunk_hash
+
+    def manifest_path(self, backup_id: str) -> Path:
+        return self.directory / "manifests" / f"{backup_id}{MANIFEST_SUFFIX}"
+
+    def put_chunk(self, rows: List[Tuple[int, dict]]) -> Tuple[str, bool]:
+        """Store a chunk unless it exists, returns its hash and whether it was written."""
+        data = json.dumps(rows, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode()
+        if self._key:
+            chunk_hash = hmac.new(self._key, data, hashlib.sha256).hexdigest()
+        else:
+            chunk_hash = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(chunk_hash)
+        if path.exists():
+            return chunk_hash, False
+        path.parent.mkdir(exist_ok=True)
+        data = gzip.compress(data, mtime=0)
+        if self._key:
+            from Cryptodome.Cipher import AES
+
+            cipher = AES.new(self._key, AES.MODE_GCM)
+            ciphertext, tag = cipher.encrypt_and_digest(data)
+            data = cipher.nonce + tag + ciphertext
+        write_atomic(path, data)
+        return chunk_hash, True
+
+    def get_chunk(self, chunk_hash: str) -> List[Tuple[int, dict]]:
+        data = self.chunk_path(chunk_hash).read_bytes()
+        if self._key:
+            from Cryptodome.Cipher import AES
+
+            cipher = AES.new(self._key, AES.MODE_GCM, nonce=data[:16])
+            data = cipher.decrypt_and_verify(data[32:], data[16:32])
+        return json.loads(gzip.decompress(data))
+
+    def write_backup(self, tables: Iterable[Tuple[str, List[str], Mapping[int, Mapping]]], chunk_size: int = CHUNK_ROWS) -> Manifest:
+        """Store tables given as name, columns and rows and write their manifest."""
+        now = datetime.datetime.now()
+        backup_id = now.strftime("%Y-%m-%d_%H-%M-%S")
+        if self.manifest_path(backup_id).exists():
+            backup_id += now.strftime("-%f")
+        manifest = Manifest(backup_id, now.isoformat(), {})
+        written = reused = 0
+        for name, columns, rows in tables:
+            hashes = []
+            for chunk in chunk_rows(rows, chunk_size):
+                chunk_hash, is_new = self.put_chunk(chunk)
+                hashes.append(chunk_hash)
+                written += is_new
+                reused += not is_new
+            manifest.tables[name] = TableBackup(list(columns), hashes, len(rows))
+        # chunks are written first, so that a manifest never references missing chunks
+        write_atomic(self.manifest_path(manifest.id), manifest.to_json())
+        logger.info("Wrote backup {id}, {written} new and {reused} unchanged chunks", id=manifest.id, written=written, reused=reused)
+        return manifest
+
+    def backup_ids(self) -> List[str]:
+        return sorted(p.name[:-len(MANIFEST_SUFFIX)] for p in (self.directory / "manifests").glob(f"*{MANIFEST_SUFFIX}"))
+
+    def manifest(self, backup_id: str) -> Manifest:
+        if backup_id == "latest":
+            if not (backup_ids := self.backup_ids()):
+                raise BackupNotFoundError(f"No backups in {self.directory}")
+            backup_id = backup_ids[-1]
+        path = self.manifest_path(backup_id)
+        if not path.exists():
+            raise BackupNotFoundError(f"No backup {backup_id} in {self.directory}")
+        return Manifest.from_json(path.read_bytes())
+
+    def read_table(self, manifest: Manifest, name: str) -> Dict[int, dict]:
+        """Rebuild all rows of a table in a backup."""
+        return {row_id: row for chunk_hash in manifest.tables[name].chunks for row_id, row in self.get_chunk(chunk_hash)}
+
+    def prune(self, keep_days: int, keep_months: int, today: Optional[datetime.date] = None) -> List[str]:
+        """Remove manifests except all of the last keep_days days and the last of each of the last keep_months months."""
+        today = today or datetime.date.today()
+        keep = set()
+        last_of_month = {}
+        for backup_id in self.backup_ids():
+            day = datetime.date.fromisoformat(backup_id[:10])
+            if (today - day).days < keep_days:
+                keep.add(backup_id)
+            last_of_month[(day.year, day.month)] = backup_id
+        for month in sorted(last_of_month)[-keep_months:] if keep_months else []:
+            keep.add(last_of_month[month])
+
+        removed = [backup_id for backup_id in self.backup_ids() if backup_id not in keep]
+        for backup_id in removed:
+            self.manifest_path(backup_id).unlink()
+        return removed
+
+    def collect_garbage(self) -> int:
+        """Remove chunks not referenced by any manifest, returns the number of removed chunks."""
+        referenced = set()
+        for backup_id in self.backup_ids():
+            referenced |= self.manifest(backup_id).chunks
+        removed = 0
+        for path in (self.directory / "chunks").glob("*/*"):
+            if path.name not in referenced:
+                path.unlink()
+                removed += 1
+        return removed
@@ -1,12 +1,16 @@
 import re
 from collections import defaultdict
 from functools import reduce
-from typing import Dict, List, Optional, Tuple
+import functools
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
 from .config import settings
-from python_baserow_simple import BaserowApi
+from .records import to_plain
 from attrs import define, field
 from loguru import logger
 
+if TYPE_CHECKING:
+    from .baserow_client import BaserowClient
+
 COLUMN_CLINVAR_STATUS = "ClinVar-Upload Status"
 COLUMN_CLINVAR_REASON = "ClinVar-Upload Begründung"
 REASON_AUTOVALIDATION = "AutoValidation Fehler"
@@ -61,7 +65,78 @@ def matchLbId(lbid_left: str, lbid_right: str) -> bool:
     return normalized_left == normalized_right
 
 
-BR = BaserowApi(database_url=settings.baserow.url, token=settings.baserow_token)
+# (field name, filter type, value) as understood by the baserow list rows API,
+# eg ("Case Status", "single_select_is_any_of", ["Solved", "VUS"])
+Filter = Tuple[str, str, Any]
+
+SELECT_FILTER_TYPES = (
+    "single_select_equal",
+    "single_select_not_equal",
+    "single_select_is_any_of",
+    "single_select_is_none_of",
+)
+
+# maximum page size allowed by the list rows API
+PAGE_SIZE = 200
+# maximum number of rows allowed by the batch create and update APIs
+BATCH_SIZE = 200
+
+
+def join_field_names(names: List[str]) -> str:
+    """Field names for the include parameter of the list rows API with user_field_names.
+
+    Names containing commas or quotes are quoted, with quotes and backslashes
+    escaped by a backslash.
+    """
+    def quote(name):
+        if "," not in name and '"' not in name:
+            return name
+        return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+    return ",".join(quote(n) for n in names)
+
+
+def split_field_names(value: str) -> List[str]:
+    """Field names of an include parameter joined by join_field_names."""
+    names, current, quoted, escaped = [], [], False, False
+    for char in value:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == "\\" and quoted:
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == "," and not quoted:
+            names.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    names.append("".join(current))
+    return [n for n in names if n]
+
+
+@functools.cache
+def get_client() -> "BaserowClient":
+    """Baserow client for the configured database, created on first use."""
+    from .baserow_client import BaserowClient
+
+    return BaserowClient(database_url=settings.baserow.url, token=settings.baserow_token)
+
+
+def __getattr__(name: str):
+    # BR and BaserowClient import python_baserow_simple and requests, only do so when used
+    if name == "BR":
+        return get_client()
+    if name == "BaserowClient":
+        from .baserow_client import BaserowClient
+        return BaserowClient
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# called with table name and updates before every write, eg to
+# recognize webhooks caused by our own writes
+WRITE_LISTENERS: List[Callable[[str, List["BaserowUpdate"]], None]] = []
 
 
 class TableNotFoundError(Exception):
@@ -77,6 +152,8 @@ class BaserowUpdate:
     id: int
     entry: dict
     updates: Dict[str, str] = field(factory=dict)
+    # pipeline stage creating the update
+    stage: Optional[str] = None
 
     @classmethod
     def init_automerge(cls, entry_id, entry, new_data):
@@ -107,13 +184,9 @@ class BaserowUpdate:
         self.updates[key] = value
 
     def result_entry(self):
-        result = {}
-        for key, value in self.entry.items():
-            update_value = self.updates.get(key, value)
-            result[key] = update_value
-        for key, value in self.updates.items():
-            if key not in result:
-                result[key] = value
+        # keeps records compact instead of converting them to dicts
+        result = self.entry.copy()
+        result.update(self.updates)
         if "id" not in result:
             result["id"] = self.id
         return result
@@ -136,7 +209,10 @@ def merge_updates(baserow_updates: List[BaserowUpdate]) -> List[BaserowUpdate]:
 
     all_updates = []
     for updates in baserow_updates_by_id.values():
-        merged_update = reduce(lambda a, b: a.add_updates(b.updates), updates)
+        first = updates[0]
+        # merge into a new update to keep the merged updates unchanged
+        merged_update = BaserowUpdate(first.id, first.entry, dict(first.updates), first.stage)
+        merged_update = reduce(lambda a, b: a.add_updates(b.updates), updates[1:], merged_update)
         all_updates.append(merged_update)
     all_updates += new_updates
     return all_updates
@@ -190,15 +266,13 @@ def apply_updates(target_table_name: str, baserow_updates: List[BaserowUpdate],
     update_entries = []
     for update in merged_updates:
         if update.has_updates:
-            result_entry = update.result_entry()
-            update_entries.append(result_entry)
+            update_entries.append(to_plain(update.result_entry()))
 
     if not dry_run:
-        errors = BR.add_data_batch(table_id, update_entries)
-        if errors:
-            logger.error("Update table {} failed with message: {}, failed to update {} entries", table_id, errors, len(update_entries))
-        else:
-            logger.info("Updating table {} {}", table_id, target_table_name)
+        for listener in WRITE_LISTENERS:
+            listener(target_table_name, [u for u in merged_updates if u.has_updates])
+        get_client().add_data_batch(table_id, update_entries)
+        logger.info("Updating table {} {}", table_id, target_table_name)
     else:
         logger.warning(f"DRY RUN. DATA NOT UPLOADED.")
 
@@ -209,20 +283,44 @@ def get_baserow_table(tables, name):
             return table["data"]
 
 
-def get_table(table_name):
-    table_configs = settings.baserow.tables
-    for table_config in table_configs:
+def get_table_config(table_name):
+    for table_config in settings.baserow.tables:
         if table_name == table_config.name:
-            return BR.get_data(table_config.id)
-    else:
-        raise RuntimeError(f"Could not find a table with name {table_name} in configuration")
+            return table_config
+    raise RuntimeError(f"Could not find a table with name {table_name} in configuration")
 
 
-def get_data():
+def get_table(table_name, include: Optional[List[str]] = None, filters: Optional[List[Filter]] = None, filter_type: str = "AND"):
+    """Get rows of a configured table.
+
+    include and filters are passed to the list rows API, so that only the
+    matching rows and requested fields are transferred.
+    """
+    table_config = get_table_config(table_name)
+    return get_client().get_data(table_config.id, include=include, filters=filters, filter_type=filter_type)
+
+
+def get_data(
+    table_names: Optional[Iterable[str]] = None,
+    includes: Optional[Dict[str, List[str]]] = None,
+    filters: Optional[Dict[str, List[Filter]]] = None,
+):
+    """Get all configured tables, or only the tables in table_names.
+
+    includes and filters optionally restrict single tables by table name.
+    """
+    includes = includes or {}
+    filters = filters or {}
     table_configs = settings.baserow.tables
+    if table_names is not None:
+        table_configs = [t for t in table_configs if t.name in set(table_names)]
     all_data = []
     for table_config in table_configs:
-        data = BR.get_data(table_config.id)
+        data = get_client().get_data(
+            table_config.id,
+            include=includes.get(table_config.name),
+            filters=filters.get(table_config.name),
+        )
         all_data.append({
             "id": table_config.id,
             "name": table_config.name,
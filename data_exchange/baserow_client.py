@@ -0,0 +1,140 @@
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+from python_baserow_simple import BaserowApi, format_value
+
+from .baserow import BATCH_SIZE, PAGE_SIZE, SELECT_FILTER_TYPES, Filter, join_field_names
+from .records import Row, schema_row_class, share_value
+from .sessions import create_session
+
+
+class BaserowClient(BaserowApi):
+    """Baserow API with field projection and filtering pushed to the server.
+
+    Rows are returned as records generated from the table fields. All
+    requests go through one session, which times out after the http.timeout
+    setting and is rate limited per host.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session = create_session()
+        self._session.headers["Authorization"] = f"Token {self._token}"
+
+    def _get_fields(self, table_id):
+        resp = self._session.get(f"{self._database_url}/{self.fields_path}/{table_id}/")
+        resp.raise_for_status()
+        return resp.json()
+
+    def _get_pages(self, url: str) -> List[dict]:
+        results = []
+        while url:
+            resp = self._session.get(url)
+            resp.raise_for_status()
+            data = resp.json()
+            if "results" not in data:
+                raise RuntimeError(f"Could not get data from {url}")
+            results += data["results"]
+            url = data["next"]
+        return results
+
+    def _filter_params(self, fields_by_name: Dict[str, dict], filters: List[Filter], filter_type: str) -> Dict[str, str]:
+        def resolve_option(field_info, value):
+            for option in field_info.get("select_options", []):
+                if option["value"] == value:
+                    return option["id"]
+            raise RuntimeError(f"Could not find option {value} for field {field_info['name']}")
+
+        params = {"filter_type": filter_type}
+        for field_name, filter_name, value in filters:
+            if field_name not in fields_by_name:
+                raise RuntimeError(f"Could not find field {field_name} to filter on")
+            field_info = fields_by_name[field_name]
+            values = value if isinstance(value, (list, tuple)) else [value]
+            if filter_name in SELECT_FILTER_TYPES:
+                values = [resolve_option(field_info, v) if isinstance(v, str) else v for v in values]
+            params[f"filter__field_{field_info['id']}__{filter_name}"] = ",".join(str(v) for v in values)
+        return params
+
+    def get_data(self, table_id, writable_only=True, include: Optional[List[str]] = None, filters: Optional[List[Filter]] = None, filter_type: str = "AND"):
+        """Get data in a table.
+
+        include - Only return the given fields.
+        filters - Only return rows matching the filters, combined by filter_type.
+        """
+        all_fields = self.get_fields(table_id)
+        fields_by_name = {f["name"]: f for f in all_fields}
+        fields = self.writable_fields(table_id) if writable_only else all_fields
+        if include is not None:
+            missing = set(include) - set(fields_by_name)
+            if missing:
+                raise RuntimeError(f"Could not find fields {', '.join(sorted(missing))} in table {table_id}")
+            fields = [f for f in fields if f["name"] in include]
+        names = {f["name"]: f for f in fields}
+
+        params = {"user_field_names": "true", "size": PAGE_SIZE}
+        if include is not None:
+            # with user_field_names the include parameter takes names, not field_<id>
+            params["include"] = join_field_names([f["name"] for f in fields])
+        if filters:
+            params.update(self._filter_params(fields_by_name, filters, filter_type))
+        get_data_url = f"{self._database_url}/{self.table_path}/{table_id}/?{urlencode(params)}"
+
+        row_class = schema_row_class(table_id, fields)
+        shared = {}
+        return {
+            d["id"]: row_class.from_dict({
+                k: share_value(format_value(v, names[k]), shared)
+                for k, v in d.items()
+                if k in names
+            })
+            for d in self._get_pages(get_data_url)
+        }
+
+    def get_row(self, table_id, row_id, writable_only=True) -> Optional[Row]:
+        """Get a single row of a table, None if the row does not exist."""
+        fields = self.writable_fields(table_id) if writable_only else self.get_fields(table_id)
+        names = {f["name"]: f for f in fields}
+        url = f"{self._database_url}/{self.table_path}/{table_id}/{row_id}/?user_field_names=true"
+        resp = self._session.get(url)
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        return schema_row_class(table_id, fields).from_dict({
+            k: format_value(v, names[k])
+            for k, v in resp.json().items()
+            if k in names
+        })
+
+    def _write_rows(self, method: str, table_id, datas) -> List[int]:
+        resp = self._session.request(
+            method,
+            f"{self._database_url}/{self.table_path}/{table_id}/batch/?user_field_names=true",
+            json={"items": datas},
+        )
+        resp.raise_for_status()
+        return [e["id"] for e in resp.json()["items"]]
+
+    def _create_rows(self, table_id, datas):
+        return self._write_rows("POST", table_id, datas)
+
+    def _update_rows(self, table_id, datas):
+        return self._write_rows("PATCH", table_id, datas)
+
+    def add_data_batch(self, table_id, entries) -> List[int]:
+        """Create rows without id and update all others in batches of BATCH_SIZE rows.
+
+        Returns the row id of every entry in the order of entries, including
+        the ids of created rows.
+        """
+        ids = [e.get("id") for e in entries]
+        new_positions = [i for i, row_id in enumerate(ids) if row_id is None]
+        update_entries = [e for e in entries if e.get("id") is not None]
+        for start in range(0, len(new_positions), BATCH_SIZE):
+            positions = new_positions[start:start + BATCH_SIZE]
+            created_ids = self._create_rows(table_id, [entries[i] for i in positions])
+            for i, row_id in zip(positions, created_ids):
+                ids[i] = row_id
+        for start in range(0, len(update_entries), BATCH_SIZE):
+            self._update_rows(table_id, update_entries[start:start + BATCH_SIZE])
+        return ids
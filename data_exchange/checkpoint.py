@@ -0,0 +1,133 @@
+"""Save the outputs of pipeline stages to resume failed runs.
+
+Every completed stage of a run writes its output to a checkpoint directory
+named by the run id. A resumed run loads the outputs of completed stages
+instead of running them again, eg to not fetch all source data again after
+an upload to Baserow failed.
+
+Stage outputs hold patient data, so checkpoints are only written to an
+explicitly given directory, readable by the owner only. Runs that were not
+resumed are removed after a number of days.
+"""
+import datetime
+import json
+import shutil
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from .recording import RECORDING_SUFFIX, load, save
+
+MANIFEST_NAME = "manifest.json"
+
+
+class CheckpointNotFoundError(Exception):
+    pass
+
+
+def new_run_id() -> str:
+    return datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+class Checkpoints:
+    """Stage outputs of a single run."""
+
+    def __init__(self, directory: Path, run_id: str, options: Dict[str, Any], completed: Optional[List[str]] = None):
+        self.directory = directory
+        self.run_id = run_id
+        self.options = options
+        self.completed = completed or []
+
+    @property
+    def run_dir(self) -> Path:
+        return self.directory / self.run_id
+
+    @classmethod
+    def create(cls, directory: Path, options: Dict[str, Any], run_id: Optional[str] = None) -> "Checkpoints":
+        checkpoints = cls(directory, run_id or new_run_id(), options)
+        checkpoints.run_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        checkpoints._write_manifest()
+        return checkpoints
+
+    @classmethod
+    def resume(cls, directory: Path, run_id: str) -> "Checkpoints":
+        path = directory / run_id / MANIFEST_NAME
+        if not path.exists():
+            raise CheckpointNotFoundError(f"No checkpoints of run {run_id} found in {directory}")
+        with path.open() as f:
+            manifest = json.load(f)
+        return cls(directory, run_id, manifest["options"], manifest["completed"])
+
+    def _write_manifest(self):
+        manifest = {
+            "run_id": self.run_id,
+            "updated": datetime.datetime.now().isoformat(),
+            "options": self.options,
+            "completed": self.completed,
+        }
+        tmp_path = self.run_dir / f"{MANIFEST_NAME}.tmp"
+        with tmp_path.open("w") as f:
+            json.dump(manifest, f)
+        tmp_path.replace(self.run_dir / MANIFEST_NAME)
+
+    def _path(self, name: str) -> Path:
+        return self.run_dir / f"{name}{RECORDING_SUFFIX}"
+
+    def stage(self, name: str, func: Callable[[], Any]) -> Any:
+        """Get the output of a completed stage or run the stage and save its output."""
+        if name in self.completed:
+            logger.info("Loading stage {name} from checkpoint {run_id}", name=name, run_id=self.run_id)
+            return load(self._path(name))
+        result = func()
+        save(self._path(name), result)
+        self.completed.append(name)
+        self._write_manifest()
+        return result
+
+    def remove(self):
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+
+def run_updated(run_dir: Path) -> datetime.datetime:
+    try:
+        with (run_dir / MANIFEST_NAME).open() as f:
+            return datetime.datetime.fromisoformat(json.load(f)["updated"])
+    except (OSError, ValueError, KeyError):
+        return datetime.datetime.fromtimestamp(run_dir.stat().st_mtime)
+
+
+def prune(directory: Path, keep_days: int, now: Optional[datetime.datetime] = None) -> List[str]:
+    """Remove checkpoints of runs last updated more than keep_days ago, returns their run ids."""
+    if not directory.is_dir():
+        return []
+    cutoff = (now or datetime.datetime.now()) - datetime.timedelta(days=keep_days)
+    removed = []
+    for run_dir in sorted(directory.iterdir()):
+        if run_dir.is_dir() and run_updated(run_dir) < cutoff:
+            shutil.rmtree(run_dir, ignore_errors=True)
+            removed.append(run_dir.name)
+    if removed:
+        logger.info("Removed checkpoints of runs {run_ids}", run_ids=removed)
+    return removed
+
+
+_CHECKPOINTS: Optional[Checkpoints] = None
+
+
+def enable(checkpoints: Checkpoints) -> Checkpoints:
+    global _CHECKPOINTS
+    _CHECKPOINTS = checkpoints
+    return checkpoints
+
+
+def disable():
+    global _CHECKPOINTS
+    _CHECKPOINTS = None
+
+
+def checkpoint_stage(name: str, func: Callable[[], Any]) -> Any:
+    """Run a pipeline stage, reusing its checkpointed output if checkpoints are enabled."""
+    if _CHECKPOINTS is None:
+        return func()
+    return _CHECKPOINTS.stage(name, func)
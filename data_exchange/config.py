@@ -1,7 +1,19 @@
 
-from dynaconf import Dynaconf
+class LazySettings:
+    """Dynaconf settings, only imported and loaded on first access."""
 
-settings = Dynaconf(
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._settings = None
+
+    def __getattr__(self, name):
+        if self._settings is None:
+            from dynaconf import Dynaconf
+            self._settings = Dynaconf(**self._kwargs)
+        return getattr(self._settings, name)
+
+
+settings = LazySettings(
     envvar_prefix="DYNACONF",
     settings_files=['settings.toml', '.secrets.toml'],
 )
@@ -0,0 +1,375 @@
+"""Long running sync daemon.
+
+Runs the full sync and the appointment sync on fixed intervals in a single
+process. Logged in clients, source data snapshots and annotation caches are
+kept between runs and a local HTTP endpoint reports health and metrics.
+"""
+import copy
+import json
+import math
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from attrs import define, field
+from loguru import logger
+
+from . import BASEROW, CASE_TABLE_NAME, FINDINGS_TABLE_NAME, PATIENTS_TABLE_NAME, run
+from .config import settings
+from .report import write_validation_report
+from .resilience import reset_clients
+
+if TYPE_CHECKING:
+    from .resilience import DegradationReport
+    from .webhook import DebouncedQueue
+
+
+@define
+class CachedSource:
+    """Source getter keeping its results in memory for ttl seconds.
+
+    Getters called with a list of ids and returning results by id are cached
+    per id, so that only missing or expired ids are fetched.
+    """
+    getter: Callable
+    ttl: float
+    hits: int = 0
+    misses: int = 0
+    _data: dict = field(factory=dict)
+
+    def _valid(self, key) -> bool:
+        return key in self._data and time.monotonic() - self._data[key][0] < self.ttl
+
+    def __call__(self, *args):
+        if args:
+            ids = args[0]
+            missing = [i for i in ids if not self._valid(i)]
+            self.hits += len(ids) - len(missing)
+            if missing:
+                self.misses += len(missing)
+                now = time.monotonic()
+                for key, value in self.getter(missing, *args[1:]).items():
+                    self._data[key] = (now, value)
+            return {i: self._data[i][1] for i in ids if i in self._data}
+
+        if self._valid(None):
+            self.hits += 1
+        else:
+            self.misses += 1
+            self._data[None] = (time.monotonic(), self.getter())
+        return self._data[None][1]
+
+    def clear(self):
+        self._data.clear()
+
+
+@define
+class CachedTables:
+    """Baserow tables source keeping every table in memory for ttl seconds.
+
+    Tables written by a job are invalidated and fetched again on their own
+    by calling getter with their names, all other tables are reused until
+    they expire. Every call returns copies, as the pipeline changes rows in
+    place.
+    """
+    getter: Callable[..., List[dict]]
+    ttl: float
+    hits: int = 0
+    misses: int = 0
+    # tables as returned by getter and the time each table was fetched
+    _tables: List[dict] = field(factory=list)
+    _fetched: Dict[str, float] = field(factory=dict)
+
+    def _valid(self, name: str) -> bool:
+        return name in self._fetched and time.monotonic() - self._fetched[name] < self.ttl
+
+    def __call__(self) -> List[dict]:
+        stale = {t["name"] for t in self._tables if not self._valid(t["name"])}
+        if not self._tables or len(stale) == len(self._tables):
+            self._tables = self.getter()
+            self.misses += len(self._tables)
+            now = time.monotonic()
+            self._fetched = {t["name"]: now for t in self._tables}
+            return copy.deepcopy(self._tables)
+
+        self.hits += len(self._tables) - len(stale)
+        if stale:
+            self.misses += len(stale)
+            now = time.monotonic()
+            fetched = {t["name"]: t for t in self.getter(sorted(stale))}
+            self._tables = [fetched.get(t["name"], t) for t in self._tables]
+            self._fetched.update({name: now for name in fetched})
+        return copy.deepcopy(self._tables)
+
+    def invalidate(self, names: Iterable[str]):
+        for name in names:
+            self._fetched.pop(name, None)
+
+    def clear(self):
+        self._tables = []
+        self._fetched.clear()
+
+
+@define
+class Job:
+    name: str
+    interval: float
+    func: Callable[..., None]
+    # baserow tables the job writes to, invalidated in the baserow snapshot after every run
+    writes: Tuple[str, ...] = ()
+    next_run: float = 0.0
+    runs: int = 0
+    failures: int = 0
+    running: bool = False
+    last_start: Optional[float] = None
+    last_duration: Optional[float] = None
+    last_success: Optional[float] = None
+    last_error: Optional[str] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.last_error is None
+
+    def status(self) -> dict:
+        return {
+            "interval": self.interval if math.isfinite(self.interval) else None,
+            "runs": self.runs,
+            "failures": self.failures,
+            "running": self.running,
+            "last_start": self.last_start,
+            "last_duration": self.last_duration,
+            "last_success": self.last_success,
+            "last_error": self.last_error,
+        }
+
+
+class SyncDaemon:
+    """Run jobs on their interval, one at a time."""
+
+    def __init__(self, jobs: List[Job], sources: Dict[str, CachedSource], session_max_age: float = 0, degradation: Optional["DegradationReport"] = None):
+        self.jobs = jobs
+        self.sources = sources
+        self.session_max_age = session_max_age
+        self.degradation = degradation
+        self.started = time.time()
+        self._sessions_created = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def run_job(self, job: Job, *args):
+        """Run a job, waiting for any other running job to finish first."""
+        with self._lock:
+            if self.session_max_age and time.monotonic() - self._sessions_created > self.session_max_age:
+                logger.info("Renewing client sessions")
+                reset_clients()
+                self._sessions_created = time.monotonic()
+
+            logger.info("Starting {name}", name=job.name)
+            job.running = True
+            job.last_start = time.time()
+            start = time.monotonic()
+            try:
+                job.func(*args)
+                job.last_success = time.time()
+                job.last_error = None
+            except Exception as err:
+                logger.exception("{name} failed", name=job.name)
+                job.failures += 1
+                job.last_error = f"{type(err).__name__}: {err}"
+                # sessions might have expired, log in again on the next run
+                reset_clients()
+                self._sessions_created = time.monotonic()
+            finally:
+                job.running = False
+                job.runs += 1
+                job.last_duration = time.monotonic() - start
+                job.next_run = start + job.interval
+                if job.writes and isinstance(self.sources.get(BASEROW), CachedTables):
+                    self.sources[BASEROW].invalidate(job.writes)
+            logger.info("Finished {name} in {duration:.1f}s", name=job.name, duration=job.last_duration)
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            due = [job for job in self.jobs if job.next_run <= now]
+            for job in due:
+                if self._stop.is_set():
+                    break
+                self.run_job(job)
+            if not due:
+                next_run = min(job.next_run for job in self.jobs)
+                self._stop.wait(max(next_run - now, 0))
+
+    def stop(self):
+        self._stop.set()
+
+    def health(self) -> dict:
+        return {
+            "status": "ok" if all(job.healthy for job in self.jobs) else "failing",
+            "uptime": time.time() - self.started,
+            "jobs": {job.name: job.status() for job in self.jobs},
+            # sources of the last sync that failed and were replaced by their snapshot or skipped
+            "degraded": [
+                {"source": d.source, "reason": d.reason, "fallback": d.fallback}
+                for d in (self.degradation.degradations if self.degradation else [])
+            ],
+        }
+
+    def metrics(self) -> str:
+        lines = []
+
+        def metric(name: str, kind: str, values: Dict[str, Optional[float]], label: str):
+            lines.append(f"# TYPE data_exchange_{name} {kind}")
+            for key, value in values.items():
+                if value is not None:
+                    lines.append(f'data_exchange_{name}{{{label}="{key}"}} {value}')
+
+        jobs = {job.name: job for job in self.jobs}
+        metric("job_runs_total", "counter", {k: j.runs for k, j in jobs.items()}, "job")
+        metric("job_failures_total", "counter", {k: j.failures for k, j in jobs.items()}, "job")
+        metric("job_running", "gauge", {k: int(j.running) for k, j in jobs.items()}, "job")
+        metric("job_last_duration_seconds", "gauge", {k: j.last_duration for k, j in jobs.items()}, "job")
+        metric("job_last_success_timestamp_seconds", "gauge", {k: j.last_success for k, j in jobs.items()}, "job")
+        metric("source_cache_hits_total", "counter", {k: s.hits for k, s in self.sources.items()}, "source")
+        metric("source_cache_misses_total", "counter", {k: s.misses for k, s in self.sources.items()}, "source")
+        return "\n".join(lines) + "\n"
+
+
+def create_status_server(daemon: SyncDaemon, host: str, port: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/health":
+                health = daemon.health()
+                status = 200 if health["status"] == "ok" else 503
+                body, content_type = json.dumps(health).encode(), "application/json"
+            elif self.path == "/metrics":
+                status, body, content_type = 200, daemon.metrics().encode(), "text/plain; version=0.0.4"
+            else:
+                status, body, content_type = 404, b"Not found", "text/plain"
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.trace(format % args)
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    return httpd
+
+
+def cached_sources(sources: Dict[str, Callable], ttls: Dict[str, float]) -> Dict[str, CachedSource]:
+    cached = {name: CachedSource(getter, float(ttls.get(name, 0))) for name, getter in sources.items()}
+    if BASEROW in sources:
+        cached[BASEROW] = CachedTables(sources[BASEROW], float(ttls.get(BASEROW, 0)))
+    return cached
+
+
+def create_jobs(
+    sources: Dict[str, Callable],
+    dry_run: bool,
+    get_sodar: bool,
+    get_varfish: bool,
+    get_sams: bool,
+    degradation: Optional["DegradationReport"] = None,
+) -> List[Job]:
+    def sync():
+        if degradation is not None:
+            degradation.clear()
+        plan = None
+        if plan_dir := settings.serve.get("plan_dir"):
+            Path(plan_dir).mkdir(parents=True, exist_ok=True)
+            plan = Path(plan_dir) / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl"
+        parquet = None
+        if parquet_dir := settings.serve.get("parquet_dir"):
+            parquet = Path(parquet_dir) / datetime.now().strftime("%Y%m%d-%H%M%S")
+        _, _, _, errors = run(dry_run=dry_run, get_sodar=get_sodar, get_varfish=get_varfish, get_sams=get_sams, sources=sources, plan=plan, parquet=parquet, workers=int(settings.serve.get("workers", 1)))
+        if degradation is not None and degradation.degradations:
+            logger.warning(degradation.to_text())
+        report_lines = []
+        # errors of sources that were skipped would be saved as resolved
+        degraded = degradation is not None and bool(degradation.degradations)
+        write_validation_report(errors, report_lines.append, save=not dry_run and not degraded, section="serve")
+        logger.info("\n".join(report_lines))
+
+    def appointments():
+        from .appointments import DB_PATH, sync_appointments
+
+        if report := sync_appointments(settings.serve.get("appointments_db") or DB_PATH):
+            logger.info("\n".join(report))
+
+    jobs = [Job("sync", float(settings.serve.sync_interval), sync, writes=() if dry_run else (CASE_TABLE_NAME, FINDINGS_TABLE_NAME, PATIENTS_TABLE_NAME))]
+    if settings.serve.appointments_interval:
+        if dry_run:
+            logger.warning("Appointment sync can not run without uploading data, skipping it.")
+        else:
+            jobs.append(Job("appointments", float(settings.serve.appointments_interval), appointments, writes=(CASE_TABLE_NAME,)))
+    return jobs
+
+
+def start_webhook_receiver(daemon: SyncDaemon, dry_run: bool) -> Tuple["DebouncedQueue", ThreadingHTTPServer]:
+    """Sync rows touched by Baserow webhooks incrementally as a daemon job."""
+    from .baserow import WRITE_LISTENERS, get_table
+    from .incremental import sync_rows
+    from .webhook import DebouncedQueue, RecentWrites, WebhookReceiver, create_webhook_server
+
+    config = settings.webhook
+    lb_data = CachedSource(lambda: get_table("LB-Metadata"), float(config.table_ttl))
+    personnel_data = CachedSource(lambda: get_table("Personnel"), float(config.table_ttl))
+
+    def sync(rows: Dict[str, Set[int]]):
+        sync_rows(rows.get(CASE_TABLE_NAME, ()), rows.get(FINDINGS_TABLE_NAME, ()), dry_run, lb_data, personnel_data)
+
+    # only run when triggered by the queue
+    job = Job("webhook", math.inf, sync, writes=() if dry_run else (CASE_TABLE_NAME,), next_run=math.inf)
+    daemon.jobs.append(job)
+
+    recent_writes = RecentWrites(float(config.own_write_ttl))
+    WRITE_LISTENERS.append(recent_writes.record)
+    queue = DebouncedQueue(lambda rows: daemon.run_job(job, rows), float(config.debounce), float(config.max_delay)).start()
+    receiver = WebhookReceiver(queue, recent_writes, token=settings.get("webhook_token") or None)
+    httpd = create_webhook_server(receiver, config.host, config.port)
+    threading.Thread(target=httpd.serve_forever, name="webhook-server", daemon=True).start()
+    logger.info("Receiving webhooks on http://{host}:{port}/webhook", host=config.host, port=httpd.server_address[1])
+    return queue, httpd
+
+
+def serve(
+    sources: Dict[str, Callable],
+    dry_run: bool,
+    get_sodar: bool,
+    get_varfish: bool,
+    get_sams: bool,
+    host: str,
+    port: int,
+    webhook: bool = False,
+    degradation: Optional["DegradationReport"] = None,
+):
+    """Run syncs on their schedule until interrupted."""
+    snapshots = cached_sources(sources, settings.serve.get("snapshot_ttl", {}))
+    jobs = create_jobs(snapshots, dry_run, get_sodar, get_varfish, get_sams, degradation)
+    daemon = SyncDaemon(jobs, snapshots, session_max_age=float(settings.serve.get("session_max_age", 0)), degradation=degradation)
+
+    servers = [create_status_server(daemon, host, port)]
+    threading.Thread(target=servers[0].serve_forever, name="status-server", daemon=True).start()
+    logger.info("Serving health and metrics on http://{host}:{port}", host=host, port=servers[0].server_address[1])
+    queue = None
+    if webhook:
+        queue, webhook_httpd = start_webhook_receiver(daemon, dry_run)
+        servers.append(webhook_httpd)
+    try:
+        daemon.run_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping")
+    finally:
+        daemon.stop()
+        for httpd in servers:
+            httpd.shutdown()
+            httpd.server_close()
+        if queue is not None:
+            queue.stop()
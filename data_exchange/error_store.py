@@ -0,0 +1,126 @@
+"""Validation errors of the last run, to report only what changed.
+
+Errors are kept in a SQLite file keyed by case, rule, field and comment, as
+a case can have several errors of one rule in the same field, eg a finding
+missing both OMIM and HPO terms. Every run compares its errors to the stored
+ones and saves them, errors missing in the run are resolved and removed.
+"""
+import datetime
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from attrs import define, field
+
+from .validation import ValidationError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS errors (
+    case_id INTEGER NOT NULL,
+    rule TEXT NOT NULL,
+    field TEXT NOT NULL,
+    comment TEXT NOT NULL,
+    found TEXT,
+    expected TEXT,
+    responsible TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    PRIMARY KEY (case_id, rule, field, comment)
+) WITHOUT ROWID
+"""
+
+ErrorKey = Tuple[int, str, str, str]
+
+
+def error_key(error: ValidationError) -> ErrorKey:
+    return error.entry_id, error.source.name, error.field, error.comment
+
+
+def to_json(value) -> str:
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+@define
+class StoredError:
+    case_id: int
+    rule: str
+    field: str
+    comment: str
+    # shorthands of the responsible persons
+    responsible: List[str]
+    first_seen: str
+
+
+@define
+class ErrorDiff:
+    new: List[ValidationError] = field(factory=list)
+    resolved: List[StoredError] = field(factory=list)
+    unchanged: List[ValidationError] = field(factory=list)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.new or self.resolved)
+
+
+class ErrorStore:
+    def __init__(self, path: Path):
+        self.path = path
+        self._con = sqlite3.connect(path)
+        self._con.execute(SCHEMA)
+
+    def close(self):
+        self._con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stored(self) -> Dict[ErrorKey, StoredError]:
+        rows = self._con.execute("SELECT case_id, rule, field, comment, responsible, first_seen FROM errors")
+        return {
+            (case_id, rule, field_name, comment): StoredError(case_id, rule, field_name, comment, json.loads(responsible), first_seen)
+            for case_id, rule, field_name, comment, responsible, first_seen in rows
+        }
+
+    def update(self, errors: List[ValidationError], save: bool = True, now: Optional[datetime.datetime] = None) -> ErrorDiff:
+        """Compare errors of a run to the stored errors and store them unless save is False."""
+        now = (now or datetime.datetime.now()).isoformat(timespec="seconds")
+        stored = self.stored()
+        current = {error_key(e): e for e in errors}
+
+        diff = ErrorDiff()
+        for key, error in current.items():
+            (diff.unchanged if key in stored else diff.new).append(error)
+        diff.resolved = [e for key, e in stored.items() if key not in current]
+        if not save:
+            return diff
+
+        with self._con:
+            self._con.executemany(
+                "DELETE FROM errors WHERE case_id = ? AND rule = ? AND field = ? AND comment = ?",
+                [(e.case_id, e.rule, e.field, e.comment) for e in diff.resolved],
+            )
+            self._con.executemany(
+                """
+                INSERT INTO errors VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (case_id, rule, field, comment) DO UPDATE SET found = excluded.found, expected = excluded.expected,
+                    responsible = excluded.responsible, last_seen = excluded.last_seen
+                """,
+                [
+                    (*key, to_json(e.found), to_json(e.expected), to_json([r["Shorthand"] for r in e.responsible]), now, now)
+                    for key, e in current.items()
+                ],
+            )
+        return diff
+
+
+def get_store_path(section: str = "validation") -> Optional[Path]:
+    """Error store of the settings section, the sync daemon uses its own."""
+    from .config import settings
+
+    if store_file := settings.get(section, {}).get("error_store"):
+        return Path(store_file)
+    return None
@@ -0,0 +1,175 @@
+"""Export Baserow tables as spreadsheets into a single encrypted archive.
+
+All tables are fetched concurrently and every table is written into the
+archive as soon as it arrives, without temporary files. Spreadsheets are
+written row by row, so memory does not grow with the size of the sheet.
+"""
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from loguru import logger
+
+XLSX_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+XLSX_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+XLSX_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+XLSX_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+XLSX_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="1"><font/></fonts>
+<fills count="1"><fill/></fills>
+<borders count="1"><border/></borders>
+<cellStyleXfs count="1"><xf/></cellStyleXfs>
+<cellXfs count="1"><xf/></cellXfs>
+</styleSheet>"""
+
+SHEET_START = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>"""
+
+SHEET_END = "</sheetData></worksheet>"
+
+# characters not allowed in XML 1.0
+INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def column_name(index: int) -> str:
+    """Get the column letters of a zero based column index, eg 27 -> AB."""
+    name = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        name = chr(ord("A") + rest) + name
+    return name
+
+
+def xlsx_cell(ref: str, value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"><v>{value!r}</v></c>'
+    if not isinstance(value, str):
+        # links and multiple selects as written by pandas before, eg [1, 2]
+        value = str(list(value)) if hasattr(value, "__iter__") else str(value)
+    text = escape(INVALID_XML_CHARS.sub("", value))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+class XlsxWriter:
+    """Write a single sheet XLSX file row by row to a binary stream.
+
+    The stream does not need to be seekable, eg a member of another archive.
+    Strings are written inline instead of to a shared string table, so that
+    no row has to be kept in memory.
+    """
+
+    def __init__(self, stream: IO[bytes], sheet_name: str = "Sheet1"):
+        self._zip = zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED)
+        self._zip.writestr("[Content_Types].xml", XLSX_CONTENT_TYPES)
+        self._zip.writestr("_rels/.rels", XLSX_RELS)
+        self._zip.writestr("xl/workbook.xml", XLSX_WORKBOOK.format(name=escape(sheet_name[:31], {'"': "&quot;"})))
+        self._zip.writestr("xl/_rels/workbook.xml.rels", XLSX_WORKBOOK_RELS)
+        self._zip.writestr("xl/styles.xml", XLSX_STYLES)
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._sheet.write(SHEET_START.encode())
+        self.rows = 0
+
+    def write_row(self, values: Iterable[Any]):
+        self.rows += 1
+        cells = "".join(xlsx_cell(f"{column_name(i)}{self.rows}", v) for i, v in enumerate(values))
+        self._sheet.write(f'<row r="{self.rows}">{cells}</row>'.encode())
+
+    def close(self):
+        self._sheet.write(SHEET_END.encode())
+        self._sheet.close()
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_archive(path: Path, password: Optional[bytes]) -> zipfile.ZipFile:
+    """Open a new zip archive, AES encrypted with pyzipper if a password is given."""
+    if password is None:
+        return zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+    import pyzipper
+
+    archive = pyzipper.AESZipFile(path, "w", compression=pyzipper.ZIP_DEFLATED, encryption=pyzipper.WZ_AES)
+    archive.setpassword(password)
+    return archive
+
+
+def fetch_table(client, table_id: int) -> Tuple[List[str], dict]:
+    """Get the writable field names and rows of a table."""
+    rows = client.get_data(table_id)
+    return [f["name"] for f in client.writable_fields(table_id)], rows
+
+
+def fetch_tables(tables: List[Tuple[int, str]], workers: int = 4, client=None) -> Iterator[Tuple[str, List[str], dict]]:
+    """Fetch tables concurrently, yields the name, field names and rows of every table once it arrived."""
+    if client is None:
+        from .baserow import get_client
+
+        client = get_client()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch_table, client, table_id): name for table_id, name in tables}
+        for future in as_completed(futures):
+            columns, rows = future.result()
+            yield futures[future], columns, rows
+
+
+def write_xlsx_member(archive: zipfile.ZipFile, name: str, columns: List[str], rows: Dict[int, Mapping]) -> str:
+    """Write rows with their ids as <name>.xlsx to an archive, returns the member name."""
+    member = f"{name}.xlsx"
+    with archive.open(member, "w", force_zip64=True) as stream, XlsxWriter(stream, name) as sheet:
+        sheet.write_row(["BaserowID", *columns])
+        for row_id, row in rows.items():
+            sheet.write_row([row_id, *(row.get(c) for c in columns)])
+    return member
+
+
+def export_tables(path: Path, tables: List[Tuple[int, str]], password: Optional[bytes] = None, workers: int = 4, client=None) -> List[str]:
+    """Export tables to <name>.xlsx files in an archive at path.
+
+    Returns the names of the written archive members in the order they were written.
+    """
+    written = []
+    try:
+        with open_archive(path, password) as archive:
+            for name, columns, rows in fetch_tables(tables, workers, client):
+                written.append(write_xlsx_member(archive, name, columns, rows))
+                logger.info("Exported {count} rows of {name}", count=len(rows), name=name)
+    except BaseException:
+        # do not leave an incomplete backup behind
+        path.unlink(missing_ok=True)
+        raise
+    return written
@@ -0,0 +1,78 @@
+"""Update, validate and set the status of single cases.
+
+Only the given cases, findings linked to them and cases linked to the given
+findings are loaded, so that edits show up in AutoValidation without a full
+pipeline run. Updates from SODAR, VarFish and SAMS are left to the full run.
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from . import CASE_TABLE_NAME, FINDINGS_TABLE_NAME
+from .baserow import BaserowUpdate, apply_updates, get_client, get_table, get_table_config, merge_entries
+from .updates import update_baserow_from_lb, update_entry_status
+from .validation import ValidationError, apply_validations, create_validation_updates
+
+
+def get_rows(table_name: str, row_ids: Iterable[int]) -> Dict[int, dict]:
+    """Get single rows of a table, skipping deleted rows."""
+    client = get_client()
+    table_id = get_table_config(table_name).id
+    rows = {}
+    for row_id in sorted(set(row_ids)):
+        if (row := client.get_row(table_id, row_id)) is not None:
+            rows[row_id] = row
+    return rows
+
+
+def load_rows(
+    case_ids: Iterable[int],
+    finding_ids: Iterable[int],
+    rows_getter: Callable[[str, Iterable[int]], Dict[int, dict]] = get_rows,
+) -> Tuple[Dict[int, dict], Dict[int, dict]]:
+    """Get the given cases and findings with their linked rows.
+
+    rows_getter replaces get_rows, eg to get the rows from recorded tables.
+    """
+    findings = rows_getter(FINDINGS_TABLE_NAME, finding_ids)
+    case_ids = set(case_ids) | {cid for finding in findings.values() for cid in finding["Cases"]}
+    cases = rows_getter(CASE_TABLE_NAME, case_ids)
+    linked_ids = {fid for case in cases.values() for fid in case["Findings"]} - set(findings)
+    findings.update(rows_getter(FINDINGS_TABLE_NAME, linked_ids))
+    # findings are only validated as part of their cases
+    findings = {fid: f for fid, f in findings.items() if set(f["Cases"]) & set(cases)}
+    return cases, findings
+
+
+def create_row_updates(cases: dict, findings: dict, lb_data: dict, personnel_data: dict) -> Tuple[List[BaserowUpdate], List[ValidationError]]:
+    """Create LB, validation and status updates for the given cases."""
+    all_updates = update_baserow_from_lb(cases, lb_data)
+    validation_errors = apply_validations(personnel_data, cases, all_updates, findings, [])
+    all_updates += create_validation_updates(cases, validation_errors)
+    full_data = merge_entries(cases, all_updates, "Findings", findings, [], "Cases")
+    all_updates += update_entry_status(cases, full_data)
+    return all_updates, validation_errors
+
+
+def sync_rows(
+    case_ids: Iterable[int],
+    finding_ids: Iterable[int],
+    dry_run: bool,
+    lb_getter: Optional[Callable[[], dict]] = None,
+    personnel_getter: Optional[Callable[[], dict]] = None,
+) -> Tuple[List[BaserowUpdate], List[ValidationError]]:
+    """Update, validate and set the status of the given rows.
+
+    lb_getter and personnel_getter replace loading the LB-Metadata and
+    Personnel tables, eg to reuse cached tables.
+    """
+    cases, findings = load_rows(case_ids, finding_ids)
+    if not cases:
+        return [], []
+    lb_data = lb_getter() if lb_getter else get_table("LB-Metadata")
+    personnel_data = personnel_getter() if personnel_getter else get_table("Personnel")
+
+    all_updates, validation_errors = create_row_updates(cases, findings, lb_data, personnel_data)
+    logger.info("Incremental sync of {num_cases} cases and {num_findings} findings", num_cases=len(cases), num_findings=len(findings))
+    apply_updates(CASE_TABLE_NAME, all_updates, dry_run=dry_run)
+    return all_updates, validation_errors
@@ -0,0 +1,119 @@
+"""Lookup indexes over Baserow findings.
+"""
+from collections import defaultdict
+from typing import Any, Dict, Generic, Iterable, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def reciprocal_overlap(left: Tuple[int, int], right: Tuple[int, int]) -> float:
+    """Get the reciprocal overlap of two closed intervals.
+
+    This is the overlap length relative to the longer of both intervals, so
+    that a value of 0.5 means both intervals are covered to at least half.
+    """
+    left_start, left_end = left
+    right_start, right_end = right
+    overlap = min(left_end, right_end) - max(left_start, right_start) + 1
+    if overlap <= 0:
+        return 0.0
+    left_len = left_end - left_start + 1
+    right_len = right_end - right_start + 1
+    return min(overlap / left_len, overlap / right_len)
+
+
+class IntervalTree(Generic[T]):
+    """Static interval tree over closed intervals.
+
+    Intervals are stored sorted by start and the implicit binary tree over the
+    sorted array is augmented with the maximum end in each subtree. Overlap
+    queries run in O(log n + k) for k results.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[int, int, T]]):
+        entries = sorted(intervals, key=lambda i: (i[0], i[1]))
+        self._starts = [e[0] for e in entries]
+        self._ends = [e[1] for e in entries]
+        self._values = [e[2] for e in entries]
+        self._max_ends = list(self._ends)
+        self._build(0, len(entries))
+
+    def __len__(self):
+        return len(self._starts)
+
+    def _build(self, lo: int, hi: int) -> int:
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        max_end = self._ends[mid]
+        for child_max in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child_max > max_end:
+                max_end = child_max
+        self._max_ends[mid] = max_end
+        return max_end
+
+    def overlapping(self, start: int, end: int) -> List[Tuple[int, int, T]]:
+        """Get all intervals overlapping the closed interval [start, end]."""
+        found = []
+        stack = [(0, len(self._starts))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            # nothing in this subtree reaches the query start
+            if self._max_ends[mid] < start:
+                continue
+            stack.append((lo, mid))
+            # all intervals right of mid start after mid
+            if self._starts[mid] <= end:
+                if self._ends[mid] >= start:
+                    found.append((self._starts[mid], self._ends[mid], self._values[mid]))
+                stack.append((mid + 1, hi))
+        return found
+
+
+class RegionIndex(Generic[T]):
+    """Interval trees over genomic regions, one per release and chromosome."""
+
+    def __init__(self, regions: Iterable[Tuple[str, str, int, int, T]]):
+        by_chrom = defaultdict(list)
+        for release, chrom, start, end, value in regions:
+            by_chrom[(release, chrom)].append((start, end, value))
+        self._trees: Dict[Tuple[str, str], IntervalTree[T]] = {
+            key: IntervalTree(intervals) for key, intervals in by_chrom.items()
+        }
+
+    def overlapping(self, release: str, chrom: str, start: int, end: int) -> List[Tuple[int, int, T]]:
+        if tree := self._trees.get((release, chrom)):
+            return tree.overlapping(start, end)
+        return []
+
+    def best_match(self, release: str, chrom: str, start: int, end: int, min_overlap: float, accept=lambda v: True) -> Any:
+        """Get the value with highest reciprocal overlap above min_overlap."""
+        best_value = None
+        best_overlap = 0.0
+        for hit_start, hit_end, value in self.overlapping(release, chrom, start, end):
+            if not accept(value):
+                continue
+            overlap = reciprocal_overlap((start, end), (hit_start, hit_end))
+            if overlap >= min_overlap and overlap > best_overlap:
+                best_value = value
+                best_overlap = overlap
+        return best_value
+
+
+FINDING_POSITION_FIELD = "Position (VCF)"
+
+
+def create_position_index(findings) -> Dict[str, List[int]]:
+    """Index finding ids by their position key.
+
+    Multiple findings can share a position if a variant has been reported in
+    several cases. Ids keep the order of the findings table.
+    """
+    by_position = defaultdict(list)
+    for fid, finding in findings.items():
+        if position := finding.get(FINDING_POSITION_FIELD):
+            by_position[position].append(fid)
+    return dict(by_position)
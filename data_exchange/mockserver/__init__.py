@@ -0,0 +1,205 @@
+"""Local stand-in servers for Baserow, VarFish, SODAR and SAMS.
+
+The servers answer the endpoints used by data_exchange from fixture data and
+can inject latency, jitter, server errors and 429 throttling, so that
+network-bound code paths can be measured without access to any of the
+production services.
+"""
+import json
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from attrs import define, field
+from loguru import logger
+
+
+@define
+class FaultConfig:
+    """Server slowness and failures injected into every request.
+
+    latency - Base delay of every response in seconds.
+    jitter - Maximum additional random delay in seconds.
+    error_rate - Fraction of requests answered with 503.
+    throttle_rate - Fraction of requests answered with 429 and Retry-After.
+    page_size - Default page size of paginated list endpoints.
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: int = 1
+    page_size: int = 100
+    seed: Optional[int] = None
+
+
+@define
+class MockRequest:
+    method: str
+    path: str
+    query: Dict[str, List[str]]
+    headers: Dict[str, str]
+    body: bytes
+    base_url: str
+    params: Dict[str, str] = field(factory=dict)
+
+    def param(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        if values := self.query.get(name):
+            return values[0]
+        return default
+
+    def json(self) -> Any:
+        return json.loads(self.body or b"null")
+
+    def form(self) -> Dict[str, str]:
+        return {k: v[0] for k, v in parse_qs(self.body.decode()).items()}
+
+
+@define
+class MockResponse:
+    status: int = 200
+    body: bytes = b""
+    headers: Dict[str, str] = field(factory=dict)
+
+
+def json_response(data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> MockResponse:
+    return MockResponse(status, json.dumps(data, default=str).encode(), {"Content-Type": "application/json", **(headers or {})})
+
+
+def paginate(request: MockRequest, items: list, page_size: int, size_param: str = "size") -> dict:
+    """Paginate items in the django rest framework format."""
+    size = int(request.param(size_param) or request.param("page_size") or page_size)
+    page = int(request.param("page") or 1)
+    start = (page - 1) * size
+    results = items[start:start + size]
+
+    def page_url(page_num):
+        query = {k: v[0] for k, v in request.query.items()}
+        query["page"] = str(page_num)
+        return f"{request.base_url}{request.path}?{urlencode(query)}"
+
+    return {
+        "count": len(items),
+        "next": page_url(page + 1) if start + size < len(items) else None,
+        "previous": page_url(page - 1) if page > 1 else None,
+        "results": results,
+    }
+
+
+@define
+class Route:
+    method: str
+    pattern: re.Pattern
+    handler: Callable[[MockRequest], MockResponse]
+
+
+class MockService:
+    """Routes of a single mocked service with fault injection."""
+    name = "mock"
+
+    def __init__(self, faults: Optional[FaultConfig] = None):
+        self.faults = faults or FaultConfig()
+        self.routes: List[Route] = []
+        self.request_count = 0
+        self._random = random.Random(self.faults.seed)
+        self._lock = threading.Lock()
+
+    def route(self, method: str, pattern: str, handler: Callable[[MockRequest], MockResponse]):
+        self.routes.append(Route(method, re.compile(f"^{pattern}$"), handler))
+
+    def _inject_faults(self) -> Optional[MockResponse]:
+        with self._lock:
+            self.request_count += 1
+            delay = self.faults.latency + self._random.uniform(0, self.faults.jitter)
+            roll = self._random.random()
+        if delay:
+            time.sleep(delay)
+        if roll < self.faults.throttle_rate:
+            return json_response({"detail": "Request was throttled."}, 429, {"Retry-After": str(self.faults.retry_after)})
+        if roll < self.faults.throttle_rate + self.faults.error_rate:
+            return json_response({"detail": "Service unavailable."}, 503)
+        return None
+
+    def handle(self, request: MockRequest) -> MockResponse:
+        if fault := self._inject_faults():
+            return fault
+        for route in self.routes:
+            if route.method == request.method and (m := route.pattern.match(request.path)):
+                request.params = m.groupdict()
+                try:
+                    return route.handler(request)
+                except KeyError as err:
+                    return json_response({"detail": f"Not found: {err}"}, 404)
+        return json_response({"detail": f"No route for {request.method} {request.path}"}, 404)
+
+
+def create_handler(service: MockService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # headers and body are written separately, avoid delayed ack stalls
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def _dispatch(self):
+            url = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            host = self.headers.get("Host") or f"{self.server.server_address[0]}:{self.server.server_address[1]}"
+            request = MockRequest(
+                method=self.command,
+                path=url.path,
+                query=parse_qs(url.query),
+                headers=dict(self.headers.items()),
+                body=self.rfile.read(length) if length else b"",
+                base_url=f"http://{host}",
+            )
+            response = service.handle(request)
+            self.send_response(response.status)
+            for key, value in response.headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(response.body)))
+            self.end_headers()
+            self.wfile.write(response.body)
+
+        do_GET = do_POST = do_PATCH = do_DELETE = _dispatch
+
+        def log_message(self, format, *args):
+            logger.trace(f"{service.name}: {format % args}")
+
+    return Handler
+
+
+class MockServer:
+    """Serve a mock service on a local port in a background thread."""
+
+    def __init__(self, service: MockService, host: str = "127.0.0.1", port: int = 0):
+        self.service = service
+        self.httpd = ThreadingHTTPServer((host, port), create_handler(service))
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=f"mock-{self.service.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
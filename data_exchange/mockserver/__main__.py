@@ -0,0 +1,41 @@
+import shlex
+import time
+from pathlib import Path
+from typing import Optional
+
+import typer
+
+from ..synthetic import generate
+from . import FaultConfig
+from .servers import data_from_recording, settings_environment, start_mock_servers
+
+
+def main(
+    cases: int = typer.Option(1000, help="Number of synthetic cases to serve."),
+    recording: Optional[Path] = typer.Option(None, help="Serve data recorded with --record instead of synthetic data."),
+    latency: float = typer.Option(0.0, help="Base latency of every response in seconds."),
+    jitter: float = typer.Option(0.0, help="Maximum random additional latency in seconds."),
+    error_rate: float = typer.Option(0.0, help="Fraction of requests failing with 503."),
+    throttle_rate: float = typer.Option(0.0, help="Fraction of requests throttled with 429."),
+    page_size: int = typer.Option(100, help="Default page size of paginated endpoints."),
+    seed: Optional[int] = typer.Option(None, help="Seed for reproducible faults."),
+    host: str = "127.0.0.1",
+):
+    """Serve Baserow, VarFish, SODAR and SAMS mocks until interrupted."""
+    data = data_from_recording(recording) if recording else generate(num_cases=cases)
+    faults = FaultConfig(latency=latency, jitter=jitter, error_rate=error_rate, throttle_rate=throttle_rate, page_size=page_size, seed=seed)
+    servers = start_mock_servers(data, faults, host)
+
+    print("# Point data_exchange at the mock servers with:")
+    for key, value in settings_environment(servers, data).items():
+        print(f"export {key}={shlex.quote(value)}")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for server in servers.values():
+            server.stop()
+
+
+typer.run(main)
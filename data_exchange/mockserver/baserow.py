@@ -0,0 +1,232 @@
+"""Mock of the Baserow rows and fields API."""
+from typing import Dict, List, Optional
+
+from ..baserow import split_field_names
+from ..records import to_plain
+from . import FaultConfig, MockRequest, MockResponse, MockService, json_response, paginate
+
+# columns served as single select, all others are inferred from their values
+SINGLE_SELECT_FIELDS = {
+    "Case Status",
+    "ClinVar-Upload Status",
+    "ResultType",
+    "ACMG Classification",
+    "Zygosity",
+    "Inheritance",
+    "Vertrag",
+    "Falltyp",
+    "Analysezahl",
+    "Gender",
+    "RelationToIndex",
+    "Teilnahmeerklärung versendet",
+    "Abrechnung freigegeben",
+}
+
+
+def infer_field(field_id: int, name: str, values: list) -> dict:
+    field_info = {"id": field_id, "name": name, "read_only": False, "primary": False}
+    sample = [v for v in values if v not in (None, "", [])]
+    if name in SINGLE_SELECT_FIELDS:
+        options = sorted({v for v in sample if isinstance(v, str)})
+        field_info["type"] = "single_select"
+        field_info["select_options"] = [{"id": field_id * 100 + i, "value": v, "color": "blue"} for i, v in enumerate(options)]
+    elif sample and all(isinstance(v, list) for v in sample):
+        if all(isinstance(i, int) for v in sample for i in v):
+            field_info["type"] = "link_row"
+        else:
+            options = sorted({i for v in sample for i in v})
+            field_info["type"] = "multiple_select"
+            field_info["select_options"] = [{"id": field_id * 100 + i, "value": v, "color": "blue"} for i, v in enumerate(options)]
+    elif sample and all(isinstance(v, bool) for v in sample):
+        field_info["type"] = "boolean"
+    else:
+        field_info["type"] = "text"
+    return field_info
+
+
+class BaserowTable:
+    def __init__(self, table_id: int, rows: Dict[int, dict]):
+        self.id = table_id
+        self.rows = {row_id: to_plain(row) for row_id, row in rows.items()}
+        names = []
+        for row in self.rows.values():
+            for name in row:
+                if name not in names:
+                    names.append(name)
+        self.fields = [
+            infer_field(table_id * 1000 + num, name, [row.get(name) for row in self.rows.values()])
+            for num, name in enumerate(names, start=1)
+        ]
+        self.fields_by_name = {f["name"]: f for f in self.fields}
+        self.fields_by_key = {f"field_{f['id']}": f for f in self.fields}
+        self.next_id = max(self.rows, default=0) + 1
+
+    def field(self, key: str, user_field_names: bool) -> Optional[dict]:
+        """Field of a key, a name with user_field_names and field_<id> otherwise, as resolved by Baserow."""
+        if user_field_names:
+            return self.fields_by_name.get(key)
+        return self.fields_by_key.get(key)
+
+    def serialize_value(self, field_info: dict, value):
+        def option(v):
+            for opt in field_info["select_options"]:
+                if opt["value"] == v:
+                    return opt
+            return {"id": None, "value": v, "color": ""}
+
+        if field_info["type"] == "single_select":
+            return option(value) if value not in (None, "") else None
+        if field_info["type"] == "multiple_select":
+            return [option(v) for v in value or []]
+        if field_info["type"] == "link_row":
+            return [{"id": v, "value": str(v)} for v in value or []]
+        return value
+
+    def deserialize_value(self, field_info: dict, value):
+        def option_value(v):
+            if isinstance(v, int):
+                for opt in field_info["select_options"]:
+                    if opt["id"] == v:
+                        return opt["value"]
+            return v
+
+        if field_info["type"] == "single_select":
+            return option_value(value) if value is not None else None
+        if field_info["type"] == "multiple_select":
+            return [option_value(v) for v in value or []]
+        if field_info["type"] == "link_row":
+            return [v["id"] if isinstance(v, dict) else v for v in value or []]
+        return value
+
+    def serialize_row(self, row_id: int, fields: List[dict], user_field_names: bool) -> dict:
+        row = self.rows[row_id]
+        result = {"id": row_id, "order": f"{row_id}.00000000000000000000"}
+        for field_info in fields:
+            key = field_info["name"] if user_field_names else f"field_{field_info['id']}"
+            result[key] = self.serialize_value(field_info, row.get(field_info["name"]))
+        return result
+
+    def write_row(self, row_id: Optional[int], data: dict, user_field_names: bool) -> int:
+        if row_id is None:
+            row_id = self.next_id
+            self.next_id += 1
+            self.rows[row_id] = {f["name"]: None for f in self.fields}
+        row = self.rows[row_id]
+        for key, value in data.items():
+            if key == "id":
+                continue
+            if field_info := self.field(key, user_field_names):
+                row[field_info["name"]] = self.deserialize_value(field_info, value)
+        return row_id
+
+    def matches(self, row: dict, filters: List[tuple], filter_type: str) -> bool:
+        def check(field_info, filter_name, value):
+            cell = row.get(field_info["name"])
+            if filter_name == "empty":
+                return cell in (None, "", [])
+            if filter_name == "not_empty":
+                return cell not in (None, "", [])
+            if filter_name == "equal":
+                return str(cell if cell is not None else "") == value
+            if filter_name == "not_equal":
+                return str(cell if cell is not None else "") != value
+            if filter_name == "contains":
+                return value.lower() in str(cell or "").lower()
+            if filter_name == "boolean":
+                return bool(cell) == (value.lower() in ("1", "true"))
+            if filter_name == "link_row_has":
+                return int(value) in (cell or [])
+            if filter_name.startswith("single_select"):
+                option_ids = {int(v) for v in value.split(",") if v}
+                cell_id = (self.serialize_value(field_info, cell) or {}).get("id")
+                is_any = cell_id in option_ids
+                if filter_name in ("single_select_equal", "single_select_is_any_of"):
+                    return is_any
+                return not is_any
+            raise ValueError(f"Unsupported filter {filter_name}")
+
+        results = [check(*f) for f in filters]
+        if not results:
+            return True
+        return any(results) if filter_type == "OR" else all(results)
+
+
+class BaserowService(MockService):
+    name = "baserow"
+
+    def __init__(self, tables: List[dict], faults: Optional[FaultConfig] = None):
+        super().__init__(faults)
+        self.tables = {t["id"]: BaserowTable(t["id"], t["data"]) for t in tables}
+        base = "/api/database"
+        self.route("GET", rf"{base}/fields/table/(?P<table>\d+)/", self.list_fields)
+        self.route("GET", rf"{base}/rows/table/(?P<table>\d+)/", self.list_rows)
+        self.route("POST", rf"{base}/rows/table/(?P<table>\d+)/", self.create_row)
+        self.route("PATCH", rf"{base}/rows/table/(?P<table>\d+)/batch/", self.update_rows)
+        self.route("POST", rf"{base}/rows/table/(?P<table>\d+)/batch/", self.create_rows)
+        self.route("GET", rf"{base}/rows/table/(?P<table>\d+)/(?P<row>\d+)/", self.get_row)
+        self.route("PATCH", rf"{base}/rows/table/(?P<table>\d+)/(?P<row>\d+)/", self.update_row)
+
+    def table(self, request: MockRequest) -> BaserowTable:
+        return self.tables[int(request.params["table"])]
+
+    @staticmethod
+    def user_field_names(request: MockRequest) -> bool:
+        return (request.param("user_field_names") or "").lower() in ("true", "1", "yes", "y", "on")
+
+    def list_fields(self, request: MockRequest) -> MockResponse:
+        return json_response(self.table(request).fields)
+
+    def list_rows(self, request: MockRequest) -> MockResponse:
+        table = self.table(request)
+        names = self.user_field_names(request)
+        fields = table.fields
+        if include := request.param("include"):
+            # field names are quoted if they contain commas, field_<id> keys never are
+            keys = split_field_names(include) if names else include.split(",")
+            included = [table.field(key, names) for key in keys]
+            fields = [f for f in included if f]
+        filters = []
+        for key, values in request.query.items():
+            if key.startswith("filter__"):
+                _, field_key, filter_name = key.split("__", 2)
+                # filters take field_<id>, with user_field_names also names
+                if field_info := table.field(field_key, False) or (names and table.field(field_key, True)):
+                    filters.append((field_info, filter_name, values[0]))
+        filter_type = request.param("filter_type", "AND")
+        row_ids = [row_id for row_id, row in table.rows.items() if table.matches(row, filters, filter_type)]
+        page = paginate(request, row_ids, self.faults.page_size)
+        page["results"] = [table.serialize_row(row_id, fields, names) for row_id in page["results"]]
+        return json_response(page)
+
+    def get_row(self, request: MockRequest) -> MockResponse:
+        table = self.table(request)
+        names = self.user_field_names(request)
+        return json_response(table.serialize_row(int(request.params["row"]), table.fields, names))
+
+    def create_row(self, request: MockRequest) -> MockResponse:
+        table = self.table(request)
+        names = self.user_field_names(request)
+        row_id = table.write_row(None, request.json(), names)
+        return json_response(table.serialize_row(row_id, table.fields, names))
+
+    def update_row(self, request: MockRequest) -> MockResponse:
+        table = self.table(request)
+        names = self.user_field_names(request)
+        row_id = table.write_row(int(request.params["row"]), request.json(), names)
+        return json_response(table.serialize_row(row_id, table.fields, names))
+
+    def create_rows(self, request: MockRequest) -> MockResponse:
+        table = self.table(request)
+        names = self.user_field_names(request)
+        row_ids = [table.write_row(None, item, names) for item in request.json()["items"]]
+        return json_response({"items": [table.serialize_row(row_id, table.fields, names) for row_id in row_ids]})
+
+    def update_rows(self, request: MockRequest) -> MockResponse:
+        table = self.table(request)
+        names = self.user_field_names(request)
+        items = request.json()["items"]
+        missing = [item["id"] for item in items if item["id"] not in table.rows]
+        if missing:
+            return json_response({"error": "ERROR_ROW_DOES_NOT_EXIST", "detail": f"The rows {missing} do not exist."}, 404)
+        row_ids = [table.write_row(item["id"], item, names) for item in items]
+        return json_response({"items": [table.serialize_row(row_id, table.fields, names) for row_id in row_ids]})
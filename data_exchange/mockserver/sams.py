@@ -0,0 +1,36 @@
+"""Mock of the SAMS phenopacket export."""
+from typing import List, Optional
+
+from . import FaultConfig, MockRequest, MockResponse, MockService, json_response
+
+SESSION_COOKIE = "SAMSI-SieWarSoWeich"
+
+
+class SamsService(MockService):
+    name = "sams"
+
+    def __init__(self, phenopackets: List[dict], faults: Optional[FaultConfig] = None):
+        super().__init__(faults)
+        self.phenopackets = phenopackets
+        self.by_id = {p["subject"]["id"]: p for p in phenopackets}
+        self.route("POST", "/sams-cgi/login.cgi", self.login)
+        self.route("GET", "/sams-cgi/export_all_phenopackets.cgi", self.export_all)
+        self.route("GET", "/sams-cgi/export_phenopacket.cgi", self.export_one)
+
+    def login(self, request: MockRequest) -> MockResponse:
+        return MockResponse(200, b"", {"Set-Cookie": f"{SESSION_COOKIE}=mocksession; Path=/"})
+
+    def logged_in(self, request: MockRequest) -> bool:
+        return SESSION_COOKIE in request.headers.get("Cookie", "")
+
+    def export_all(self, request: MockRequest) -> MockResponse:
+        if not self.logged_in(request):
+            return json_response({"error": "not logged in"}, 403)
+        return json_response(self.phenopackets)
+
+    def export_one(self, request: MockRequest) -> MockResponse:
+        if not self.logged_in(request):
+            return json_response({"error": "not logged in"}, 403)
+        if (phenopacket := self.by_id.get(request.param("external_id"))) is None:
+            return json_response({"error": "not found"}, 404)
+        return json_response(phenopacket)
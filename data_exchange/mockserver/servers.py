@@ -0,0 +1,66 @@
+"""Start all mock servers from synthetic or recorded data."""
+import json
+from pathlib import Path
+from typing import Dict
+
+from ..recording import load, recording_path
+from ..synthetic import SyntheticData
+from . import FaultConfig, MockServer
+from .baserow import BaserowService
+from .sams import SamsService
+from .sodar import SodarService
+from .varfish import VarfishService
+
+
+def data_from_recording(directory: Path) -> SyntheticData:
+    """Load data recorded with --record for serving."""
+    def load_source(name, default):
+        path = recording_path(directory, name)
+        return load(path) if path.exists() else default
+
+    tables = {t["name"]: t["data"] for t in load_source("baserow", [])}
+    return SyntheticData(
+        cases=tables.get("Cases", {}),
+        findings=tables.get("Findings", {}),
+        lb=tables.get("LB-Metadata", {}),
+        patients=tables.get("Patients", {}),
+        personnel=tables.get("Personnel", {}),
+        sodar=load_source("sodar", []),
+        varfish=load_source("varfish", []),
+        varfish_findings=load_source("varfish_findings", {}),
+        sams=load_source("sams", []),
+    )
+
+
+def start_mock_servers(data: SyntheticData, faults: FaultConfig, host: str = "127.0.0.1") -> Dict[str, MockServer]:
+    servers = {
+        "baserow": MockServer(BaserowService(data.baserow_tables(), faults), host),
+        "varfish": MockServer(VarfishService(data.varfish, data.varfish_findings, faults), host),
+        "sodar": MockServer(SodarService(data.sodar, faults), host),
+        "sams": MockServer(SamsService(data.sams, faults), host),
+    }
+    for server in servers.values():
+        server.start()
+    return servers
+
+
+def settings_environment(servers: Dict[str, MockServer], data: SyntheticData) -> Dict[str, str]:
+    """Dynaconf environment variables pointing data_exchange at the mock servers."""
+    projects = [
+        {"id": str(p["uuid"]), "name": p["name"], "data_type": p["data_type"]}
+        for p in data.sodar
+    ]
+    return {
+        "DYNACONF_BASEROW__URL": servers["baserow"].url,
+        "DYNACONF_VARFISH__URL": servers["varfish"].url,
+        "DYNACONF_SODAR__URL": servers["sodar"].url,
+        "DYNACONF_SAMS__URL": servers["sams"].url,
+        "DYNACONF_SODAR__PROJECT": f"@json {json.dumps(projects)}",
+        "DYNACONF_BASEROW_TOKEN": "mock",
+        "DYNACONF_VARFISH_TOKEN": "mock",
+        "DYNACONF_VARFISH_USER": "mock",
+        "DYNACONF_VARFISH_PASSWORD": "mock",
+        "DYNACONF_SODAR_TOKEN": "mock",
+        "DYNACONF_SAMS_USER": "mock",
+        "DYNACONF_SAMS_PASSWORD": "mock",
+    }
@@ -0,0 +1,31 @@
+"""Mock of the SODAR samplesheet export."""
+import csv
+from io import StringIO
+from typing import List, Optional
+
+from . import FaultConfig, MockRequest, MockResponse, MockService, json_response
+
+
+def to_tsv(rows: List[dict]) -> str:
+    if not rows:
+        return ""
+    out = StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(rows[0]), delimiter="\t", lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue()
+
+
+class SodarService(MockService):
+    name = "sodar"
+
+    def __init__(self, projects: List[dict], faults: Optional[FaultConfig] = None):
+        super().__init__(faults)
+        self.samplesheets = {
+            str(p["uuid"]): {"studies": {f"s_{p['name']}.txt": {"tsv": to_tsv(p["data"])}}}
+            for p in projects
+        }
+        self.route("GET", r"/samplesheets/api/export/json/(?P<project>[0-9a-f-]+)", self.export)
+
+    def export(self, request: MockRequest) -> MockResponse:
+        return json_response(self.samplesheets[request.params["project"]])
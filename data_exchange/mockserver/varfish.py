@@ -0,0 +1,105 @@
+"""Mock of the VarFish web endpoints, REST API and Mehari proxy."""
+from typing import Dict, List, Optional
+
+from . import FaultConfig, MockRequest, MockResponse, MockService, json_response, paginate
+
+# keys added to varfish variants by Varfish.get_final_variants
+DERIVED_KEYS = ("comment_text", "comment", "variant_terms", "case_terms", "inheritance", "inheritance_status", "acmg_eval_date", "mehari", "details")
+
+LOGIN_PAGE = b"""<html><body><form method="post">
+<input type="hidden" name="csrfmiddlewaretoken" value="mocktoken">
+</form></body></html>"""
+
+
+def small_variant_key(entry) -> tuple:
+    return (str(entry["chromosome"]), int(entry["start"]), entry["reference"], entry["alternative"])
+
+
+class VarfishService(MockService):
+    name = "varfish"
+
+    def __init__(self, projects: List[dict], findings: Dict[str, List[dict]], faults: Optional[FaultConfig] = None):
+        super().__init__(faults)
+        self.projects = {str(p["uuid"]): p["cases"] for p in projects}
+        self.cases = {str(c.sodar_uuid): c for cases in self.projects.values() for c in cases}
+        self.findings = findings
+        self.mehari = {
+            small_variant_key(v): v["mehari"]
+            for variants in findings.values() for v in variants if "sv_type" not in v and "mehari" in v
+        }
+        self.sv_details = {
+            v["sodar_uuid"]: v.get("details", {})
+            for variants in findings.values() for v in variants if "sv_type" in v
+        }
+        uuid = r"(?P<case>[0-9a-f-]+)"
+        self.route("GET", "/login/", self.login_page)
+        self.route("POST", "/login/", self.login)
+        self.route("GET", r"/cases/api/case/list/(?P<project>[0-9a-f-]+)/", self.case_list)
+        self.route("GET", rf"/variants/api/case/retrieve/{uuid}/?", self.case_info)
+        self.route("GET", rf"/cases/api/case-comment/list-create/{uuid}/?", lambda r: json_response([]))
+        self.route("GET", rf"/variants/ajax/smallvariant/user-annotated-case/{uuid}/?", self.smallvar_annos)
+        self.route("GET", rf"/variants/api/small-variant-comment/list-create/{uuid}/?", self.smallvar_comments)
+        self.route("GET", rf"/variants/api/acmg-criteria-rating/list-create/{uuid}/?", self.smallvar_acmg)
+        self.route("GET", "/proxy/varfish/mehari/seqvars/csq", self.mehari_csq)
+        self.route("GET", rf"/svs/ajax/structural-variant-flags/list-create/{uuid}/?", self.sv_flags)
+        self.route("GET", rf"/svs/ajax/structural-variant-comment/list-create/{uuid}/?", self.sv_comments)
+        self.route("GET", r"/svs/sv-query-result-row/retrieve/(?P<sv>[0-9a-f-]+)/?", self.sv_detail)
+
+    def variants(self, request: MockRequest, structural: bool) -> List[dict]:
+        return [v for v in self.findings.get(request.params["case"], []) if ("sv_type" in v) == structural]
+
+    def login_page(self, request: MockRequest) -> MockResponse:
+        return MockResponse(200, LOGIN_PAGE, {"Content-Type": "text/html"})
+
+    def login(self, request: MockRequest) -> MockResponse:
+        return MockResponse(200, b"", {"Set-Cookie": "sessionid=mocksession; Path=/"})
+
+    def case_list(self, request: MockRequest) -> MockResponse:
+        cases = self.projects.get(request.params["project"], [])
+        if query := (request.param("q") or "").lower():
+            cases = [c for c in cases if query in c.name.lower() or any(query in m.name.lower() for m in c.pedigree)]
+        cases = [case.model_dump(mode="json") for case in cases]
+        return json_response(paginate(request, cases, self.faults.page_size))
+
+    def case_info(self, request: MockRequest) -> MockResponse:
+        case = self.cases[request.params["case"]]
+        case_terms = next((v["case_terms"] for v in self.findings.get(request.params["case"], [])), [])
+        return json_response({
+            **case.model_dump(mode="json"),
+            "notes": case.notes or "",
+            "phenotype_terms": [{"individual": case.index, "terms": case_terms}],
+        })
+
+    def smallvar_annos(self, request: MockRequest) -> MockResponse:
+        rows = [{k: v for k, v in variant.items() if k not in DERIVED_KEYS} for variant in self.variants(request, False)]
+        return json_response({"rows": rows})
+
+    def smallvar_comments(self, request: MockRequest) -> MockResponse:
+        return json_response([
+            {"chromosome": v["chromosome"], "start": v["start"], "reference": v["reference"], "alternative": v["alternative"], "text": v["comment_text"]}
+            for v in self.variants(request, False) if v.get("comment_text")
+        ])
+
+    def smallvar_acmg(self, request: MockRequest) -> MockResponse:
+        return json_response({"results": [
+            {"chromosome": v["chromosome"], "start": v["start"], "reference": v["reference"], "alternative": v["alternative"], "date_modified": f"{v['acmg_eval_date']}T00:00:00Z"}
+            for v in self.variants(request, False) if v.get("acmg_eval_date")
+        ]})
+
+    def mehari_csq(self, request: MockRequest) -> MockResponse:
+        key = (request.param("chromosome"), int(request.param("position")), request.param("reference"), request.param("alternative"))
+        return json_response(self.mehari.get(key, {"result": []}))
+
+    def sv_flags(self, request: MockRequest) -> MockResponse:
+        return json_response([{k: v for k, v in variant.items() if k not in DERIVED_KEYS} for variant in self.variants(request, True)])
+
+    def sv_comments(self, request: MockRequest) -> MockResponse:
+        return json_response([
+            {"chromosome": v["chromosome"], "start": v["start"], "end": v["end"], "sv_sub_type": v["sv_sub_type"], "text": v["comment_text"]}
+            for v in self.variants(request, True) if v.get("comment_text")
+        ])
+
+    def sv_detail(self, request: MockRequest) -> MockResponse:
+        if request.params["sv"] not in self.sv_details:
+            return json_response({"detail": "Not found."}, 404)
+        return json_response(self.sv_details[request.params["sv"]])
@@ -1,13 +1,20 @@
-import requests
+from typing import TYPE_CHECKING
+
 from attrs import define, field
 
 from .config import settings
+from .sessions import create_session
+
+if TYPE_CHECKING:
+    import requests
 
 
+@define
 class MyVariantAPI:
-    url = settings.myvariant.url
-    email = settings.myvariant.email
-    size = settings.myvariant.size
+    url: str = field(factory=lambda: settings.myvariant.url)
+    email: str = field(factory=lambda: settings.myvariant.email)
+    size: int = field(factory=lambda: settings.myvariant.size)
+    session: "requests.Session" = field(factory=create_session)
 
     fields = ["clinvar", "snpeff"]
 
@@ -19,6 +26,6 @@ class MyVariantAPI:
         }
         var_id = f"chr{chr}:g.{pos}{ref}>{alt}"
         url = f"{self.url}/{var_id}"
-        resp = requests.get(url, params)
+        resp = self.session.get(url, params=params)
         resp.raise_for_status()
         return resp.json()
@@ -0,0 +1,292 @@
+"""Offline index of HPO, MONDO, OMIM and ORPHA terms.
+
+The index is built once from the OBO files of HPO (hp.obo) and MONDO
+(mondo.obo), which also provides the OMIM and ORPHA terms through its
+equivalence xrefs. It is a single file of fixed size records sorted by term
+id, followed by the UTF-8 labels, and is memory mapped for lookups by binary
+search, so that opening it is instant and only touched pages are read:
+
+header   magic, number of records, length of the JSON metadata, metadata
+records  term id, label offset and length, record of the replacement of an
+         obsolete term, record of the nearest inheritance ancestor and
+         whether the term is obsolete
+labels   all labels, concatenated
+"""
+import datetime
+import functools
+import json
+import mmap
+import re
+import struct
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from attrs import define, field
+from loguru import logger
+
+MAGIC = b"ONTIDX1\0"
+HEADER = struct.Struct("<8sII")
+# term id, label offset, label length, replacement record, inheritance record, obsolete
+RECORD = struct.Struct("<16sIHii?")
+KEY_SIZE = 16
+NO_RECORD = -1
+
+PREFIXES = {"HP": "HP", "HPO": "HP", "MONDO": "MONDO", "OMIM": "OMIM", "ORPHA": "ORPHA", "Orphanet": "ORPHA"}
+TERM_PATTERN = re.compile(r"\b(HPO|HP|OMIM|ORPHA|MONDO):?(\d+)\b")
+# MONDO xrefs with the same meaning as the MONDO term
+EQUIVALENT_XREF = re.compile(r"^xref: (OMIM|Orphanet):(\d+) .*MONDO:equivalentTo")
+
+
+def format_term(prefix: str, number: str) -> str:
+    """Format a term id as in the ontology, eg HPO:6 -> HP:0000006."""
+    prefix = PREFIXES[prefix]
+    if prefix in ("HP", "MONDO"):
+        return f"{prefix}:{int(number):07d}"
+    return f"{prefix}:{int(number)}"
+
+
+def normalize_term(term: str) -> Optional[str]:
+    """Get the canonical id of a term written as eg HPO:0000006 or OMIM123456, None if it is no term."""
+    if not (match := TERM_PATTERN.fullmatch(term.strip())):
+        return None
+    return format_term(*match.groups())
+
+
+@define
+class OboTerm:
+    id: str
+    label: str = ""
+    obsolete: bool = False
+    replaced_by: Optional[str] = None
+    parents: List[str] = field(factory=list)
+    alt_ids: List[str] = field(factory=list)
+    xrefs: List[str] = field(factory=list)
+
+
+def parse_obo(lines: Iterable[str]) -> Iterator[OboTerm]:
+    """Parse the [Term] stanzas of an OBO file, keeping ids, labels, is_a relations and replacements."""
+    term = None
+    in_term = False
+    for line in lines:
+        line = line.rstrip("\n")
+        if line.startswith("["):
+            if term is not None:
+                yield term
+            term = None
+            in_term = line == "[Term]"
+            continue
+        if not line or not in_term:
+            continue
+        key, _, value = line.partition(": ")
+        if key == "id":
+            term = OboTerm(value)
+        elif term is None:
+            continue
+        elif key == "name":
+            term.label = value
+        elif key == "is_obsolete":
+            term.obsolete = value == "true"
+        elif key == "replaced_by":
+            term.replaced_by = value
+        elif key == "is_a":
+            term.parents.append(value.split(" ", 1)[0])
+        elif key == "alt_id":
+            term.alt_ids.append(value)
+        elif key == "xref" and (match := EQUIVALENT_XREF.match(line)):
+            term.xrefs.append(format_term(*match.groups()))
+    if term is not None:
+        yield term
+
+
+def nearest_ancestors(terms: Dict[str, OboTerm], targets: Iterable[str]) -> Dict[str, str]:
+    """Get the nearest of the target terms among the ancestors of every term, including itself."""
+    children = {}
+    for term in terms.values():
+        for parent in term.parents:
+            children.setdefault(parent, []).append(term.id)
+    nearest = {}
+    # breadth first from all targets at once, so every term gets its closest target
+    queue = deque((t, t) for t in targets if t in terms)
+    while queue:
+        term_id, target = queue.popleft()
+        if term_id in nearest:
+            continue
+        nearest[term_id] = target
+        queue.extend((child, target) for child in children.get(term_id, []))
+    return nearest
+
+
+def build_index(obo_paths: Iterable[Path], output: Path, inheritance_terms: Iterable[str] = ()) -> int:
+    """Build the index file from OBO files, returns the number of indexed ids.
+
+    inheritance_terms are the HPO modes of inheritance each term is linked to
+    by its nearest ancestor among them.
+    """
+    terms: Dict[str, OboTerm] = {}
+    sources = []
+    complete_prefixes = set()
+    for path in obo_paths:
+        with open(path, encoding="utf-8") as f:
+            for term in parse_obo(f):
+                prefix = term.id.split(":", 1)[0]
+                if prefix in PREFIXES:
+                    terms[term.id] = term
+                    complete_prefixes.add(prefix)
+        sources.append(Path(path).name)
+
+    def current(term_id: str) -> Optional[str]:
+        # replacements can be obsolete themselves
+        for _ in range(10):
+            if (term := terms.get(term_id)) is None or not term.obsolete:
+                return term_id if term else None
+            if (term_id := term.replaced_by) is None:
+                return None
+        return None
+
+    # alt ids and xrefs are records of their own, pointing to the primary term
+    entries: Dict[str, Tuple[str, Optional[str], bool]] = {}
+    for term in terms.values():
+        entries[term.id] = (term.label, current(term.id) if term.obsolete else None, term.obsolete)
+    for term in terms.values():
+        if term.obsolete:
+            continue
+        for alt_id in term.alt_ids:
+            entries.setdefault(alt_id, (term.label, term.id, True))
+        for xref in term.xrefs:
+            entries.setdefault(xref, (term.label, None, False))
+    entries = {k: v for k, v in entries.items() if len(k.encode()) <= KEY_SIZE}
+
+    nearest = nearest_ancestors(terms, inheritance_terms)
+    ids = sorted(entries)
+    positions = {term_id: pos for pos, term_id in enumerate(ids)}
+    # OMIM and ORPHA ids only come from MONDO xrefs, so unknown ids of them can still be valid
+    metadata = json.dumps({
+        "sources": sources,
+        "complete_prefixes": sorted(complete_prefixes),
+        "built": datetime.datetime.now().isoformat(),
+    }).encode()
+
+    labels = bytearray()
+    records = bytearray()
+    for term_id in ids:
+        label, replacement, obsolete = entries[term_id]
+        label_data = label.encode()[:0xFFFF]
+        inheritance = nearest.get(replacement or term_id)
+        records += RECORD.pack(
+            term_id.encode(),
+            len(labels),
+            len(label_data),
+            positions.get(replacement, NO_RECORD) if replacement else NO_RECORD,
+            positions.get(inheritance, NO_RECORD) if inheritance else NO_RECORD,
+            obsolete,
+        )
+        labels += label_data
+
+    tmp_path = output.with_name(output.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(ids), len(metadata)))
+        f.write(metadata)
+        f.write(records)
+        f.write(labels)
+    tmp_path.replace(output)
+    logger.info("Indexed {count} ontology terms from {sources} to {output}", count=len(ids), sources=", ".join(sources), output=output)
+    return len(ids)
+
+
+@define
+class OntologyTerm:
+    id: str
+    label: str
+    # obsolete terms and alternative ids
+    obsolete: bool
+    # current id of an obsolete term or alternative id, None if there is none
+    replaced_by: Optional[str]
+    # nearest mode of inheritance among the indexed inheritance terms
+    inheritance: Optional[str]
+
+    @property
+    def current_id(self) -> str:
+        return self.replaced_by or self.id
+
+
+class OntologyIndex:
+    """Read only lookups in a memory mapped index file written by build_index."""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, metadata_length = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is no ontology index")
+        self.metadata = json.loads(self._map[HEADER.size:HEADER.size + metadata_length])
+        self._records = HEADER.size + metadata_length
+        self._labels = self._records + self.count * RECORD.size
+        self._cache: Dict[str, Optional[OntologyTerm]] = {}
+
+    def close(self):
+        self._map.close()
+
+    def is_complete(self, term_id: str) -> bool:
+        """Whether all ids of the prefix of term_id are indexed, so that a missing id is unknown."""
+        return term_id.split(":", 1)[0] in self.metadata.get("complete_prefixes", ("HP", "MONDO"))
+
+    def _record(self, pos: int) -> Tuple[bytes, int, int, int, int, bool]:
+        return RECORD.unpack_from(self._map, self._records + pos * RECORD.size)
+
+    def _find(self, term_id: str) -> int:
+        key = term_id.encode().ljust(KEY_SIZE, b"\0")
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            start = self._records + mid * RECORD.size
+            mid_key = self._map[start:start + KEY_SIZE]
+            if mid_key < key:
+                low = mid + 1
+            elif mid_key > key:
+                high = mid
+            else:
+                return mid
+        return NO_RECORD
+
+    def _id(self, pos: int) -> Optional[str]:
+        if pos == NO_RECORD:
+            return None
+        return self._record(pos)[0].rstrip(b"\0").decode()
+
+    def lookup(self, term: str) -> Optional[OntologyTerm]:
+        """Look up a term in any notation normalize_term accepts, None if it is unknown."""
+        if term in self._cache:
+            return self._cache[term]
+        result = None
+        if (term_id := normalize_term(term)) is not None and (pos := self._find(term_id)) != NO_RECORD:
+            _, label_offset, label_length, replacement, inheritance, obsolete = self._record(pos)
+            start = self._labels + label_offset
+            label = self._map[start:start + label_length].decode()
+            result = OntologyTerm(term_id, label, obsolete, self._id(replacement), self._id(inheritance))
+        self._cache[term] = result
+        return result
+
+    def __contains__(self, term: str) -> bool:
+        return self.lookup(term) is not None
+
+    def normalize_text(self, text: str) -> str:
+        """Rewrite all known terms in text to their current id, keeping everything else."""
+        def replace(match):
+            term = self.lookup(match.group(0))
+            return term.current_id if term else match.group(0)
+
+        return TERM_PATTERN.sub(replace, text)
+
+
+@functools.lru_cache(maxsize=None)
+def get_ontology() -> Optional[OntologyIndex]:
+    """Get the index of the ontology.index_file setting, None if it is not set or not built yet."""
+    from .config import settings
+
+    if not (path := settings.get("ontology.index_file")):
+        return None
+    if not Path(path).exists():
+        logger.warning("Ontology index {path} is missing, build it with build-ontology", path=path)
+        return None
+    return OntologyIndex(Path(path))
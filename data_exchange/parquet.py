@@ -0,0 +1,210 @@
+"""Export the merged case and findings view and validation errors as Parquet.
+
+Columns are typed by the Baserow field types. Fields holding lists, ie
+links, multiple selects and files, are written to child tables with one row
+per value, eg cases__findings.parquet with the columns case_id and
+linked_id. Requires pyarrow.
+"""
+import datetime
+import json
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from . import CASE_TABLE_NAME, FINDINGS_TABLE_NAME
+from .records import LinkIds, attribute_name
+from .validation import ValidationError
+
+# Baserow field types holding a list of values
+LIST_TYPES = {"link_row", "multiple_select", "multiple_collaborators", "file"}
+INT_TYPES = {"autonumber", "count", "rating"}
+
+
+def parse_number(value) -> Optional[Decimal]:
+    try:
+        return Decimal(str(value)) if value not in (None, "") else None
+    except InvalidOperation:
+        return None
+
+
+def parse_date(value) -> Optional[datetime.date]:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value)[:10]) if value else None
+    except ValueError:
+        return None
+
+
+def parse_timestamp(value) -> Optional[datetime.datetime]:
+    if isinstance(value, datetime.datetime):
+        return value
+    try:
+        return datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00")) if value else None
+    except ValueError:
+        return None
+
+
+def to_text(value) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+def infer_type(values: Iterable[Any]) -> str:
+    """Get a Baserow field type for values of a field missing in the schema."""
+    sample = [v for v in values if v not in (None, "")]
+    if sample and all(isinstance(v, (list, LinkIds)) for v in sample):
+        return "link_row" if all(isinstance(i, (int, dict)) for v in sample for i in v) else "multiple_select"
+    if sample and all(isinstance(v, bool) for v in sample):
+        return "boolean"
+    if sample and all(isinstance(v, int) and not isinstance(v, bool) for v in sample):
+        return "number"
+    return "text"
+
+
+def column_converter(field_info: dict) -> Tuple[Any, Callable[[Any], Any]]:
+    """Get the arrow type and a value converter for a Baserow field."""
+    import pyarrow as pa
+
+    field_type = field_info["type"]
+    if field_type == "boolean":
+        return pa.bool_(), lambda v: bool(v) if v is not None else None
+    if field_type in INT_TYPES:
+        return pa.int64(), lambda v: int(n) if (n := parse_number(v)) is not None else None
+    if field_type == "number":
+        if field_info.get("number_decimal_places", 0) == 0:
+            return pa.int64(), lambda v: int(n) if (n := parse_number(v)) is not None else None
+        return pa.float64(), lambda v: float(n) if (n := parse_number(v)) is not None else None
+    if field_type == "date":
+        if field_info.get("date_include_time"):
+            return pa.timestamp("us", tz="UTC"), parse_timestamp
+        return pa.date32(), parse_date
+    if field_type in ("created_on", "last_modified"):
+        return pa.timestamp("us", tz="UTC"), parse_timestamp
+    return pa.string(), to_text
+
+
+def child_value(field_type: str, value) -> Tuple[Any, Any]:
+    """Get the arrow type and value of a single list item."""
+    import pyarrow as pa
+
+    if field_type == "link_row":
+        return pa.int64(), value["id"] if isinstance(value, dict) else value
+    return pa.string(), to_text(value)
+
+
+def write_table(path: Path, columns: Dict[str, Tuple[Any, List[Any]]], field_types: Optional[Dict[str, str]] = None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    field_types = field_types or {}
+    fields = [
+        pa.field(name, arrow_type, metadata={"baserow_type": field_types[name]} if name in field_types else None)
+        for name, (arrow_type, _) in columns.items()
+    ]
+    arrays = [pa.array(values, type=arrow_type) for arrow_type, values in columns.values()]
+    pq.write_table(pa.Table.from_arrays(arrays, schema=pa.schema(fields)), path, compression="zstd")
+
+
+def write_rows(directory: Path, name: str, id_column: str, rows: List[dict], fields: Optional[List[dict]]) -> List[Path]:
+    """Write rows with scalar fields to <name>.parquet and list fields to <name>__<field>.parquet.
+
+    Columns are ordered as the fields, fields missing in rows are left out.
+    """
+    import pyarrow as pa
+
+    present = {}
+    for row in rows:
+        present.update(dict.fromkeys(k for k in row if k != "id"))
+    fields_by_name = {f["name"]: f for f in fields or [] if f["name"] in present}
+    names = list(fields_by_name) + [k for k in present if k not in fields_by_name]
+    for field_name in names:
+        if field_name not in fields_by_name:
+            fields_by_name[field_name] = {"name": field_name, "type": infer_type(row.get(field_name) for row in rows)}
+
+    columns = {id_column: (pa.int64(), [row["id"] for row in rows])}
+    field_types = {}
+    written = []
+    for field_name in names:
+        field_info = fields_by_name[field_name]
+        values = [row.get(field_name) for row in rows]
+        if field_info["type"] in LIST_TYPES or any(isinstance(v, (list, LinkIds)) for v in values):
+            child_column = "linked_id" if field_info["type"] == "link_row" else "value"
+            child_type, parent_ids, child_values = pa.string(), [], []
+            for row, items in zip(rows, values):
+                for item in items or []:
+                    child_type, value = child_value(field_info["type"], item)
+                    parent_ids.append(row["id"])
+                    child_values.append(value)
+            path = directory / f"{name}__{attribute_name(field_name)}.parquet"
+            write_table(path, {id_column: (pa.int64(), parent_ids), child_column: (child_type, child_values)})
+            written.append(path)
+            continue
+        arrow_type, convert = column_converter(field_info)
+        columns[field_name] = (arrow_type, [convert(v) for v in values])
+        field_types[field_name] = field_info["type"]
+
+    path = directory / f"{name}.parquet"
+    write_table(path, columns, field_types)
+    return [path] + written
+
+
+def write_validation_errors(path: Path, errors: List[ValidationError]):
+    import pyarrow as pa
+
+    write_table(path, {
+        "error_id": (pa.int64(), list(range(1, len(errors) + 1))),
+        "case_id": (pa.int64(), [e.entry_id for e in errors]),
+        "rule": (pa.string(), [e.source.name for e in errors]),
+        "field": (pa.string(), [e.field for e in errors]),
+        "found": (pa.string(), [to_text(e.found) for e in errors]),
+        "expected": (pa.string(), [to_text(e.expected) for e in errors]),
+        "comment": (pa.string(), [e.comment for e in errors]),
+    })
+
+
+def get_table_fields(table_name: str) -> Optional[List[dict]]:
+    """Get the Baserow schema of a table, None if it can not be loaded, eg when running offline."""
+    from .baserow import get_client, get_table_config
+
+    try:
+        return get_client().get_fields(get_table_config(table_name).id)
+    except Exception as err:
+        logger.warning("Could not load fields of {table}, inferring column types: {err}", table=table_name, err=err)
+        return None
+
+
+def write_parquet(
+    directory: Path,
+    full_data: Dict[int, dict],
+    validation_errors: List[ValidationError],
+    fields: Optional[Dict[str, Optional[List[dict]]]] = None,
+) -> List[Path]:
+    """Write merged cases, their findings and validation errors to directory.
+
+    fields holds the Baserow fields of the Cases and Findings tables, by
+    default loaded from Baserow.
+    """
+    if fields is None:
+        fields = {name: get_table_fields(name) for name in (CASE_TABLE_NAME, FINDINGS_TABLE_NAME)}
+    directory.mkdir(parents=True, exist_ok=True)
+
+    cases = []
+    findings = {}
+    for case_id, entry in full_data.items():
+        case = dict(entry, id=case_id)
+        for finding in case.get("Findings", []):
+            findings.setdefault(finding["id"], finding)
+        cases.append(case)
+
+    written = write_rows(directory, "cases", "case_id", cases, fields.get(CASE_TABLE_NAME))
+    written += write_rows(directory, "findings", "finding_id", list(findings.values()), fields.get(FINDINGS_TABLE_NAME))
+    written.append(directory / "validation_errors.parquet")
+    write_validation_errors(written[-1], validation_errors)
+    logger.info("Wrote {cases} cases, {findings} findings and {errors} validation errors to {directory}", cases=len(cases), findings=len(findings), errors=len(validation_errors), directory=directory)
+    return written
@@ -0,0 +1,166 @@
+"""Write updates to plan files and apply saved plans.
+
+A plan is a JSON Lines file. The first line holds the plan version and
+creation time, every following line one merged update of a table with the
+old and new values of all updated fields and the stage that set each field:
+
+{"table": "Cases", "id": 12, "old": {"Case Status": "Active"}, "new": {"Case Status": "Solved"}, "stages": {"Case Status": "status"}}
+
+New rows have the id null and all their values in new.
+
+Before a plan is applied, the rows are fetched again. Fields whose current
+value is not the old value of the plan have been changed since, eg by a
+clinician, and are not overwritten.
+"""
+import datetime
+import json
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from attrs import define
+from loguru import logger
+
+from .baserow import BaserowUpdate, apply_updates, get_table, merge_updates
+
+PLAN_VERSION = 1
+
+
+class InvalidPlanError(Exception):
+    pass
+
+
+class PlanConflictError(Exception):
+    def __init__(self, conflicts: List["PlanConflict"]):
+        super().__init__(f"{len(conflicts)} fields were changed since the plan was written")
+        self.conflicts = conflicts
+
+
+@define
+class PlanConflict:
+    table: str
+    id: int
+    field: str
+    old: Any
+    current: Any
+    new: Any
+
+
+def to_json(value):
+    if isinstance(value, array):
+        return list(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Can not write {type(value).__name__} to a plan")
+
+
+def plan_lines(table_name: str, updates: List[BaserowUpdate]) -> Iterator[dict]:
+    stages = {}
+    for update in updates:
+        for key in update.updates:
+            stages.setdefault((update.id, key), update.stage)
+
+    for update in merge_updates(updates):
+        if not update.has_updates:
+            continue
+        if update.id is None:
+            new = {k: v for k, v in update.result_entry().items() if k != "id"}
+            yield {"table": table_name, "id": None, "old": {}, "new": new, "stages": {k: update.stage for k in new}}
+            continue
+        yield {
+            "table": table_name,
+            "id": update.id,
+            "old": {k: update.entry.get(k) for k in update.updates},
+            "new": update.updates,
+            "stages": {k: stages.get((update.id, k)) for k in update.updates},
+        }
+
+
+def write_plan(path: Path, updates_by_table: Dict[str, List[BaserowUpdate]]) -> int:
+    """Write the updates of all tables to a plan file, returns the number of updated rows."""
+    count = 0
+    with path.open("w") as f:
+        header = {"plan": PLAN_VERSION, "created": datetime.datetime.now().isoformat()}
+        f.write(json.dumps(header) + "\n")
+        for table_name, updates in updates_by_table.items():
+            for line in plan_lines(table_name, updates):
+                f.write(json.dumps(line, default=to_json, ensure_ascii=False) + "\n")
+                count += 1
+    logger.info("Wrote plan of {count} row updates to {path}", count=count, path=path)
+    return count
+
+
+def read_plan(path: Path) -> Dict[str, List[BaserowUpdate]]:
+    updates_by_table = {}
+    with path.open() as f:
+        header = json.loads(next(f, "{}"))
+        if header.get("plan") != PLAN_VERSION:
+            raise InvalidPlanError(f"{path} is not a plan of version {PLAN_VERSION}")
+        for line in f:
+            line = json.loads(line)
+            updates_by_table.setdefault(line["table"], []).append(BaserowUpdate(line["id"], line["old"], line["new"]))
+    return updates_by_table
+
+
+def plain_value(value):
+    """Value as written to a plan, to compare fetched rows with it.
+
+    Empty select fields are fetched as None, but read from sources as "".
+    """
+    value = json.loads(json.dumps(value, default=to_json))
+    return None if value in ("", []) else value
+
+
+def find_conflicts(table_name: str, updates: List[BaserowUpdate]) -> List[PlanConflict]:
+    """Fields of updated rows whose current value differs from the old value in the plan."""
+    updates = [u for u in updates if u.id is not None]
+    if not updates:
+        return []
+    fields = sorted({key for u in updates for key in u.updates})
+    rows = get_table(table_name, include=fields)
+    conflicts = []
+    for update in updates:
+        row = rows.get(update.id)
+        for key, new in update.updates.items():
+            # deleted rows conflict in every field
+            current = plain_value(row.get(key)) if row is not None else None
+            if row is None or current != plain_value(update.entry.get(key)):
+                conflicts.append(PlanConflict(table_name, update.id, key, update.entry.get(key), current, new))
+    return conflicts
+
+
+def without_conflicts(updates: List[BaserowUpdate], conflicts: List[PlanConflict]) -> List[BaserowUpdate]:
+    skipped = {(c.id, c.field) for c in conflicts}
+    return [
+        BaserowUpdate(
+            u.id,
+            {k: v for k, v in u.entry.items() if (u.id, k) not in skipped},
+            {k: v for k, v in u.updates.items() if (u.id, k) not in skipped},
+        )
+        for u in updates
+    ]
+
+
+def apply_plan(path: Path, dry_run: bool = True, force: bool = False) -> Tuple[Dict[str, List[BaserowUpdate]], List[PlanConflict]]:
+    """Upload all updates of a saved plan without recomputing them.
+
+    Only the updated fields of every row are written. Raises a
+    PlanConflictError if fields were changed since the plan was written,
+    with force all other fields are written and the changed ones are kept.
+    Returns the applied updates and the conflicts.
+    """
+    updates_by_table = read_plan(path)
+    conflicts = [c for table_name, updates in updates_by_table.items() for c in find_conflicts(table_name, updates)]
+    for conflict in conflicts:
+        logger.warning(
+            "{table} {id} {field} changed since the plan was written: planned {old!r} -> {new!r}, now {current!r}",
+            table=conflict.table, id=conflict.id, field=conflict.field, old=conflict.old, new=conflict.new, current=conflict.current,
+        )
+    if conflicts and not force:
+        raise PlanConflictError(conflicts)
+
+    for table_name, updates in updates_by_table.items():
+        updates = updates_by_table[table_name] = without_conflicts(updates, conflicts)
+        logger.info("Applying {count} updates to {table}", count=sum(u.has_updates for u in updates), table=table_name)
+        apply_updates(table_name, updates, dry_run=dry_run)
+    return updates_by_table, conflicts
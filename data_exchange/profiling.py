@@ -0,0 +1,144 @@
+"""Per-stage CPU and memory profiling of pipeline runs.
+
+CPU profiles are written as pstats files and as collapsed stacks from a
+sampling profiler, which can be rendered with flamegraph.pl or speedscope.
+Memory profiles list the top allocations of each stage from tracemalloc.
+"""
+import contextlib
+import cProfile
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from enum import Enum
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+
+class ProfileMode(str, Enum):
+    CPU = "cpu"
+    MEMORY = "memory"
+    BOTH = "both"
+
+
+class StackSampler:
+    """Sample the stack of a thread in regular intervals."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, path: Path):
+        with path.open("w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """Profile named pipeline stages into a run directory."""
+
+    def __init__(self, mode: ProfileMode, run_dir: Path, top_n: int = 25, interval: float = 0.005):
+        self.mode = mode
+        self.run_dir = run_dir
+        self.top_n = top_n
+        self.interval = interval
+        self.stage_count = 0
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def cpu(self) -> bool:
+        return self.mode in (ProfileMode.CPU, ProfileMode.BOTH)
+
+    @property
+    def memory(self) -> bool:
+        return self.mode in (ProfileMode.MEMORY, ProfileMode.BOTH)
+
+    def _write_memory_report(self, path: Path, name: str, before, after, peak: int):
+        stats = after.compare_to(before, "lineno")
+        with path.open("w") as f:
+            f.write(f"Stage {name}: peak traced memory {peak / 1024 / 1024:.1f} MiB\n")
+            f.write(f"Top {self.top_n} allocation differences:\n")
+            for stat in stats[:self.top_n]:
+                f.write(f"{stat}\n")
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        self.stage_count += 1
+        prefix = self.run_dir / f"{self.stage_count:02d}_{name}"
+
+        profile = sampler = snapshot = None
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            snapshot = tracemalloc.take_snapshot()
+        if self.cpu:
+            sampler = StackSampler(threading.get_ident(), self.interval)
+            sampler.start()
+            profile = cProfile.Profile()
+            profile.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+                sampler.stop()
+                profile.dump_stats(f"{prefix}.prof")
+                sampler.write_folded(Path(f"{prefix}.folded"))
+            if snapshot is not None:
+                _, peak = tracemalloc.get_traced_memory()
+                self._write_memory_report(Path(f"{prefix}.memory.txt"), name, snapshot, tracemalloc.take_snapshot(), peak)
+            with (self.run_dir / "stages.tsv").open("a") as f:
+                f.write(f"{self.stage_count}\t{name}\t{duration:.3f}\n")
+            logger.info("Stage {name} took {duration:.2f}s", name=name, duration=duration)
+
+
+_PROFILER: Optional[Profiler] = None
+
+
+def enable(mode: ProfileMode, run_dir: Path, **kwargs) -> Profiler:
+    global _PROFILER
+    _PROFILER = Profiler(mode, run_dir, **kwargs)
+    logger.info("Writing {mode} profiles to {run_dir}", mode=mode.value, run_dir=run_dir)
+    return _PROFILER
+
+
+def disable():
+    global _PROFILER
+    _PROFILER = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def profile_stage(name: str):
+    """Profile the enclosed pipeline stage if profiling is enabled."""
+    if _PROFILER is None:
+        return contextlib.nullcontext()
+    return _PROFILER.stage(name)
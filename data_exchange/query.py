@@ -0,0 +1,199 @@
+"""Run SQL on the latest local snapshots of all sources.
+
+Snapshots saved by the degradation settings or recordings made with
+--record are loaded into DuckDB, or SQLite if DuckDB and pyarrow are not
+installed. Baserow tables are named after the table, eg cases or
+lb_metadata, with list fields like links in child tables, eg
+cases__findings(case_id, linked_id). SODAR, VarFish and SAMS data is in
+sodar_samples, varfish_cases, varfish_pedigree and sams_phenotypes.
+"""
+import datetime
+import json
+import re
+import sqlite3
+import uuid
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from attrs import define
+
+from .recording import RecordingNotFoundError, load, recording_path
+from .records import LinkIds, attribute_name
+
+ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}$")
+
+
+class QueryEngine(str, Enum):
+    AUTO = "auto"
+    DUCKDB = "duckdb"
+    SQLITE = "sqlite"
+
+
+@define
+class QueryTable:
+    columns: List[str]
+    rows: List[tuple]
+
+
+def plain_value(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+def column_type(values: Iterable[Any]) -> str:
+    """Get the SQL type of a column, values of other types are written as text."""
+    sample = [v for v in values if v is not None]
+    if not sample:
+        return "VARCHAR"
+    if all(isinstance(v, bool) for v in sample):
+        return "BOOLEAN"
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in sample):
+        return "BIGINT"
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in sample):
+        return "DOUBLE"
+    if all(isinstance(v, str) and ISO_DATE.match(v) for v in sample):
+        return "DATE"
+    return "VARCHAR"
+
+
+def is_list(value) -> bool:
+    return isinstance(value, (list, tuple, LinkIds))
+
+
+def flatten_rows(name: str, id_column: str, rows: List[Tuple[Any, dict]]) -> Dict[str, QueryTable]:
+    """Split rows into a table of scalar fields and child tables of list fields.
+
+    Empty strings are read as NULL, as Baserow does not distinguish both.
+    """
+    names = {}
+    for _, row in rows:
+        names.update(dict.fromkeys(row))
+    list_fields = {n for n in names if any(is_list(row.get(n)) for _, row in rows)}
+
+    tables = {}
+    scalar_fields = [n for n in names if n not in list_fields]
+    tables[name] = QueryTable(
+        [id_column, *(attribute_name(n) for n in scalar_fields)],
+        [(row_id, *(plain_value(row.get(n)) if row.get(n) != "" else None for n in scalar_fields)) for row_id, row in rows],
+    )
+    for field_name in list_fields:
+        values = [(row_id, item) for row_id, row in rows for item in row.get(field_name) or []]
+        is_link = all(isinstance(item, (int, dict)) and not isinstance(item, bool) for _, item in values)
+        tables[f"{name}__{attribute_name(field_name)}"] = QueryTable(
+            [id_column, "linked_id" if is_link else "value"],
+            [(row_id, item["id"] if isinstance(item, dict) else plain_value(item)) for row_id, item in values],
+        )
+    return tables
+
+
+def load_source(directory: Path, name: str) -> Optional[Any]:
+    path = recording_path(directory, name)
+    return load(path) if path.exists() else None
+
+
+def snapshot_tables(directory: Path) -> Dict[str, QueryTable]:
+    """Load the snapshots in directory as tables."""
+    tables = {}
+    if (baserow_tables := load_source(directory, "baserow")) is None:
+        raise RecordingNotFoundError(f"No Baserow snapshot in {directory}, set degradation.snapshot_baserow or use a recording")
+    for table in baserow_tables:
+        name = attribute_name(table["name"])
+        id_column = f"{name[:-1] if name.endswith('s') else name}_id"
+        tables.update(flatten_rows(name, id_column, list(table["data"].items())))
+
+    if sodar_projects := load_source(directory, "sodar"):
+        samples = [
+            {"project_uuid": p["uuid"], "project_name": p["name"], "data_type": p["data_type"], **sample}
+            for p in sodar_projects
+            for sample in p["data"]
+        ]
+        tables.update(flatten_rows("sodar_samples", "sample_id", list(enumerate(samples, start=1))))
+
+    if varfish_projects := load_source(directory, "varfish"):
+        cases = []
+        pedigree = []
+        for project in varfish_projects:
+            for case in project["cases"]:
+                case = dict(vars(case), project_uuid=project["uuid"])
+                pedigree += [dict(vars(member), case_uuid=case["sodar_uuid"]) for member in case.pop("pedigree") or []]
+                cases.append(case)
+        tables.update(flatten_rows("varfish_cases", "case_id", list(enumerate(cases, start=1))))
+        tables.update(flatten_rows("varfish_pedigree", "member_id", list(enumerate(pedigree, start=1))))
+
+    if sams_entries := load_source(directory, "sams"):
+        phenotypes = [
+            {"subject": e["subject"]["id"], "hpo_id": f["type"]["id"], "label": f["type"].get("label"), "excluded": bool(f.get("excluded"))}
+            for e in sams_entries
+            for f in e.get("phenotypicFeatures", [])
+        ]
+        tables.update(flatten_rows("sams_phenotypes", "phenotype_id", list(enumerate(phenotypes, start=1))))
+    return tables
+
+
+def connect_duckdb(tables: Dict[str, QueryTable]):
+    import duckdb
+    import pyarrow as pa
+
+    arrow_types = {"BOOLEAN": pa.bool_(), "BIGINT": pa.int64(), "DOUBLE": pa.float64(), "DATE": pa.string(), "VARCHAR": pa.string()}
+    con = duckdb.connect()
+    for name, table in tables.items():
+        columns = list(zip(*table.rows)) if table.rows else [()] * len(table.columns)
+        types = [column_type(values) for values in columns]
+        arrays = [
+            pa.array([v if v is None or sql_type != "VARCHAR" else str(v) for v in values], type=arrow_types[sql_type])
+            for values, sql_type in zip(columns, types)
+        ]
+        con.register(f"_{name}", pa.Table.from_arrays(arrays, names=table.columns))
+        select = ", ".join(
+            f'CAST("{c}" AS DATE) AS "{c}"' if sql_type == "DATE" else f'"{c}"'
+            for c, sql_type in zip(table.columns, types)
+        )
+        con.execute(f'CREATE TABLE "{name}" AS SELECT {select} FROM "_{name}"')
+        con.unregister(f"_{name}")
+    return con
+
+
+def connect_sqlite(tables: Dict[str, QueryTable]) -> sqlite3.Connection:
+    con = sqlite3.connect(":memory:")
+    for name, table in tables.items():
+        columns = list(zip(*table.rows)) if table.rows else [()] * len(table.columns)
+        definition = ", ".join(f'"{c}" {column_type(values)}' for c, values in zip(table.columns, columns))
+        con.execute(f'CREATE TABLE "{name}" ({definition})')
+        con.executemany(f'INSERT INTO "{name}" VALUES ({", ".join("?" * len(table.columns))})', table.rows)
+    return con
+
+
+def connect(tables: Dict[str, QueryTable], engine: QueryEngine = QueryEngine.AUTO):
+    """Load tables into an in-memory database, DuckDB if it is installed for auto."""
+    if engine == QueryEngine.AUTO:
+        try:
+            import duckdb  # noqa: F401
+            import pyarrow  # noqa: F401
+        except ImportError:
+            engine = QueryEngine.SQLITE
+        else:
+            engine = QueryEngine.DUCKDB
+    if engine == QueryEngine.DUCKDB:
+        return connect_duckdb(tables)
+    return connect_sqlite(tables)
+
+
+def run_query(con, sql: str) -> Tuple[List[str], List[tuple]]:
+    cursor = con.execute(sql)
+    columns = [d[0] for d in cursor.description or []]
+    return columns, cursor.fetchall()
+
+
+def format_rows(columns: List[str], rows: List[tuple]) -> str:
+    """Format query results as an aligned text table."""
+    cells = [[("" if v is None else str(v)) for v in row] for row in rows]
+    widths = [max([len(c)] + [len(row[i]) for row in cells]) for i, c in enumerate(columns)]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(columns, widths)), "  ".join("-" * w for w in widths)]
+    lines += ["  ".join(v.ljust(w) for v, w in zip(row, widths)) for row in cells]
+    return "\n".join(lines)
@@ -0,0 +1,111 @@
+"""Record and replay data returned by all data sources.
+
+Recorded source data allows running the full pipeline offline, eg to
+reproduce a nightly run or to time the processing stages on real data.
+"""
+import datetime
+import gzip
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from loguru import logger
+
+RECORDING_SUFFIX = ".pkl.gz"
+MANIFEST_NAME = "manifest.json"
+
+
+class RecordingNotFoundError(Exception):
+    pass
+
+
+def recording_path(directory: Path, name: str) -> Path:
+    return directory / f"{name}{RECORDING_SUFFIX}"
+
+
+def save(path: Path, data: Any):
+    """Pickle data to path, readable by the owner only as source data holds patient data."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load(path: Path) -> Any:
+    with gzip.open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def record_source(directory: Path, name: str, getter: Callable) -> Callable:
+    """Wrap source getter to save all returned data.
+
+    The first call overwrites an older recording. Getters taking a list of
+    ids and returning results by id are recorded incrementally, so that later
+    calls add to the same recording. Tables fetched again by name, like
+    baserow.get_data(table_names), replace these tables in the recording.
+    The getter's result is returned as is.
+    """
+    path = recording_path(directory, name)
+    started = False
+
+    def inner(*args, **kwargs):
+        nonlocal started
+        data = getter(*args, **kwargs)
+        recorded = data
+        if started and isinstance(data, dict) and path.exists():
+            recorded = {**load(path), **data}
+        elif started and args and isinstance(data, list) and path.exists():
+            tables = {t["name"]: t for t in data}
+            recorded = [tables.get(t["name"], t) for t in load(path)]
+        save(path, recorded)
+        started = True
+        logger.debug("Recorded {name} to {path}", name=name, path=path)
+        return data
+    return inner
+
+
+def replay_source(directory: Path, name: str) -> Callable:
+    """Create source getter returning previously recorded data."""
+    path = recording_path(directory, name)
+
+    def inner(*args, **kwargs):
+        if not path.exists():
+            raise RecordingNotFoundError(f"No recording of {name} found in {directory}")
+        data = load(path)
+        # getters by id or by table name only return the requested entries
+        if isinstance(data, dict) and args:
+            missing = [key for key in args[0] if key not in data]
+            if missing:
+                raise RecordingNotFoundError(f"{len(missing)} requested entries not recorded in {path}: {missing[:5]}")
+            data = {key: data[key] for key in args[0]}
+        elif isinstance(data, list) and args:
+            data = [table for table in data if table["name"] in args[0]]
+        logger.debug("Replaying {name} from {path}", name=name, path=path)
+        return data
+    return inner
+
+
+def write_manifest(directory: Path, version: str):
+    manifest = {
+        "version": version,
+        "recorded": datetime.datetime.now().isoformat(),
+    }
+    with (directory / MANIFEST_NAME).open("w") as f:
+        json.dump(manifest, f)
+
+
+def record_sources(sources: Dict[str, Callable], directory: Path, version: str) -> Dict[str, Callable]:
+    directory.mkdir(parents=True, exist_ok=True)
+    # sources not called in this run must not replay data of an older recording
+    for name in sources:
+        recording_path(directory, name).unlink(missing_ok=True)
+    write_manifest(directory, version)
+    return {name: record_source(directory, name, getter) for name, getter in sources.items()}
+
+
+def replay_sources(sources: Dict[str, Callable], directory: Path) -> Dict[str, Callable]:
+    if not directory.is_dir():
+        raise RecordingNotFoundError(f"Recording directory {directory} does not exist")
+    return {name: replay_source(directory, name) for name in sources}
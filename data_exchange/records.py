@@ -0,0 +1,231 @@
+"""Compact records for Baserow rows.
+
+Rows are loaded as instances of slotted classes generated from the field
+schema of their table instead of one dict per row. Field names are shared by
+all rows of a table, equal strings are stored once per table and link fields
+are stored as int arrays. Records keep the read and write interface of dicts,
+so they can be used anywhere rows were dicts before, and every field is also
+available as an attribute, eg row.lb_id for the field "LB ID".
+"""
+import functools
+import keyword
+import re
+import sys
+import unicodedata
+from array import array
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple, Type
+
+
+class _Missing:
+    """Value of fields missing from a row, eg if only some fields were requested."""
+
+    def __repr__(self):
+        return "<missing>"
+
+    def __reduce__(self):
+        return "_MISSING"
+
+
+_MISSING = _Missing()
+
+
+class LinkIds(array):
+    """Ids of linked rows as an int array, comparing equal to lists of the same ids."""
+
+    def __new__(cls, ids: Iterable[int] = ()):
+        return super().__new__(cls, "q", ids)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, array)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __add__(self, other) -> list:
+        return list(self) + list(other)
+
+    def __radd__(self, other) -> list:
+        return list(other) + list(self)
+
+    def copy(self) -> "LinkIds":
+        return LinkIds(self)
+
+    def __reduce_ex__(self, protocol):
+        return LinkIds, (list(self),)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def to_link_ids(value):
+    if isinstance(value, list) and all(type(v) is int for v in value):
+        return LinkIds(value)
+    return value
+
+
+def attribute_name(field_name: str) -> str:
+    """Get a python identifier for a field name, eg lb_id for LB ID."""
+    name = unicodedata.normalize("NFKD", field_name).encode("ascii", "ignore").decode()
+    name = re.sub(r"\W+", "_", name).strip("_").lower()
+    if not name or name[0].isdigit() or keyword.iskeyword(name):
+        name = f"f_{name}"
+    return name
+
+
+class Row(MutableMapping):
+    """Base class of generated row records."""
+
+    __slots__ = ("_extra",)
+    _table: str = ""
+    _fields: Tuple[str, ...] = ()
+    _links: FrozenSet[str] = frozenset()
+    # field name to attribute name
+    _attrs: Dict[str, str] = {}
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "Row":
+        row = cls.__new__(cls)
+        for name, attr in cls._attrs.items():
+            value = data.get(name, _MISSING)
+            if name in cls._links:
+                value = to_link_ids(value)
+            object.__setattr__(row, attr, value)
+        extra = {k: v for k, v in data.items() if k not in cls._attrs}
+        row._extra = extra or None
+        return row
+
+    def __getitem__(self, key):
+        attr = self._attrs.get(key)
+        if attr is not None:
+            value = getattr(self, attr)
+            if value is not _MISSING:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        attr = self._attrs.get(key)
+        if attr is not None:
+            value = getattr(self, attr)
+            return default if value is _MISSING else value
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def __contains__(self, key) -> bool:
+        attr = self._attrs.get(key)
+        if attr is not None:
+            return getattr(self, attr) is not _MISSING
+        return self._extra is not None and key in self._extra
+
+    def __setitem__(self, key, value):
+        attr = self._attrs.get(key)
+        if attr is not None:
+            setattr(self, attr, to_link_ids(value) if key in self._links else value)
+        elif self._extra is None:
+            self._extra = {key: value}
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        attr = self._attrs.get(key)
+        if attr is not None:
+            setattr(self, attr, _MISSING)
+        else:
+            del self._extra[key]
+
+    def __iter__(self):
+        for name, attr in self._attrs.items():
+            if getattr(self, attr) is not _MISSING:
+                yield name
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    __hash__ = None
+
+    def _values(self) -> tuple:
+        return tuple(getattr(self, attr) for attr in self._attrs.values())
+
+    def copy(self) -> "Row":
+        row = self.__class__.__new__(self.__class__)
+        for attr in self._attrs.values():
+            object.__setattr__(row, attr, getattr(self, attr))
+        row._extra = dict(self._extra) if self._extra else None
+        return row
+
+    def __reduce__(self):
+        return _restore_row, (self._table, self._fields, self._links, self._values(), self._extra)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({dict(self.items())!r})"
+
+
+@functools.lru_cache(maxsize=None)
+def row_class(table: str, fields: Tuple[str, ...], links: FrozenSet[str] = frozenset()) -> Type[Row]:
+    """Create the record class of a table with the given field names."""
+    attrs = {}
+    reserved = set(dir(Row))
+    for name in fields:
+        attr = base = attribute_name(name)
+        num = 1
+        while attr in reserved or attr in attrs.values():
+            num += 1
+            attr = f"{base}_{num}"
+        attrs[sys.intern(name)] = attr
+    class_name = "".join(part.capitalize() for part in attribute_name(table).split("_")) + "Row"
+    return type(class_name, (Row,), {
+        "__slots__": tuple(attrs.values()),
+        "_table": table,
+        "_fields": tuple(attrs),
+        "_links": links,
+        "_attrs": attrs,
+    })
+
+
+def schema_row_class(table: str, fields: List[dict]) -> Type[Row]:
+    """Create the record class for the fields returned by the Baserow fields API."""
+    return row_class(
+        str(table),
+        tuple(f["name"] for f in fields),
+        frozenset(f["name"] for f in fields if f["type"] == "link_row"),
+    )
+
+
+def share_value(value, shared: Dict[str, str]):
+    """Use a single object for equal strings of a table, eg select values or names."""
+    if isinstance(value, str):
+        return shared.setdefault(value, value)
+    if isinstance(value, list):
+        return [shared.setdefault(v, v) if isinstance(v, str) else v for v in value]
+    return value
+
+
+def _restore_row(table: str, fields: Tuple[str, ...], links: FrozenSet[str], values: tuple, extra) -> Row:
+    cls = row_class(table, fields, links)
+    row = cls.__new__(cls)
+    for attr, value in zip(cls._attrs.values(), values):
+        object.__setattr__(row, attr, value)
+    row._extra = extra
+    return row
+
+
+def to_plain(entry: Mapping) -> Dict[str, Any]:
+    """Convert a row to a dict with lists, eg to serialize it as JSON."""
+    return {k: list(v) if isinstance(v, LinkIds) else v for k, v in entry.items()}
@@ -3,11 +3,15 @@
 
 
 from collections import defaultdict
-from typing import List
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator, List
 
 from data_exchange.validation import ValidationError, combine_validation_errors_by_entry_id, combine_validation_errors_by_responsible
 from data_exchange.baserow import COLUMN_CLINVAR_STATUS
 
+if TYPE_CHECKING:
+    from data_exchange.error_store import ErrorDiff
+
 def to_text_report(errors) -> str:
     by_entry_id = combine_validation_errors_by_entry_id(errors)
     all_lines = []
@@ -55,3 +59,44 @@ def to_text_report_by_responsible(errors):
 
     report_text = "\n".join(text_lines)
     return report_text
+
+
+def iter_diff_report(diff: "ErrorDiff", full: bool = False) -> Iterator[str]:
+    """Report new and resolved validation errors by responsible person line by line.
+
+    Unchanged errors are only counted unless full is given.
+    """
+    yield f"Validierung: {len(diff.new)} neu, {len(diff.resolved)} behoben, {len(diff.unchanged)} unverändert"
+
+    by_responsible = defaultdict(list)
+    groups = [("neu", diff.new)] + ([("offen", diff.unchanged)] if full else [])
+    for label, errors in groups:
+        for err in errors:
+            for person in [r["Shorthand"] for r in err.responsible] or ["-"]:
+                by_responsible[person].append(f"  {label}: SV-{err.entry_id} {err.source.name}: {err.field} {err.comment}")
+    for err in diff.resolved:
+        for person in err.responsible or ["-"]:
+            by_responsible[person].append(f"  behoben: SV-{err.case_id} {err.rule}: {err.field} {err.comment}")
+
+    for person in sorted(by_responsible):
+        yield person
+        yield from by_responsible[person]
+
+
+def write_validation_report(errors: List[ValidationError], write: Callable[[str], None], save: bool = True, full: bool = False, section: str = "validation"):
+    """Write the changes of validation errors since the last run, all errors without an error store.
+
+    save stores the errors as the last run, dry runs and runs that skipped
+    sources do not save them. section is the settings section of the error
+    store, so that the sync daemon does not consume the changes of cron runs.
+    """
+    from data_exchange.error_store import ErrorStore, get_store_path
+
+    if (store_path := get_store_path(section)) is None:
+        write(to_text_report_by_responsible(errors))
+        return
+    # compare to an empty store instead of creating it in dry runs
+    with ErrorStore(store_path if save or store_path.exists() else Path(":memory:")) as store:
+        diff = store.update(errors, save=save)
+    for line in iter_diff_report(diff, full):
+        write(line)
@@ -0,0 +1,225 @@
+"""Bound the time spent on each data source and degrade gracefully.
+
+Every source getter runs with a deadline and behind a circuit breaker. If a
+source fails, misses its deadline or its breaker is open, the last snapshot
+of the source is used instead. Without a snapshot the stages of the source
+are skipped. All degradations of a run are collected in a report.
+"""
+import datetime
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from attrs import define, field
+from loguru import logger
+
+from .recording import RecordingNotFoundError, record_source, recording_path, replay_source
+
+
+class SourceUnavailableError(Exception):
+    """Source failed and no snapshot of it is available."""
+
+
+class SourceTimeoutError(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def reset_clients():
+    """Drop all logged in clients, eg after their session expired."""
+    from . import baserow, sams, varfish
+
+    for module in (baserow, sams, varfish):
+        module.get_client.cache_clear()
+
+
+def call_with_deadline(name: str, func: Callable, args: Tuple, deadline: float) -> Any:
+    """Call func in a worker thread and stop waiting for it after deadline seconds.
+
+    The worker can not be cancelled and is left running in the background.
+    The cached clients are dropped, so that later calls log in with new
+    sessions instead of sharing them with the abandoned worker.
+    """
+    if not deadline:
+        return func(*args)
+
+    result = {}
+
+    def target():
+        try:
+            result["value"] = func(*args)
+        except BaseException as err:
+            result["error"] = err
+
+    thread = threading.Thread(target=target, name=f"source-{name}", daemon=True)
+    thread.start()
+    thread.join(deadline)
+    if thread.is_alive():
+        reset_clients()
+        raise SourceTimeoutError(f"{name} did not finish within {deadline:g}s")
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+@define
+class CircuitBreaker:
+    """Stop calling a source after consecutive failures until reset_after seconds passed."""
+    failure_threshold: int
+    reset_after: float
+    failures: int = 0
+    opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def check(self):
+        if self.state == "open":
+            raise CircuitOpenError(f"circuit open after {self.failures} failures")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+@define
+class Degradation:
+    source: str
+    reason: str
+    # eg "snapshot from 2024-05-01 02:00" or "skipped"
+    fallback: str
+
+
+@define
+class DegradationReport:
+    degradations: List[Degradation] = field(factory=list)
+
+    def add(self, source: str, reason: str, fallback: str):
+        logger.warning("Source {source} degraded: {reason}, {fallback}", source=source, reason=reason, fallback=fallback)
+        self.degradations.append(Degradation(source, reason, fallback))
+
+    def clear(self):
+        self.degradations.clear()
+
+    def to_text(self) -> str:
+        if not self.degradations:
+            return ""
+        lines = ["Degraded sources, results might be incomplete:"]
+        lines += [f"  {d.source}: {d.reason}, {d.fallback}" for d in self.degradations]
+        return "\n".join(lines)
+
+
+@define
+class GuardedSource:
+    """Source getter with deadline, circuit breaker and snapshot fallback.
+
+    Successful results are saved as snapshots to snapshot_dir. Required
+    sources raise their error instead of falling back, their results are
+    only saved with snapshot_required for the query command.
+    """
+    name: str
+    getter: Callable
+    deadline: float
+    breaker: CircuitBreaker
+    report: DegradationReport
+    snapshot_dir: Optional[Path] = None
+    required: bool = False
+    snapshot_required: bool = False
+    # records all calls of this source into one snapshot, replacing the snapshot of an earlier process
+    _recorder: Optional[Callable] = field(default=None, init=False)
+
+    def __call__(self, *args):
+        getter = self.getter
+        if self.snapshot_dir is not None and (self.snapshot_required or not self.required):
+            if self._recorder is None:
+                self._recorder = record_source(self.snapshot_dir, self.name, self.getter)
+            getter = self._recorder
+        try:
+            self.breaker.check()
+            result = call_with_deadline(self.name, getter, args, self.deadline)
+        except Exception as err:
+            if not isinstance(err, CircuitOpenError):
+                self.breaker.record_failure()
+            if self.required:
+                raise
+            return self.fallback(f"{type(err).__name__}: {err}", args)
+        self.breaker.record_success()
+        return result
+
+    def fallback(self, reason: str, args: Tuple):
+        if self.snapshot_dir is not None:
+            try:
+                data = replay_source(self.snapshot_dir, self.name)(*args)
+            except RecordingNotFoundError:
+                pass
+            else:
+                mtime = recording_path(self.snapshot_dir, self.name).stat().st_mtime
+                snapshot_time = datetime.datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M")
+                self.report.add(self.name, reason, f"using snapshot from {snapshot_time}")
+                return data
+        self.report.add(self.name, reason, "skipped")
+        raise SourceUnavailableError(f"{self.name} is unavailable: {reason}")
+
+
+def guard_sources(
+    sources: Dict[str, Callable],
+    report: DegradationReport,
+    deadlines: Dict[str, float],
+    snapshot_dir: Optional[Path],
+    failure_threshold: int = 3,
+    reset_after: float = 1800,
+    required: Tuple[str, ...] = (),
+    snapshot_required: bool = False,
+) -> Dict[str, GuardedSource]:
+    if snapshot_dir is not None:
+        snapshot_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return {
+        name: GuardedSource(
+            name,
+            getter,
+            float(deadlines.get(name, 0)),
+            CircuitBreaker(failure_threshold, reset_after),
+            report,
+            snapshot_dir,
+            required=name in required,
+            snapshot_required=snapshot_required,
+        )
+        for name, getter in sources.items()
+    }
+
+
+def guard_configured_sources(sources: Dict[str, Callable], report: DegradationReport) -> Dict[str, GuardedSource]:
+    """Guard sources with the deadlines and breaker of the degradation settings.
+
+    Baserow is required, as updates computed from an outdated snapshot would
+    overwrite newer changes. Its tables are only saved with
+    degradation.snapshot_baserow set, to query them.
+    """
+    from . import BASEROW
+    from .config import settings
+
+    config = settings.degradation
+    return guard_sources(
+        sources,
+        report,
+        config.get("deadlines", {}),
+        Path(config.snapshot_dir) if config.get("snapshot_dir") else None,
+        failure_threshold=int(config.breaker_failures),
+        reset_after=float(config.breaker_reset_after),
+        required=(BASEROW,),
+        snapshot_required=bool(config.get("snapshot_baserow", False)),
+    )
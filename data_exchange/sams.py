@@ -1,14 +1,26 @@
 from loguru import logger
 from .config import settings
+from .sessions import create_session
 
-from typing import List
-import requests
+import functools
+from typing import TYPE_CHECKING, List
 from attrs import define, field
 
+if TYPE_CHECKING:
+    import requests
+
+
+SAMS_DEFAULT_URL = "https://www.genecascade.org"
+
+
+class PhenopacketNotFoundError(Exception):
+    pass
+
 
 @define
 class SAMS:
-    session: requests.Session = field(factory=requests.Session)
+    url: str = SAMS_DEFAULT_URL
+    session: "requests.Session" = field(factory=create_session)
 
     @property
     def loggedIn(self):
@@ -19,34 +31,36 @@ class SAMS:
             "email": username,
             "password": password
         }
-        resp = self.session.post("https://www.genecascade.org/sams-cgi/login.cgi", data=data)
+        resp = self.session.post(f"{self.url}/sams-cgi/login.cgi", data=data)
         resp.raise_for_status()
 
     def get_phenopackets(self) -> List[dict]:
-        resp = self.session.get("https://www.genecascade.org/sams-cgi/export_all_phenopackets.cgi")
+        resp = self.session.get(f"{self.url}/sams-cgi/export_all_phenopackets.cgi")
         resp.raise_for_status()
         all_data = resp.json()
         return all_data
 
     def get_phenopacket(self, patient_id: str) -> dict:
-        resp = self.session.get(f"https://www.genecascade.org/sams-cgi/export_phenopacket.cgi?external_id={patient_id}")
+        resp = self.session.get(f"{self.url}/sams-cgi/export_phenopacket.cgi", params={"external_id": patient_id})
+        if resp.status_code == 404:
+            raise PhenopacketNotFoundError(f"No phenopacket for external id {patient_id}")
         resp.raise_for_status()
         patient_data = resp.json()
-        if patient_data["subject"]["id"] != patient_id:
-            raise RuntimeError(f"Failed to obtain phenopacket for external id {patient_id}")
+        if patient_data.get("subject", {}).get("id") != patient_id:
+            raise PhenopacketNotFoundError(f"No phenopacket for external id {patient_id}")
         return patient_data
 
     @classmethod
-    def with_credentials_file(cls, credentials_file: str):
+    def with_credentials_file(cls, credentials_file: str, url: str = SAMS_DEFAULT_URL):
         with open(credentials_file) as f:
             username, password = [l.strip() for l in f.readlines()]
-        s = cls()
+        s = cls(url)
         s.login(username, password)
         return s
 
     @classmethod
-    def with_username(cls, username: str, password: str):
-        s = cls()
+    def with_username(cls, username: str, password: str, url: str = SAMS_DEFAULT_URL):
+        s = cls(url)
         s.login(username, password)
         return s
 
@@ -64,9 +78,15 @@ def phenopacket_to_varfish_format(pheno: dict) -> str:
     return "; ".join(pheno_strings)
 
 
+@functools.cache
+def get_client() -> SAMS:
+    """Logged in SAMS client, reused by all later calls."""
+    return SAMS.with_username(settings.sams_user, settings.sams_password, url=settings.sams.url)
+
+
 def get_data():
     logger.debug("Loading SAMS")
-    api = SAMS.with_username(settings.sams_user, settings.sams_password)
+    api = get_client()
 
     sams_data = api.get_phenopackets()
     logger.debug("Loaded {len} data from SAMS", len=len(sams_data))
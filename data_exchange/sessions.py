@@ -0,0 +1,128 @@
+"""HTTP sessions with a timeout, a rate limit per host and coalesced requests.
+
+requests waits forever for a response unless a timeout is given, so a single
+hanging endpoint would block the whole run.
+
+All sessions of the process share a token bucket per host, so concurrent
+clients together do not send more than http.rate_limit requests per second
+(or the limit of the host in http.host_rate_limits) to the shared servers.
+Identical GET requests of a session that are already in flight are not sent
+again, all callers get the response of the first request.
+"""
+import functools
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Optional
+
+from attrs import define, field
+
+from .config import settings
+
+if TYPE_CHECKING:
+    import requests
+
+    from .timeout_session import TimeoutSession
+
+COALESCED_METHODS = {"GET", "HEAD"}
+
+
+def http_timeout() -> float:
+    return float(settings.http.timeout)
+
+
+class TokenBucket:
+    """Allows rate requests per second on average and up to burst requests at once."""
+
+    def __init__(self, rate: float, burst: float = 1, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, waiting until it is available. Returns the seconds waited."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # tokens are reserved before waiting, so concurrent callers wait in turn
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+@functools.lru_cache(maxsize=None)
+def host_bucket(host: str) -> Optional[TokenBucket]:
+    """Token bucket shared by all requests of the process to host, None if the host is not limited."""
+    http = settings.http
+    rate = float(http.get("host_rate_limits", {}).get(host, http.get("rate_limit", 0)))
+    if rate <= 0:
+        return None
+    return TokenBucket(rate, float(http.get("rate_burst", 1)))
+
+
+@define
+class InFlight:
+    done: threading.Event = field(factory=threading.Event)
+    result: Any = None
+    error: Optional[BaseException] = None
+
+
+class Coalescer:
+    """Runs a call only once for all callers asking for the same key at the same time."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, InFlight] = {}
+        self._lock = threading.Lock()
+
+    def call(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = InFlight()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+coalescer = Coalescer()
+
+
+def request_key(session: "requests.Session", method: str, url: str, params=None, headers=None) -> Optional[tuple]:
+    """Key of requests sharing a response, None if the request must be sent on its own."""
+    from requests import PreparedRequest
+
+    if method.upper() not in COALESCED_METHODS:
+        return None
+    prepared = PreparedRequest()
+    prepared.prepare_url(url, params)
+    return id(session), method.upper(), prepared.url, tuple(sorted((headers or {}).items()))
+
+
+def create_session() -> "TimeoutSession":
+    """Session with the http.timeout and the shared rate limits and coalescing.
+
+    requests is only imported with the first session.
+    """
+    from .timeout_session import TimeoutSession
+
+    return TimeoutSession(http_timeout())
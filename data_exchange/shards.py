@@ -0,0 +1,194 @@
+"""Run the per case stages in worker processes, sharded by family.
+
+Cases, LB-Metadata entries and findings that can affect the updates of each
+other are grouped into families by their normalized LB and Index IDs, linked
+findings and VarFish cases. Whole families are distributed to shards, which
+run in worker processes holding the read-only source data. The results of
+all shards are sorted back into the order of the cases, so that updates and
+validation errors are the same as in a serial run.
+"""
+import functools
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Sequence, Tuple
+
+from attrs import define, field
+from loguru import logger
+
+from .baserow import BaserowUpdate, expand_updates, normalize_lbid
+from .updates import ID_FIELD, INDEX_FIELD, update_baserow_from_lb, update_baserow_from_varfish_variants, varfish_variants_applicable
+from .validation import ValidationError, group_findings_by_case, validate_cases
+
+# more shards than workers keep all workers busy despite families of different size
+SHARDS_PER_WORKER = 4
+
+
+class UnionFind:
+    def __init__(self):
+        self._parent: Dict[Hashable, Hashable] = {}
+
+    def find(self, node: Hashable) -> Hashable:
+        root = node
+        while (parent := self._parent.setdefault(root, root)) != root:
+            root = parent
+        while node != root:
+            self._parent[node], node = root, self._parent[node]
+        return root
+
+    def union(self, left: Hashable, right: Hashable):
+        left_root, right_root = self.find(left), self.find(right)
+        if left_root != right_root:
+            self._parent[right_root] = left_root
+
+
+@define
+class Family:
+    # position in the cases table and case id
+    cases: List[Tuple[int, int]] = field(factory=list)
+    lb_ids: List[int] = field(factory=list)
+    finding_ids: List[int] = field(factory=list)
+
+
+Shard = List[Family]
+
+
+def plan_shards(cases_data: dict, lb_data: dict, findings_data: dict, count: int) -> List[Shard]:
+    """Group cases with their LB entries and findings into families and distribute them to up to count shards."""
+    families = UnionFind()
+    for cid, case in cases_data.items():
+        node = ("case", cid)
+        families.find(node)
+        if (lbid := normalize_lbid(case[ID_FIELD])) is not None:
+            families.union(node, ("family", lbid))
+        if case["Varfish"]:
+            # matching VarFish variants changes them for later cases of the same VarFish case
+            families.union(node, ("varfish", case["Varfish"]))
+        for fid in case["Findings"]:
+            families.union(node, ("finding", fid))
+    for lid, entry in lb_data.items():
+        node = ("lb", lid)
+        families.find(node)
+        for lbid in (normalize_lbid(entry[ID_FIELD]), normalize_lbid(entry[INDEX_FIELD])):
+            if lbid is not None:
+                families.union(node, ("family", lbid))
+    for fid, finding in findings_data.items():
+        node = ("finding", fid)
+        families.find(node)
+        for cid in finding["Cases"]:
+            families.union(node, ("case", cid))
+
+    by_root: Dict[Hashable, Family] = {}
+    for pos, cid in enumerate(cases_data):
+        by_root.setdefault(families.find(("case", cid)), Family()).cases.append((pos, cid))
+    for lid in lb_data:
+        if family := by_root.get(families.find(("lb", lid))):
+            family.lb_ids.append(lid)
+    for fid in findings_data:
+        if family := by_root.get(families.find(("finding", fid))):
+            family.finding_ids.append(fid)
+
+    # largest families first, each to the shard with the fewest cases
+    shards: List[Shard] = [[] for _ in range(max(count, 1))]
+    sizes = [(0, i) for i in range(len(shards))]
+    for family in sorted(by_root.values(), key=lambda f: (-len(f.cases), f.cases[0][0])):
+        size, i = heapq.heappop(sizes)
+        shards[i].append(family)
+        heapq.heappush(sizes, (size + len(family.cases), i))
+    return [shard for shard in shards if shard]
+
+
+# source data of the stage run by a worker process, set once per worker
+_shared: Dict[str, Any] = {}
+
+
+def init_worker(shared: Dict[str, Any]):
+    _shared.clear()
+    _shared.update(shared)
+
+
+def run_sharded(workers: int, shared: Dict[str, Any], func: Callable, tasks: Sequence[tuple]) -> list:
+    """Call func with each task's arguments in worker processes, returns the results in task order.
+
+    Workers started by fork share the source data with the parent without
+    copying it, otherwise it is sent once to every worker.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(shared,)) as executor:
+        futures = [executor.submit(func, *args) for args in tasks]
+        return [future.result() for future in futures]
+
+
+def in_case_order(results: List[List[Tuple[int, List[BaserowUpdate]]]]) -> List[BaserowUpdate]:
+    return [update for _, updates in sorted((r for shard in results for r in shard), key=lambda r: r[0]) for update in updates]
+
+
+def lb_shard(shard: Shard) -> List[Tuple[int, List[BaserowUpdate]]]:
+    cases, lb_data = _shared["cases"], _shared["lb"]
+    results = []
+    for family in shard:
+        family_lb = {lid: lb_data[lid] for lid in family.lb_ids}
+        for pos, cid in family.cases:
+            # cases without LB ID are matched by name to any entry
+            results.append((pos, update_baserow_from_lb({cid: cases[cid]}, family_lb if cases[cid][ID_FIELD] else lb_data)))
+    return results
+
+
+def sharded_lb_updates(cases_data: dict, lb_data: dict, shards: List[Shard], workers: int) -> List[BaserowUpdate]:
+    results = run_sharded(workers, {"cases": cases_data, "lb": lb_data}, lb_shard, [(shard,) for shard in shards])
+    return in_case_order(results)
+
+
+def select_variants(variants: Dict[str, list], varfish_ids: List[str]) -> Dict[str, list]:
+    return {varfish_id: variants[varfish_id] for varfish_id in varfish_ids}
+
+
+def varfish_shard(shard: Shard, variants: Dict[str, list]) -> List[Tuple[int, List[BaserowUpdate]]]:
+    cases, findings = _shared["cases"], _shared["findings"]
+    getter = functools.partial(select_variants, variants)
+    results = []
+    for family in shard:
+        family_findings = {fid: findings[fid] for fid in family.finding_ids}
+        for pos, cid in family.cases:
+            results.append((pos, update_baserow_from_varfish_variants({cid: cases[cid]}, family_findings, getter)))
+    return results
+
+
+def sharded_varfish_variant_updates(cases_data: dict, findings_data: dict, findings_getter: Callable, shards: List[Shard], workers: int) -> List[BaserowUpdate]:
+    # fetched once for all shards, so that source guards and recordings see a single call as in a serial run
+    variants = findings_getter([case["Varfish"] for case in cases_data.values() if varfish_variants_applicable(case)])
+    tasks = []
+    for shard in shards:
+        varfish_ids = {cases_data[cid]["Varfish"] for family in shard for _, cid in family.cases}
+        tasks.append((shard, {varfish_id: v for varfish_id, v in variants.items() if varfish_id in varfish_ids}))
+    results = run_sharded(workers, {"cases": cases_data, "findings": findings_data}, varfish_shard, tasks)
+    return in_case_order(results)
+
+
+def validation_shard(case_updates: List[BaserowUpdate], findings_by_case_id: Dict[int, List[dict]]):
+    return validate_cases(_shared["personnel"], case_updates, findings_by_case_id)
+
+
+def sharded_validations(personnel_data, cases_data, cases_updates, findings_data, findings_updates, shards: List[Shard], workers: int) -> List[ValidationError]:
+    all_case_updates = expand_updates(cases_data, cases_updates)
+    findings_by_case_id = group_findings_by_case(findings_data, findings_updates)
+
+    shard_of_case = {cid: i for i, shard in enumerate(shards) for family in shard for _, cid in family.cases}
+    shard_updates = [[] for _ in shards]
+    for update in all_case_updates:
+        shard_updates[shard_of_case.get(update.id, 0)].append(update)
+    tasks = [
+        (updates, {u.id: findings_by_case_id[u.id] for u in updates if u.id in findings_by_case_id})
+        for updates in shard_updates
+    ]
+    results = run_sharded(workers, {"personnel": personnel_data}, validation_shard, tasks)
+
+    rule_totals = {}
+    for _, shard_totals in results:
+        for name, totals in shard_totals.items():
+            rule_totals.setdefault(name, {"total": 0, "failed": 0})
+            rule_totals[name]["total"] += totals["total"]
+            rule_totals[name]["failed"] += totals["failed"]
+    logger.info(rule_totals)
+
+    positions = {update.id: pos for pos, update in enumerate(all_case_updates)}
+    errors = [error for shard_errors, _ in results for error in shard_errors]
+    return sorted(errors, key=lambda e: positions.get(e.entry_id, len(positions)))
@@ -0,0 +1,303 @@
+"""Sync a single case using targeted lookups instead of full table loads.
+
+Only the case row, its findings, the LB-Metadata and Patients rows of its
+family, its SODAR family, its VarFish case and its SAMS phenopacket are
+loaded. All update, validation and status stages then run on this data.
+"""
+import re
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from attrs import define, field
+from loguru import logger
+
+from . import ALL_DATA, BASEROW, CASE_TABLE_NAME, FINDINGS_TABLE_NAME, PATIENTS_TABLE_NAME, SAMS, SODAR, VARFISH, VARFISH_FINDINGS, create_updates
+from .baserow import BaserowUpdate, apply_updates, get_table, get_table_config, matchLbId, merge_updates, normalize_lbid
+from .config import settings
+from .incremental import get_rows, load_rows
+from .recording import load as load_recording, recording_path
+from .updates import ID_FIELD, INDEX_FIELD, CaseNotFoundError, match_sample_by_name, match_sample_by_sampleid
+from .validation import PersonRole, ValidationError
+
+CASE_ID = re.compile(r"^(?:SV-?)?(\d+)$", re.IGNORECASE)
+
+
+def parse_case_id(value: str) -> int:
+    """Get the row id of a case from SV-1234 or 1234."""
+    if m := CASE_ID.match(value.strip()):
+        return int(m.group(1))
+    raise ValueError(f"Invalid case id {value}, expected eg SV-1234")
+
+
+def lbid_number(lbid: str) -> Optional[str]:
+    """Get the part of an LB ID usable in a contains filter independent of the separator."""
+    if normalized := normalize_lbid(lbid):
+        return normalized.split("-")[1]
+    return None
+
+
+def to_lb_date(date: str) -> str:
+    year, month, day = date.split("-")
+    return f"{day}.{month}.{year}"
+
+
+@define
+class CaseData:
+    case_id: int
+    cases: Dict[int, dict]
+    findings: Dict[int, dict]
+    patients: Dict[int, dict]
+    lb: Dict[int, dict]
+    personnel: Dict[int, dict]
+    sodar: Optional[List[dict]] = None
+    varfish: Optional[List[dict]] = None
+    sams: List[dict] = field(factory=list)
+    # defaults to loading the findings from VarFish
+    varfish_findings: Optional[Callable] = None
+
+    @property
+    def case(self) -> dict:
+        return self.cases[self.case_id]
+
+    def sources(self) -> Dict[str, Callable]:
+        """Source getters usable in place of data_exchange.ALL_DATA."""
+        from . import varfish
+
+        tables = [
+            (CASE_TABLE_NAME, self.cases),
+            (FINDINGS_TABLE_NAME, self.findings),
+            (PATIENTS_TABLE_NAME, self.patients),
+            ("LB-Metadata", self.lb),
+            ("Personnel", self.personnel),
+        ]
+        return {
+            BASEROW: lambda: [{"id": get_table_config(name).id, "name": name, "data": data} for name, data in tables],
+            SODAR: lambda: self.sodar or [],
+            VARFISH: lambda: self.varfish or [],
+            VARFISH_FINDINGS: self.varfish_findings or varfish.get_findings,
+            SAMS: lambda: self.sams,
+        }
+
+
+@define
+class RecordedTables:
+    """Baserow tables of a recording, used in place of targeted lookups.
+
+    Filters are ignored, the loaders match the returned rows locally.
+    """
+    tables: Dict[str, Dict[int, dict]]
+
+    @classmethod
+    def from_source(cls, baserow_data: List[dict]) -> "RecordedTables":
+        return cls({table["name"]: table["data"] for table in baserow_data})
+
+    def get_table(self, table_name: str, filters=None, filter_type: str = "AND") -> Dict[int, dict]:
+        return self.tables[table_name]
+
+    def get_rows(self, table_name: str, row_ids: Iterable[int]) -> Dict[int, dict]:
+        table = self.tables[table_name]
+        return {row_id: table[row_id] for row_id in sorted(set(row_ids)) if row_id in table}
+
+
+def load_lb_entries(case: dict, table_getter: Callable = get_table) -> Dict[int, dict]:
+    """Get LB-Metadata rows matching the case and all rows of its family."""
+    filters = []
+    if number := lbid_number(case[ID_FIELD]):
+        filters.append((ID_FIELD, "contains", number))
+    if case["Birthdate"]:
+        filters.append(("Birthdate", "equal", to_lb_date(case["Birthdate"])))
+    if not filters:
+        return {}
+    candidates = table_getter("LB-Metadata", filters=filters, filter_type="OR")
+
+    if case[ID_FIELD]:
+        matches = match_sample_by_sampleid(candidates, case[ID_FIELD])
+    else:
+        matches = match_sample_by_name(candidates, case["Firstname"], case["Lastname"], case["Birthdate"])
+    matched = {row_id: row for row_id, row in candidates.items() if any(row is m for m in matches)}
+    if not matches or not (index_number := lbid_number(matches[-1][INDEX_FIELD])):
+        return matched
+
+    family = table_getter("LB-Metadata", filters=[(INDEX_FIELD, "contains", index_number)])
+    family = {row_id: row for row_id, row in family.items() if matchLbId(matches[-1][INDEX_FIELD], row[INDEX_FIELD])}
+    return {**matched, **family}
+
+
+def load_patients(case_id: int, lb_entries: Dict[int, dict], table_getter: Callable = get_table) -> Dict[int, dict]:
+    """Get Patients rows linked to the case or belonging to its family."""
+    filters = [("Cases", "link_row_has", case_id)]
+    numbers = {lbid_number(e[key]) for e in lb_entries.values() for key in (ID_FIELD, INDEX_FIELD)} - {None}
+    filters += [(ID_FIELD, "contains", number) for number in sorted(numbers)]
+    patients = table_getter(PATIENTS_TABLE_NAME, filters=filters, filter_type="OR")
+    return {
+        row_id: row for row_id, row in patients.items()
+        if case_id in row["Cases"] or lbid_number(row[ID_FIELD]) in numbers
+    }
+
+
+def load_personnel(cases: Dict[int, dict], rows_getter: Callable = get_rows) -> Dict[int, dict]:
+    person_ids = {pid for case in cases.values() for role in PersonRole for pid in case[role.value]}
+    return rows_getter("Personnel", person_ids)
+
+
+def family_ids(case: dict, lb_entries: Dict[int, dict]) -> List[str]:
+    ids = [case[ID_FIELD]] + [e[key] for e in lb_entries.values() for key in (ID_FIELD, INDEX_FIELD)]
+    return sorted({normalize_lbid(i) for i in ids if normalize_lbid(i)})
+
+
+def filter_sodar(projects: List[dict], lb_ids: List[str]) -> List[dict]:
+    """Keep the samplesheet rows of the family."""
+    return [
+        {
+            **project,
+            "data": [
+                row for row in project["data"]
+                if any(matchLbId(lb_id, row["Sample Name"]) or matchLbId(lb_id, row["Characteristics[Family]"]) for lb_id in lb_ids)
+            ],
+        }
+        for project in projects
+    ]
+
+
+def load_sodar(lb_ids: List[str], getter: Optional[Callable] = None) -> List[dict]:
+    """Get SODAR samplesheet rows of the family.
+
+    SODAR can only export whole samplesheets, so the samplesheets saved to
+    the snapshot dir by an earlier run are used if they are younger than
+    sync_case.sodar_max_age. Otherwise they are exported using getter.
+    """
+    from . import sodar
+
+    max_age = float(settings.get("sync_case", {}).get("sodar_max_age", 0))
+    path = recording_path(Path(settings.degradation.snapshot_dir), SODAR) if settings.degradation.get("snapshot_dir") else None
+    if max_age and path is not None and path.exists() and time.time() - path.stat().st_mtime < max_age:
+        logger.info("Using SODAR snapshot {path}", path=path)
+        projects = load_recording(path)
+    else:
+        projects = (getter or sodar.get_data)()
+    return filter_sodar(projects, lb_ids)
+
+
+def filter_varfish(projects: List[dict], case: dict) -> List[dict]:
+    """Keep the VarFish case of the case by its UUID or with its LB ID in the pedigree."""
+    def matches(varfish_case) -> bool:
+        if case["Varfish"]:
+            return str(varfish_case.sodar_uuid) == case["Varfish"]
+        return any(matchLbId(case[ID_FIELD], member.name) for member in varfish_case.pedigree)
+
+    return [{**project, "cases": [c for c in project["cases"] if matches(c)]} for project in projects]
+
+
+def load_varfish(case: dict) -> List[dict]:
+    """Get the VarFish case by its UUID or by searching the case lists for its LB ID."""
+    from . import varfish
+
+    if case["Varfish"]:
+        from varfish_cli.api.models import Case
+
+        client = varfish.get_client()
+        info = client._get(client.case_info_url, varfish_uuid=case["Varfish"])
+        return [{"uuid": None, "cases": [Case.model_validate(info)]}]
+
+    if not (number := lbid_number(case[ID_FIELD])):
+        return []
+    return filter_varfish(varfish.search_cases(number), case)
+
+
+def load_sams(case_id: int) -> List[dict]:
+    from . import sams
+
+    try:
+        return [sams.get_client().get_phenopacket(f"SV-{case_id}")]
+    except sams.PhenopacketNotFoundError as err:
+        logger.info("No SAMS phenopacket for SV-{case_id}: {err}", case_id=case_id, err=err)
+        return []
+
+
+def load_case(
+    case_id: int,
+    get_sodar: bool = True,
+    get_varfish: bool = True,
+    get_sams: bool = True,
+    sources: Optional[Dict[str, Callable]] = None,
+    recorded: bool = False,
+) -> CaseData:
+    """Load a case and the data of its family using targeted lookups.
+
+    sources are getters like data_exchange.ALL_DATA, used for the SODAR
+    export. With recorded, all data is taken from the recording in sources
+    instead, eg from replay_sources, without network access.
+    """
+    sources = sources or ALL_DATA
+    table_getter, rows_getter = get_table, get_rows
+    if recorded:
+        tables = RecordedTables.from_source(sources[BASEROW]())
+        table_getter, rows_getter = tables.get_table, tables.get_rows
+
+    cases, findings = load_rows([case_id], [], rows_getter)
+    if case_id not in cases:
+        raise CaseNotFoundError(f"Could not find case SV-{case_id}")
+    case = cases[case_id]
+    lb = load_lb_entries(case, table_getter)
+    data = CaseData(
+        case_id=case_id,
+        cases=cases,
+        findings=findings,
+        patients=load_patients(case_id, lb, table_getter),
+        lb=lb,
+        personnel=load_personnel(cases, rows_getter),
+    )
+    if recorded:
+        data.sodar = filter_sodar(sources[SODAR](), family_ids(case, lb)) if get_sodar else None
+        data.varfish = filter_varfish(sources[VARFISH](), case) if get_varfish else None
+        data.sams = [p for p in sources[SAMS]() if p["subject"]["id"] == f"SV-{case_id}"] if get_sams else []
+        data.varfish_findings = sources[VARFISH_FINDINGS]
+    else:
+        data.sodar = load_sodar(family_ids(case, lb), sources[SODAR]) if get_sodar else None
+        data.varfish = load_varfish(case) if get_varfish else None
+        data.sams = load_sams(case_id) if get_sams else []
+    return data
+
+
+def sync_case(
+    data: CaseData,
+    apply: bool = False,
+    sources: Optional[Dict[str, Callable]] = None,
+) -> Tuple[Dict[str, List[BaserowUpdate]], List[ValidationError]]:
+    """Run all stages for a single case and optionally apply the updates.
+
+    sources replaces the getters of data.sources(), eg to record them.
+    New Patients rows are never created, as the Patients table is not fully
+    loaded and could already contain them. They are left to the full sync.
+    """
+    _, case_updates, findings_updates, relatives_updates, errors = create_updates(
+        get_sodar=data.sodar is not None, get_varfish=data.varfish is not None, get_sams=True, sources=sources or data.sources(),
+    )
+    updates = {
+        CASE_TABLE_NAME: case_updates,
+        FINDINGS_TABLE_NAME: findings_updates,
+        PATIENTS_TABLE_NAME: relatives_updates,
+    }
+    if apply:
+        apply_updates(CASE_TABLE_NAME, case_updates, dry_run=False)
+        apply_updates(FINDINGS_TABLE_NAME, findings_updates, dry_run=False)
+        apply_updates(PATIENTS_TABLE_NAME, [u for u in relatives_updates if u.id is not None], dry_run=False)
+    return updates, errors
+
+
+def format_diff(updates: Dict[str, List[BaserowUpdate]]) -> str:
+    lines = []
+    for table_name, table_updates in updates.items():
+        for update in merge_updates(table_updates):
+            if not update.has_updates:
+                continue
+            name = f"SV-{update.id}" if table_name == CASE_TABLE_NAME else (update.id or "new")
+            lines.append(f"{table_name} {name}")
+            for key, value in update.updates.items():
+                lines.append(f"  {key}: {update.entry.get(key)!r} -> {value!r}")
+    return "\n".join(lines) or "No changes"
+
+
+def format_errors(errors: List[ValidationError]) -> str:
+    return "\n".join(f"{err.source.name}: {err.field} {err.comment}" for err in errors) or "No validation errors"
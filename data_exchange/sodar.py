@@ -1,5 +1,4 @@
 from loguru import logger
-from sodar_cli import api
 
 from .config import settings
 from io import StringIO
@@ -17,6 +16,8 @@ def parse_samplesheet(raw_data):
 
 
 def get_data():
+    from sodar_cli import api
+
     logger.debug("Loading SODAR")
     sodar_data = []
     for project in settings.sodar.project:
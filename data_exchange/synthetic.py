@@ -0,0 +1,362 @@
+"""Generate synthetic source data with realistic shapes.
+
+The generated data mirrors what the Baserow, SODAR, VarFish and SAMS getters
+return, so that the matching and validation stages can be run and timed at
+arbitrary scale without access to any of the services.
+"""
+import datetime
+import random
+import uuid
+from typing import Callable, Dict, List
+
+from attrs import define, field
+
+from .baserow import COLUMN_CLINVAR_REASON, COLUMN_CLINVAR_STATUS, STATUS_ORDER, VALI_BLOCKED, VALI_FAIL, VALI_OK
+from .updates import BASEROW_ACMG_CLASSIFICATION, to_position_key, to_sv_position_key
+from .varfish import HPO_INHERITANCE_MAPPING, VARFISH_DEFAULT_LOCATION, VARFISH_STATUS_TO_BASEROW
+
+FIRSTNAMES = ["Anna", "Ben", "Clara", "David", "Emma", "Felix", "Greta", "Hannah", "Jonas", "Lea", "Lukas", "Mia", "Noah", "Paul", "Sophie", "Tim"]
+LASTNAMES = ["Müller", "Schmidt", "Schneider", "Fischer", "Weber", "Meyer", "Wagner", "Becker", "Schulz", "Hoffmann", "Koch", "Richter", "Klein", "Wolf", "Schröder", "Neumann"]
+GENES = [("BRCA1", "NM_007294.4"), ("SCN1A", "NM_001165963.4"), ("CFTR", "NM_000492.4"), ("MECP2", "NM_004992.4"), ("KMT2D", "NM_003482.4"), ("ARID1B", "NM_020732.3")]
+HPO_TERMS = [("HP:0001250", "Seizure"), ("HP:0001263", "Global developmental delay"), ("HP:0000252", "Microcephaly"), ("HP:0001508", "Failure to thrive"), ("HP:0000729", "Autistic behavior")]
+CONTRACTS = ["Selektivvertrag", "Beratung", "Keiner", "Forschung", "Labor Berlin Befund"]
+CASE_TYPES = ["Exom", "Genom", "Beratung", "Re-Analyse Exom"]
+ANALYSIS_COUNTS = {1: "Single", 2: "Duo", 3: "Trio", 4: "Quattro"}
+RELATIONS = ["Index", "Mother", "Father", "Sibling"]
+PERSONNEL_COUNT = 20
+FINALIZED_STATUS = ("Solved", "VUS", "Unsolved")
+
+
+@define
+class SyntheticData:
+    cases: Dict[int, dict] = field(factory=dict)
+    findings: Dict[int, dict] = field(factory=dict)
+    lb: Dict[int, dict] = field(factory=dict)
+    patients: Dict[int, dict] = field(factory=dict)
+    personnel: Dict[int, dict] = field(factory=dict)
+    sodar: List[dict] = field(factory=list)
+    varfish: List[dict] = field(factory=list)
+    varfish_findings: Dict[str, List[dict]] = field(factory=dict)
+    sams: List[dict] = field(factory=list)
+
+    def baserow_tables(self) -> List[dict]:
+        """Tables in the format returned by baserow.get_data."""
+        tables = [
+            (579, "Cases", self.cases),
+            (582, "Personnel", self.personnel),
+            (581, "Findings", self.findings),
+            (660, "LB-Metadata", self.lb),
+            (580, "Patients", self.patients),
+        ]
+        return [{"id": table_id, "name": name, "data": data} for table_id, name, data in tables]
+
+    def sources(self) -> Dict[str, Callable]:
+        """Source getters usable in place of data_exchange.ALL_DATA."""
+        return {
+            "baserow": self.baserow_tables,
+            "sodar": lambda: self.sodar,
+            "varfish": lambda: self.varfish,
+            "varfish_findings": lambda uuids: {u: self.varfish_findings[u] for u in uuids},
+            "sams": lambda: self.sams,
+        }
+
+
+def lb_id(num: int) -> str:
+    return f"{10 + num // 9999:02d}-{num % 9999 + 1:04d}"
+
+
+def random_date(rng: random.Random, start_year: int, end_year: int) -> datetime.date:
+    start = datetime.date(start_year, 1, 1)
+    return start + datetime.timedelta(days=rng.randrange((end_year - start_year) * 365))
+
+
+def create_personnel() -> Dict[int, dict]:
+    return {
+        pid: {
+            "Title": "Dr.",
+            "Firstname": FIRSTNAMES[pid % len(FIRSTNAMES)],
+            "Lastname": LASTNAMES[pid % len(LASTNAMES)],
+            "Email": f"person{pid}@example.org",
+            "Shorthand": f"P{pid:02d}",
+        }
+        for pid in range(1, PERSONNEL_COUNT + 1)
+    }
+
+
+def create_genotype(rng: random.Random, sample_names: List[str]) -> Dict[str, dict]:
+    genotype = {}
+    for name in sample_names:
+        gt = rng.choice(["0/1", "0/1", "1/1", "0/0"])
+        dp = rng.randint(20, 80)
+        ad = dp // 2 if gt == "0/1" else (dp if gt == "1/1" else 0)
+        genotype[name] = {"gt": gt, "ad": ad, "dp": dp}
+    # the index always carries the variant
+    genotype[sample_names[0]]["gt"] = "0/1"
+    genotype[sample_names[0]]["ad"] = genotype[sample_names[0]]["dp"] // 2
+    return genotype
+
+
+def create_smallvar(rng: random.Random, sample_names: List[str], terms: List[str]) -> dict:
+    gene, transcript = rng.choice(GENES)
+    pos = rng.randint(10_000, 200_000_000)
+    ref, alt = rng.sample("ACGT", 2)
+    hgvs_c = f"c.{rng.randint(1, 5000)}{ref}>{alt}"
+    hgvs_p = f"p.Arg{rng.randint(1, 1500)}Ter"
+    variant_terms = [rng.choice(list(HPO_INHERITANCE_MAPPING)), f"OMIM:{rng.randint(100000, 699999)}"]
+    return {
+        "release": VARFISH_DEFAULT_LOCATION,
+        "chromosome": str(rng.randint(1, 22)),
+        "start": pos,
+        "end": pos,
+        "reference": ref,
+        "alternative": alt,
+        "gene_symbol": gene,
+        "hgnc_id": f"HGNC:{rng.randint(1, 50000)}",
+        "transcript_id": transcript,
+        "hgvs_c": hgvs_c,
+        "hgvs_p": hgvs_p,
+        "effect": ["missense_variant"],
+        "flag_final_causative": rng.random() < 0.8,
+        "flag_incidental": rng.random() < 0.1,
+        "flag_candidate": rng.random() < 0.2,
+        "acmg_class_auto": rng.randint(1, 5),
+        "acmg_class_override": rng.choice([None, 3, 4, 5]),
+        "genotype": create_genotype(rng, sample_names),
+        "comment_text": " ".join(variant_terms),
+        "variant_terms": variant_terms,
+        "case_terms": terms,
+        "inheritance": HPO_INHERITANCE_MAPPING[variant_terms[0]],
+        "inheritance_status": rng.choice(["de novo", "maternal vererbt", "paternal vererbt", ""]),
+        "acmg_eval_date": random_date(rng, 2022, 2025).isoformat(),
+        "mehari": {"result": [{
+            "gene_symbol": gene,
+            "hgvs_t": hgvs_c,
+            "hgvs_p": hgvs_p,
+            "feature_id": transcript,
+        }]},
+    }
+
+
+def create_sv(rng: random.Random, sample_names: List[str], terms: List[str]) -> dict:
+    start = rng.randint(10_000, 200_000_000)
+    sv_type = rng.choice(["DEL", "DUP"])
+    return {
+        "release": VARFISH_DEFAULT_LOCATION,
+        "chromosome": str(rng.randint(1, 22)),
+        "start": start,
+        "end": start + rng.randint(1_000, 2_000_000),
+        "sv_type": sv_type,
+        "sv_sub_type": sv_type,
+        "sodar_uuid": str(uuid.UUID(int=rng.getrandbits(128))),
+        "flag_final_causative": True,
+        "flag_incidental": False,
+        "flag_candidate": False,
+        "comment_text": "",
+        "comment": "",
+        "variant_terms": [],
+        "case_terms": terms,
+        "inheritance": None,
+        "details": {"payload": {
+            "ovl_genes": [{"symbol": rng.choice(GENES)[0]}],
+            "call_info": {name: {"genotype": "0/1"} for name in sample_names},
+        }},
+    }
+
+
+def variant_to_finding(rng: random.Random, variant: dict, case_id: int) -> dict:
+    if "sv_type" in variant:
+        position = to_sv_position_key(variant)
+        gene, mutation = variant["details"]["payload"]["ovl_genes"][0]["symbol"], {"DEL": "Deletion", "DUP": "Duplikation"}[variant["sv_type"]]
+    else:
+        position = to_position_key(variant)
+        gene, mutation = variant["gene_symbol"], f"{variant['hgvs_c']} {variant['hgvs_p']}"
+    # part of all findings have been entered manually without position
+    filled = rng.random() < 0.7
+    return {
+        "Genename": gene,
+        "NM Transcript": variant.get("transcript_id", ""),
+        "Mutation": mutation,
+        "ACMG Classification": rng.choice(list(BASEROW_ACMG_CLASSIFICATION.values())) if filled else "",
+        "Zygosity": "Heterozygous" if filled else "",
+        "ResultType": rng.choice(["Main", "Main", "Incidental", "Research"]),
+        "Inheritance": variant["inheritance"] or "",
+        "de novo/vererbt": "",
+        "Position (VCF)": position if filled else "",
+        "OMIM": " ".join(t for t in variant["variant_terms"] if t.startswith("OMIM")) if filled else "",
+        "HPO Terms": ";".join(variant["case_terms"]) if filled else "",
+        "EvaluationDate": "",
+        "PMIDs": "",
+        "Clinvar-ID": rng.choice(["", "", "SCV000123456"]),
+        "Clinvar-Upload-Key": "",
+        "Clinvar-Errors": "",
+        "Multiple Condition Explanation": "",
+        "Interpretation (ClinVar)": "",
+        "Cases": [case_id],
+    }
+
+
+def create_case_entry(rng: random.Random, case_id: int, index: dict, family_size: int, status: str, personnel_ids: List[int]) -> dict:
+    def persons():
+        return rng.sample(personnel_ids, rng.randint(0, 2))
+
+    return {
+        "LB ID": index["LB ID"] if rng.random() < 0.9 else "",
+        "Datum Labor": random_date(rng, 2022, 2025).isoformat() if rng.random() < 0.5 else "",
+        "Datum Einschluss": random_date(rng, 2021, 2025).isoformat(),
+        "Datum Befund": random_date(rng, 2022, 2025).isoformat() if status in FINALIZED_STATUS else "",
+        "Analysezahl": ANALYSIS_COUNTS[family_size] if rng.random() < 0.8 else "",
+        "Firstname": index["Firstname"],
+        "Lastname": index["Lastname"],
+        "Birthdate": index["Birthdate"],
+        "Gender": index["Gender"],
+        "Varfish": "",
+        "Batch": "",
+        "Case Status": status,
+        COLUMN_CLINVAR_STATUS: rng.choice(["", VALI_OK, VALI_FAIL, VALI_BLOCKED]),
+        COLUMN_CLINVAR_REASON: [],
+        "AutoValidation": "",
+        "Findings": [],
+        "Clinician": persons(),
+        "First Look": persons(),
+        "Second Look": persons(),
+        "Validator": persons(),
+        "Vertrag": rng.choice(CONTRACTS),
+        "Falltyp": rng.choice(CASE_TYPES),
+        "FK1": "x" if rng.random() < 0.7 else "",
+        "FK2": "x" if rng.random() < 0.5 else "",
+        "Zufallsbefunde": rng.random() < 0.5,
+        "EV kontrolliert": rng.random() < 0.5,
+        "Teilnahmeerklärung versendet": "",
+        "Abrechnung freigegeben": "",
+        "Datenverarbeitung": rng.random() < 0.8,
+        "HPO Terms": "",
+    }
+
+
+def generate(num_cases: int = 1000, max_family_size: int = 4, seed: int = 0) -> SyntheticData:
+    """Generate source data for num_cases index cases.
+
+    Every case is a family of 1 to max_family_size persons, which appear in
+    LB-Metadata, Patients, SODAR and VarFish as their case progresses.
+    """
+    from varfish_cli.api.models import Case, PedigreeMember
+
+    rng = random.Random(seed)
+    data = SyntheticData(personnel=create_personnel())
+    personnel_ids = list(data.personnel)
+    sodar_project = {"uuid": str(uuid.UUID(int=rng.getrandbits(128))), "name": "Synthetic", "data_type": "Exom", "data": []}
+    varfish_project = {"uuid": sodar_project["uuid"], "cases": []}
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    person_num = 0
+    finding_id = 1
+    for case_id in range(1, num_cases + 1):
+        family_size = rng.randint(1, max_family_size)
+        members = []
+        for member_num in range(family_size):
+            members.append({
+                "LB ID": lb_id(person_num),
+                "Firstname": rng.choice(FIRSTNAMES),
+                "Lastname": rng.choice(LASTNAMES),
+                "Birthdate": random_date(rng, 1950, 2022),
+                "Gender": rng.choice(["m", "f"]),
+                "Relation": RELATIONS[min(member_num, len(RELATIONS) - 1)],
+            })
+            person_num += 1
+        index = members[0]
+        index_id = index["LB ID"]
+        index_entry = {**index, "Birthdate": index["Birthdate"].isoformat(), "Gender": {"m": "Male", "f": "Female"}[index["Gender"]]}
+        status = rng.choice(STATUS_ORDER[2:])
+        data.cases[case_id] = create_case_entry(rng, case_id, index_entry, family_size, status, personnel_ids)
+        lab_date = random_date(rng, 2022, 2025).strftime("%d.%m.%Y")
+
+        sample_names = [f"{m['LB ID']}-N1-DNA1-WES1" for m in members]
+        mother = sample_names[1] if family_size > 1 else "0"
+        father = sample_names[2] if family_size > 2 else "0"
+        for member, sample_name in zip(members, sample_names):
+            data.lb[len(data.lb) + 1] = {
+                "LB ID": member["LB ID"],
+                "Index ID": index_id,
+                "Firstname": member["Firstname"],
+                "Lastname": member["Lastname"],
+                "Birthdate": member["Birthdate"].strftime("%d.%m.%Y"),
+                "Gender": member["Gender"],
+                "Material": "Blut",
+                "Datum Labor": lab_date,
+            }
+            if rng.random() < 0.5:
+                data.patients[len(data.patients) + 1] = {
+                    "Lastname": member["Lastname"],
+                    "Firstname": member["Firstname"],
+                    "Birthdate": member["Birthdate"].isoformat(),
+                    "Gender": {"m": "Male", "f": "Female"}[member["Gender"]],
+                    "Affected": member is index,
+                    "Tested": True,
+                    "LB ID": member["LB ID"],
+                    "Index ID": index_id,
+                    "SAP ID": "",
+                    "Material": "Blut",
+                    "Cases": [case_id] if member is index else [],
+                    "RelationToIndex": member["Relation"] if rng.random() < 0.5 else "",
+                }
+
+        # sequenced cases are in SODAR and VarFish
+        if status == "Storniert" or rng.random() < 0.1:
+            continue
+        batch = f"Batch{case_id // 50}"
+        for member, sample_name in zip(members, sample_names):
+            is_index = member is index
+            sodar_project["data"].append({
+                "Sample Name": sample_name,
+                "Characteristics[Family]": f"FAM_{index_id}",
+                "Characteristics[Batch]": batch,
+                "Characteristics[Father]": father if is_index else "0",
+                "Characteristics[Mother]": mother if is_index else "0",
+            })
+        varfish_uuid = str(uuid.UUID(int=rng.getrandbits(128)))
+        pedigree = [
+            PedigreeMember(
+                name=sample_name,
+                father=father if member is index else "0",
+                mother=mother if member is index else "0",
+                sex={"m": 1, "f": 2}[member["Gender"]],
+                affected=2 if member is index else 1,
+                has_gt_entries=True,
+            )
+            for member, sample_name in zip(members, sample_names)
+        ]
+        varfish_status = {v: k for k, v in VARFISH_STATUS_TO_BASEROW.items()}.get(status, "active")
+        varfish_project["cases"].append(Case(
+            sodar_uuid=varfish_uuid,
+            date_created=now,
+            date_modified=now,
+            name=f"FAM_{index_id}",
+            index=sample_names[0],
+            pedigree=pedigree,
+            status=varfish_status,
+        ))
+
+        terms = [t for t, _ in rng.sample(HPO_TERMS, 2)]
+        data.sams.append({
+            "subject": {"id": f"SV-{case_id}"},
+            "phenotypicFeatures": [{"type": {"id": t, "label": l}, "excluded": 0} for t, l in HPO_TERMS if t in terms],
+        })
+
+        variants = []
+        if status in FINALIZED_STATUS:
+            data.cases[case_id]["Varfish"] = varfish_uuid if rng.random() < 0.9 else ""
+            variants = [create_smallvar(rng, sample_names, terms) for _ in range(rng.randint(0, 3))]
+            if rng.random() < 0.1:
+                variants.append(create_sv(rng, sample_names, terms))
+        data.varfish_findings[varfish_uuid] = variants
+
+        # most flagged variants have already been entered as findings
+        for variant in variants:
+            if rng.random() < 0.8:
+                data.findings[finding_id] = variant_to_finding(rng, variant, case_id)
+                data.cases[case_id]["Findings"].append(finding_id)
+                finding_id += 1
+
+    data.sodar.append(sodar_project)
+    data.varfish.append(varfish_project)
+    return data
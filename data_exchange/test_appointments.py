@@ -0,0 +1,142 @@
+import datetime
+import json
+import os
+import random
+import sys
+
+import pytest
+
+from . import appointments
+from .appointments import AppointmentState, CaseNameIndex, NameInfo, begins_between, create_name_info_baserow_data, match_patient_name, sync_appointments
+
+FAKE_MDB_JSON = """#!{python}
+import json, sys
+mdb_path, table = sys.argv[1:]
+with open(mdb_path + ".calls", "a") as f:
+    f.write(table + "\\n")
+with open(mdb_path) as f:
+    for row in json.load(f)[table]:
+        print(json.dumps(row))
+"""
+
+
+def termin(patient_id, name, date, present=1, info="CADS Beratung"):
+    begin = date.strftime("%m/%d/%y 09:00:00")
+    return {
+        "Datum_Beginn": begin,
+        "Datum_Ende": date.strftime("%m/%d/%y 10:00:00"),
+        "Farb_Id": 3,
+        "Resources": "D1;",
+        "Info": info,
+        "Name": name,
+        "Patient_Id": patient_id,
+        "Status_Id": 0,
+        "Anwesend": present,
+    }
+
+
+class FakeClient:
+    def __init__(self):
+        self.writes = []
+        self.batches = 0
+
+    def add_data_batch(self, table_id, entries):
+        self.batches += 1
+        ids = []
+        for entry in entries:
+            self.writes.append((entry.get("id"), dict(entry)))
+            ids.append(entry.get("id") or 100 + len(self.writes))
+        return ids
+
+
+@pytest.fixture
+def mdb(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "mdb-json"
+    script.write_text(FAKE_MDB_JSON.format(python=sys.executable))
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    client = FakeClient()
+    cases = {1: {"Firstname": "", "Lastname": "", "Birthdate": None, "Clinician": [], "Datum Einschluss": None}}
+    monkeypatch.setattr(appointments, "get_client", lambda: client)
+    monkeypatch.setattr(appointments, "get_table", lambda name, include: cases if name == "Cases" else {7: {"Lastname": "Smith"}})
+
+    path = tmp_path / "Arztpra2.MDB"
+
+    def write(termine):
+        doctors = [{"hidden": 0, "Type": 0, "Kennummer": 1, "Farb_Id": 3, "Name": "Dr. Smith"}]
+        path.write_text(json.dumps({"DocRooms": doctors, "Termine": termine}))
+
+    return path, write, client
+
+
+def test_begins_between():
+    first, last = datetime.date(2024, 3, 1), datetime.date(2024, 3, 31)
+    assert begins_between(b'{"Datum_Beginn":"03/14/24 09:30:00"}', first, last)
+    assert not begins_between(b'{"Datum_Beginn":"02/14/24 09:30:00"}', first, last)
+    assert not begins_between(b'{"Datum_Beginn":"03/14/98 09:30:00"}', first, last)
+    assert begins_between(b'{"Datum_Beginn":null}', first, last)
+
+
+def test_case_name_index():
+    rng = random.Random(3)
+    names = ["Doe", "Roe", "Smith", "", None]
+    dobs = ["1990-01-02", "1985-03-04", None]
+    cases = {
+        row_id: {"Firstname": rng.choice(names), "Lastname": rng.choice(names), "Birthdate": rng.choice(dobs)}
+        for row_id in rng.sample(range(1000), 200)
+    }
+    index = CaseNameIndex(cases)
+    for _ in range(200):
+        dob = rng.choice(dobs)
+        name_info = NameInfo(rng.choice(names), rng.choice(names), dob and datetime.date.fromisoformat(dob))
+        expected = None
+        for row_id, data in cases.items():
+            if match_patient_name(name_info, create_name_info_baserow_data(data)):
+                expected = row_id
+        assert index.find(name_info) == expected
+
+
+def test_sync_appointments_incremental(tmp_path, mdb):
+    path, write, client = mdb
+    state_path = tmp_path / "state.json"
+    calls = path.with_name(path.name + ".calls")
+    today = datetime.date.today()
+
+    write([
+        termin(1, "Doe, John 01.02.1990", today - datetime.timedelta(days=2)),
+        termin(2, "Old, Anna 01.02.1980", today - datetime.timedelta(days=90)),
+        termin(3, "Absent, Max 01.02.1970", today, present=0),
+    ])
+    report = sync_appointments(str(path), state_path)
+    assert client.writes == [(1, {"id": 1, "Firstname": "John", "Lastname": "Doe", "Birthdate": "1990-02-01", "Clinician": [7], "Datum Einschluss": (today - datetime.timedelta(days=2)).isoformat()})]
+    assert report[0].startswith("Terminland Baserow Sync")
+    assert [key.split(":")[0] for key in AppointmentState.load(state_path).processed] == ["1"]
+
+    # unchanged file is not read again
+    calls.write_text("")
+    assert sync_appointments(str(path), state_path) == []
+    assert calls.read_text() == ""
+
+    # changed file, only the new appointment is synced
+    write([
+        termin(1, "Doe, John 01.02.1990", today - datetime.timedelta(days=2)),
+        termin(4, "Roe, Jane 03.04.1985", today),
+        termin(5, "Roe, Jane 03.04.1985", today),
+        termin(6, "Doe, John 01.02.1990", today),
+    ])
+    os.utime(path, (1, 1))
+    report = sync_appointments(str(path), state_path)
+    assert [data["Lastname"] for _, data in client.writes] == ["Doe", "Roe", "Roe"]
+    assert client.batches == 2
+    # the same new patient twice creates two cases, as before
+    assert report[1:] == ["Created new entries:"] + [f"{row_id}: Jane Roe 1985-04-03 - Termin {today.isoformat()}" for row_id in (102, 103)]
+
+    # nothing new, Baserow and the doctors are not loaded
+    os.utime(path, (2, 2))
+    calls.write_text("")
+    assert sync_appointments(str(path), state_path) == []
+    assert calls.read_text() == "Termine\n"
+    assert client.batches == 2
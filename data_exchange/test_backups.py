@@ -0,0 +1,54 @@
+import datetime
+
+import pytest
+
+from .backups import BackupStore, InvalidPasswordError
+
+
+def cases(count, changed=()):
+    return {
+        row_id: {"Lastname": f"Name {row_id}" + (" changed" if row_id in changed else ""), "Findings": [row_id]}
+        for row_id in range(1, count + 1)
+    }
+
+
+def chunk_files(store):
+    return {p.name for p in (store.directory / "chunks").glob("*/*")}
+
+
+@pytest.mark.parametrize("password", [None, b"secret"])
+def test_incremental_backups(tmp_path, password):
+    store = BackupStore(tmp_path, password)
+    first = store.write_backup([("Cases", ["Lastname", "Findings"], cases(1000)), ("Personnel", ["Name"], {1: {"Name": "A"}})], chunk_size=100)
+    assert len(chunk_files(store)) == 12
+
+    # a changed row and an added row only write their chunks
+    second = store.write_backup([("Cases", ["Lastname", "Findings"], cases(1001, changed={5})), ("Personnel", ["Name"], {1: {"Name": "A"}})], chunk_size=100)
+    assert len(chunk_files(store)) == 14
+    assert len(first.chunks & second.chunks) == 10
+
+    assert store.read_table(store.manifest(first.id), "Cases") == cases(1000)
+    assert store.read_table(store.manifest("latest"), "Cases") == cases(1001, changed={5})
+
+    if password:
+        assert b"Name 1" not in b"".join(p.read_bytes() for p in (tmp_path / "chunks").glob("*/*"))
+        with pytest.raises(InvalidPasswordError):
+            BackupStore(tmp_path, b"wrong")
+        with pytest.raises(InvalidPasswordError):
+            BackupStore(tmp_path)
+
+
+def test_prune_and_collect_garbage(tmp_path):
+    store = BackupStore(tmp_path)
+    for day in ["2024-01-10", "2024-01-20", "2024-02-05", "2024-03-01", "2024-03-02"]:
+        manifest = store.write_backup([("Cases", ["Lastname"], cases(3, changed={int(day[-1])}))])
+        store.manifest_path(manifest.id).rename(store.manifest_path(f"{day}_02-00-00"))
+
+    removed = store.prune(keep_days=1, keep_months=2, today=datetime.date(2024, 3, 2))
+    assert removed == ["2024-01-10_02-00-00", "2024-01-20_02-00-00", "2024-03-01_02-00-00"]
+    assert store.backup_ids() == ["2024-02-05_02-00-00", "2024-03-02_02-00-00"]
+
+    # the unchanged chunk of January is still used by 2024-02-05
+    assert store.collect_garbage() == 1
+    for backup_id in store.backup_ids():
+        store.read_table(store.manifest(backup_id), "Cases")
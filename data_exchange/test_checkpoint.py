@@ -0,0 +1,70 @@
+import datetime
+import json
+import pickle
+
+import pytest
+
+from . import checkpoint, run
+from .baserow import merge_updates
+from .checkpoint import CheckpointNotFoundError, Checkpoints, prune
+from .synthetic import generate
+from .validation import RULES
+
+
+def updates_by_id(updates):
+    return {u.id: u.updates for u in merge_updates(updates) if u.has_updates and u.id is not None}
+
+
+def test_resume_skips_completed_stages(tmp_path):
+    data = generate(num_cases=20, seed=2)
+    options = {"dry_run": True, "get_sodar": True, "get_varfish": False, "get_sams": True}
+    _, expected_updates, _, expected_errors = run(**options, sources=data.sources())
+
+    def fail():
+        raise ConnectionError("SAMS unavailable")
+
+    checkpoints = checkpoint.enable(Checkpoints.create(tmp_path, options))
+    try:
+        with pytest.raises(ConnectionError):
+            run(**options, sources={**data.sources(), "sams": fail})
+        assert checkpoints.completed == ["baserow", "lb", "sodar"]
+
+        def fetched_again():
+            raise AssertionError("completed stage was run again")
+
+        resumed = checkpoint.enable(Checkpoints.resume(tmp_path, checkpoints.run_id))
+        sources = {**data.sources(), "baserow": fetched_again, "sodar": fetched_again}
+        _, updates, _, errors = run(**options, sources=sources)
+    finally:
+        checkpoint.disable()
+
+    assert resumed.options == options
+    assert resumed.completed[-3:] == ["apply_cases", "apply_findings", "apply_patients"]
+    assert updates_by_id(updates) == updates_by_id(expected_updates)
+    assert [(e.source.name, e.field, e.comment) for e in errors] == [(e.source.name, e.field, e.comment) for e in expected_errors]
+
+
+def test_checkpoint_files_and_prune(tmp_path):
+    checkpoints = Checkpoints.create(tmp_path, {}, run_id="20240101-000000")
+    checkpoints.stage("baserow", lambda: {"Lastname": "Name"})
+    assert (checkpoints.run_dir / "baserow.pkl.gz").stat().st_mode & 0o777 == 0o600
+    assert checkpoints.run_dir.stat().st_mode & 0o777 == 0o700
+
+    recent = Checkpoints.create(tmp_path, {}, run_id="20240110-000000")
+    now = datetime.datetime.now()
+    manifest_path = checkpoints.run_dir / "manifest.json"
+    manifest = json.loads(manifest_path.read_text())
+    manifest_path.write_text(json.dumps({**manifest, "updated": (now - datetime.timedelta(days=10)).isoformat()}))
+    assert prune(tmp_path, 7, now=now) == ["20240101-000000"]
+    assert recent.run_dir.exists()
+    assert prune(tmp_path, 7, now=now + datetime.timedelta(days=8)) == ["20240110-000000"]
+
+
+def test_resume_unknown_run(tmp_path):
+    with pytest.raises(CheckpointNotFoundError):
+        Checkpoints.resume(tmp_path, "20240101-000000")
+
+
+def test_validation_rules_pickle_by_name():
+    for rule in RULES:
+        assert pickle.loads(pickle.dumps(rule)) is rule
@@ -0,0 +1,74 @@
+from .daemon import CachedSource, CachedTables, Job, SyncDaemon
+
+
+def test_cached_source():
+    calls = []
+
+    def getter():
+        calls.append(1)
+        return len(calls)
+
+    source = CachedSource(getter, ttl=60)
+    assert source() == 1
+    assert source() == 1
+    assert (source.hits, source.misses) == (1, 1)
+    source.clear()
+    assert source() == 2
+
+    uncached = CachedSource(getter, ttl=0)
+    assert uncached() == 3
+    assert uncached() == 4
+
+
+def test_cached_source_by_id():
+    requested = []
+
+    def getter(ids):
+        requested.append(list(ids))
+        return {i: i * 2 for i in ids}
+
+    source = CachedSource(getter, ttl=60)
+    assert source([1, 2]) == {1: 2, 2: 4}
+    assert source([2, 3]) == {2: 4, 3: 6}
+    assert requested == [[1, 2], [3]]
+
+
+def test_cached_tables():
+    fetched = []
+
+    def get_data(names=None):
+        fetched.append(names or "all")
+        tables = [{"id": 1, "name": "Cases", "data": {1: {}}}, {"id": 2, "name": "LB-Metadata", "data": {1: {}}}]
+        return [t for t in tables if names is None or t["name"] in names]
+
+    tables = CachedTables(get_data, ttl=60)
+    first = tables()
+    # rows changed by a run are not seen by later runs
+    first[0]["data"][1]["id"] = 1
+    assert tables() == [{"id": 1, "name": "Cases", "data": {1: {}}}, {"id": 2, "name": "LB-Metadata", "data": {1: {}}}]
+    tables.invalidate(["Cases"])
+    assert [t["name"] for t in tables()] == ["Cases", "LB-Metadata"]
+    assert fetched == ["all", ["Cases"]]
+    assert (tables.hits, tables.misses) == (3, 3)
+
+
+def test_sync_daemon_run_job():
+    baserow = CachedTables(lambda names=None: [{"id": 1, "name": "Cases", "data": {}}, {"id": 2, "name": "Personnel", "data": {}}], ttl=60)
+    baserow()
+
+    def failing():
+        raise RuntimeError("Login failed")
+
+    ok = Job("sync", 60, lambda: None, writes=("Cases",))
+    broken = Job("appointments", 60, failing)
+    daemon = SyncDaemon([ok, broken], {"baserow": baserow})
+
+    daemon.run_job(broken)
+    assert baserow._valid("Cases")
+    assert daemon.health()["status"] == "failing"
+    assert broken.last_error == "RuntimeError: Login failed"
+    assert 'data_exchange_job_failures_total{job="appointments"} 1' in daemon.metrics()
+
+    daemon.run_job(ok)
+    assert not baserow._valid("Cases") and baserow._valid("Personnel")
+    assert ok.runs == 1 and ok.next_run > 0
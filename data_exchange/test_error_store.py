@@ -0,0 +1,63 @@
+import datetime
+
+from .config import settings
+from .error_store import ErrorStore
+from .report import iter_diff_report, write_validation_report
+from .validation import ValidationError, get_rule
+
+CLINVAR = get_rule("ClinVar Upload")
+FIRST_LOOK = get_rule("First Look bestimmen")
+
+
+def make_error(rule, case_id, field, comment, responsible=("AB",)):
+    entry = {"id": case_id, rule.responsible.value: [{"Shorthand": s} for s in responsible]}
+    return ValidationError(rule, entry, field, "", "", comment)
+
+
+def test_error_diff(tmp_path):
+    first_run = [
+        make_error(CLINVAR, 1, "Findings/10", " OMIM fehlt"),
+        make_error(CLINVAR, 1, "Findings/10", " HPO fehlt"),
+        make_error(FIRST_LOOK, 2, "First Look", "Fehlt", responsible=("CD",)),
+    ]
+    with ErrorStore(tmp_path / "errors.sqlite") as store:
+        diff = store.update(first_run, now=datetime.datetime(2024, 1, 1))
+        assert (len(diff.new), len(diff.resolved), len(diff.unchanged)) == (3, 0, 0)
+
+    second_run = first_run[1:] + [make_error(CLINVAR, 3, "Findings/11", " ACMG fehlt")]
+    with ErrorStore(tmp_path / "errors.sqlite") as store:
+        # dry runs report the changes without saving them
+        assert store.update(second_run, save=False).has_changes
+        diff = store.update(second_run, now=datetime.datetime(2024, 1, 2))
+        assert [e.entry_id for e in diff.new] == [3]
+        assert [(e.case_id, e.comment, e.responsible, e.first_seen) for e in diff.resolved] == [(1, " OMIM fehlt", ["AB"], "2024-01-01T00:00:00")]
+        assert len(diff.unchanged) == 2
+        assert not store.update(second_run).has_changes
+
+    assert list(iter_diff_report(diff)) == [
+        "Validierung: 1 neu, 1 behoben, 2 unverändert",
+        "AB",
+        "  neu: SV-3 ClinVar Upload: Findings/11  ACMG fehlt",
+        "  behoben: SV-1 ClinVar Upload: Findings/10  OMIM fehlt",
+    ]
+    assert "CD" in iter_diff_report(diff, full=True)
+
+
+def test_daemon_error_store(tmp_path):
+    old = settings.validation.error_store, settings.serve.error_store
+    settings.set("validation.error_store", str(tmp_path / "cron.sqlite"))
+    settings.set("serve.error_store", str(tmp_path / "serve.sqlite"))
+    try:
+        errors = [make_error(CLINVAR, 1, "Findings/10", " OMIM fehlt")]
+        lines = []
+        write_validation_report(errors, lines.append, section="serve")
+        write_validation_report(errors, lines.append)
+        # the daemon does not consume the changes reported by cron runs
+        assert [l for l in lines if l.startswith("Validierung")] == ["Validierung: 1 neu, 0 behoben, 0 unverändert"] * 2
+        lines = []
+        write_validation_report([], lines.append, save=False)
+        write_validation_report([], lines.append)
+        assert [l for l in lines if l.startswith("Validierung")] == ["Validierung: 0 neu, 1 behoben, 0 unverändert"] * 2
+    finally:
+        settings.set("validation.error_store", old[0])
+        settings.set("serve.error_store", old[1])
@@ -0,0 +1,71 @@
+import io
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+
+from .baserow_client import BaserowClient
+from .export import XlsxWriter, column_name, export_tables
+from .mockserver import FaultConfig, MockServer
+from .mockserver.baserow import BaserowService
+
+NS = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+TABLES = [
+    {"id": 1, "name": "Cases", "data": {
+        row_id: {"Lastname": f"Name <{row_id}>", "Findings": [row_id, row_id + 1], "Age": row_id * 2}
+        for row_id in range(1, 51)
+    }},
+    {"id": 2, "name": "Findings", "data": {row_id: {"Gene": f"GENE{row_id}"} for row_id in range(1, 21)}},
+]
+
+
+def read_xlsx(data: bytes):
+    with zipfile.ZipFile(io.BytesIO(data)) as xlsx:
+        sheet = ElementTree.fromstring(xlsx.read("xl/worksheets/sheet1.xml"))
+    rows = []
+    for row in sheet.iterfind("s:sheetData/s:row", NS):
+        cells = {}
+        for cell in row.iterfind("s:c", NS):
+            text = cell.find("s:is/s:t", NS)
+            value = text.text if text is not None else cell.find("s:v", NS).text
+            cells[cell.get("r").rstrip("0123456789")] = value
+        rows.append(cells)
+    return rows
+
+
+def test_xlsx_writer():
+    assert [column_name(i) for i in (0, 25, 26, 27, 701, 702)] == ["A", "Z", "AA", "AB", "ZZ", "AAA"]
+
+    stream = io.BytesIO()
+    with XlsxWriter(stream, "Cases") as sheet:
+        sheet.write_row(["a", 1, None, True, "x\x01<y>"])
+    assert read_xlsx(stream.getvalue()) == [{"A": "a", "B": "1", "D": "1", "E": "x<y>"}]
+
+
+@pytest.mark.parametrize("password", [None, b"secret"])
+def test_export_tables(tmp_path, password):
+    if password:
+        pyzipper = pytest.importorskip("pyzipper")
+
+    path = tmp_path / "export.zip"
+    with MockServer(BaserowService(TABLES, FaultConfig(latency=0.01))) as server:
+        members = export_tables(path, [(1, "Cases"), (2, "Findings")], password=password, client=BaserowClient(server.url, "token"))
+    assert sorted(members) == ["Cases.xlsx", "Findings.xlsx"]
+
+    if password:
+        with pytest.raises(RuntimeError):
+            zipfile.ZipFile(path).read("Cases.xlsx")
+        archive = pyzipper.AESZipFile(path)
+        archive.setpassword(password)
+    else:
+        archive = zipfile.ZipFile(path)
+    with archive:
+        cases = read_xlsx(archive.read("Cases.xlsx"))
+        findings = read_xlsx(archive.read("Findings.xlsx"))
+
+    assert cases[0]["A"] == "BaserowID"
+    assert len(cases) == 51 and len(findings) == 21
+    header = {v: k for k, v in cases[0].items()}
+    assert cases[3][header["Lastname"]] == "Name <3>"
+    assert cases[3][header["Findings"]] == "[3, 4]"
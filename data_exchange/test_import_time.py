@@ -0,0 +1,31 @@
+import subprocess
+import sys
+
+# client libraries only needed once data is loaded from the respective source
+LAZY_MODULES = ["dynaconf", "python_baserow_simple", "requests", "lxml", "varfish_cli", "sodar_cli"]
+
+# generous upper bound, importing everything eagerly took about 0.7s
+IMPORT_TIME_BUDGET_US = 400_000
+
+
+def import_times(*args):
+    """Get cumulative import time in microseconds by module from python -X importtime."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args], capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_import_data_exchange():
+    times = import_times("-c", "import data_exchange, data_exchange.report, data_exchange.recording")
+    assert not [m for m in LAZY_MODULES if m in times]
+    assert times["data_exchange"] < IMPORT_TIME_BUDGET_US
+
+
+def test_cli_help():
+    times = import_times("-m", "data_exchange", "--help")
+    assert not [m for m in LAZY_MODULES if m in times]
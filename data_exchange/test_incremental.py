@@ -0,0 +1,52 @@
+import copy
+import time
+
+from . import run
+from .baserow import BaserowUpdate, get_baserow_table, merge_updates
+from .incremental import create_row_updates
+from .synthetic import generate
+from .webhook import DebouncedQueue, RecentWrites
+
+
+def test_create_row_updates_matches_full_run():
+    data = generate(num_cases=30, seed=3)
+    _, all_updates, _, _ = run(dry_run=True, get_sodar=False, get_varfish=False, get_sams=False, sources=data.sources())
+    full_updates = {u.id: u.updates for u in merge_updates(all_updates) if u.has_updates}
+
+    tables = copy.deepcopy(data.baserow_tables())
+    cases = get_baserow_table(tables, "Cases")
+    findings = get_baserow_table(tables, "Findings")
+    case_ids = sorted(cases)[::3]
+    selected = {cid: cases[cid] for cid in case_ids}
+    linked = {fid: findings[fid] for cid in case_ids for fid in cases[cid]["Findings"]}
+
+    row_updates, _ = create_row_updates(selected, linked, get_baserow_table(tables, "LB-Metadata"), get_baserow_table(tables, "Personnel"))
+    incremental_updates = {u.id: u.updates for u in merge_updates(row_updates) if u.has_updates}
+    assert incremental_updates == {cid: full_updates[cid] for cid in case_ids if cid in full_updates}
+
+
+def test_recent_writes():
+    writes = RecentWrites(ttl=60, field_names=lambda table: {"AutoValidation", "Lastname", "Case Status"})
+    writes.record("Cases", [BaserowUpdate(1, {"AutoValidation": ""}, {"AutoValidation": "Fehler"})])
+
+    old = {"id": 1, "AutoValidation": "", "Lastname": "Muster", "Last modified": "2024-01-01"}
+    own = {**old, "AutoValidation": "Fehler", "Last modified": "2024-01-02"}
+    assert writes.is_own_write("Cases", own, old)
+    assert not writes.is_own_write("Cases", {**own, "Lastname": "Meier"}, old)
+    assert not writes.is_own_write("Cases", {**own, "id": 2}, {**old, "id": 2})
+    assert not writes.is_own_write("Cases", own, None)
+
+
+def test_debounced_queue():
+    flushed = []
+    queue = DebouncedQueue(flushed.append, debounce=0.05, max_delay=1).start()
+    try:
+        queue.add("Cases", [1, 2])
+        queue.add("Findings", [5])
+        queue.add("Cases", [2, 3])
+        deadline = time.monotonic() + 2
+        while not flushed and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        queue.stop()
+    assert flushed == [{"Cases": {1, 2, 3}, "Findings": {5}}]
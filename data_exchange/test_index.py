@@ -0,0 +1,53 @@
+import pytest
+from .index import IntervalTree, RegionIndex, create_position_index, reciprocal_overlap
+
+
+def test_interval_tree_overlapping():
+    intervals = [(1, 10, "a"), (5, 20, "b"), (30, 40, "c"), (15, 100, "d")]
+    tree = IntervalTree(intervals)
+    assert sorted(v for _, _, v in tree.overlapping(8, 16)) == ["a", "b", "d"]
+    assert sorted(v for _, _, v in tree.overlapping(41, 50)) == ["d"]
+    assert tree.overlapping(101, 200) == []
+
+
+def test_interval_tree_matches_linear_scan():
+    intervals = [(i * 7 % 101, i * 7 % 101 + i % 13, i) for i in range(200)]
+    tree = IntervalTree(intervals)
+    for start, end in [(0, 5), (50, 60), (99, 120), (13, 13)]:
+        expected = sorted(v for s, e, v in intervals if s <= end and e >= start)
+        assert sorted(v for _, _, v in tree.overlapping(start, end)) == expected
+
+
+@pytest.mark.parametrize("left, right, expected", [
+    ((1, 100), (1, 100), 1.0),
+    ((1, 100), (51, 150), 0.5),
+    ((1, 100), (1, 400), 0.25),
+    ((1, 100), (101, 200), 0.0),
+])
+def test_reciprocal_overlap(left, right, expected):
+    assert reciprocal_overlap(left, right) == expected
+
+
+def test_region_index_best_match():
+    index = RegionIndex([
+        ("GRCh37", "1", 1000, 2000, "small"),
+        ("GRCh37", "1", 900, 2100, "large"),
+        ("GRCh37", "2", 1000, 2000, "other"),
+    ])
+    assert index.best_match("GRCh37", "1", 1000, 2000, 0.5) == "small"
+    assert index.best_match("GRCh37", "1", 1000, 2000, 0.5, accept=lambda v: v != "small") == "large"
+    assert index.best_match("GRCh37", "1", 5000, 6000, 0.5) is None
+    assert index.best_match("GRCh38", "1", 1000, 2000, 0.5) is None
+
+
+def test_position_index_keeps_all_findings():
+    findings = {
+        1: {"Position (VCF)": "GRCh37_1-100-A-G"},
+        2: {"Position (VCF)": ""},
+        3: {"Position (VCF)": "GRCh37_1-100-A-G"},
+        4: {"Position (VCF)": "GRCh37_2-5-C-T"},
+    }
+    assert create_position_index(findings) == {
+        "GRCh37_1-100-A-G": [1, 3],
+        "GRCh37_2-5-C-T": [4],
+    }
@@ -0,0 +1,81 @@
+import pytest
+import requests
+
+from .baserow import join_field_names, split_field_names
+from .baserow_client import BaserowClient
+from .mockserver import FaultConfig, MockServer
+from .mockserver.baserow import BaserowService
+
+TABLES = [{"id": 1, "name": "Cases", "data": {
+    row_id: {"Case Status": status, "Lastname": f"Name {row_id}", "Findings": [row_id]}
+    for row_id, status in enumerate(["Solved", "VUS", "Unsolved", "Active"] * 30, start=1)
+}}]
+
+
+def test_baserow_filtered_pages():
+    with MockServer(BaserowService(TABLES, FaultConfig(page_size=7))) as server:
+        client = BaserowClient(server.url, "token")
+        data = client.get_data(
+            1,
+            include=["Case Status", "Findings"],
+            filters=[("Case Status", "single_select_is_any_of", ["Solved", "VUS"])],
+        )
+        assert len(data) == 60
+        assert data[2] == {"Case Status": "VUS", "Findings": [2]}
+
+        row_ids = client.add_data_batch(1, [{"Case Status": "VUS"}, {"id": 2, "Case Status": "Solved"}])
+        assert row_ids[1] == 2
+        cases = client.get_data(1, include=["Case Status"])
+        assert cases[2] == {"Case Status": "Solved"}
+        assert cases[row_ids[0]] == {"Case Status": "VUS"}
+
+
+def test_baserow_include_names():
+    tables = [{"id": 2, "name": "Findings", "data": {
+        1: {"Genename": "ABC", 'HGVS "c", p': "c.1A>G", "Cases": [1]},
+    }}]
+    assert split_field_names(join_field_names(["Genename", 'HGVS "c", p'])) == ["Genename", 'HGVS "c", p']
+    with MockServer(BaserowService(tables)) as server:
+        client = BaserowClient(server.url, "token")
+        assert client.get_data(2, include=['HGVS "c", p', "Cases"]) == {1: {'HGVS "c", p': "c.1A>G", "Cases": [1]}}
+
+
+def test_baserow_field_keys():
+    with MockServer(BaserowService(TABLES)) as server:
+        url = f"{server.url}/api/database/rows/table/1/"
+        field_id = server.service.tables[1].fields_by_name["Lastname"]["id"]
+        # names only with user_field_names, field_<id> otherwise, as Baserow resolves them
+        by_name = requests.get(url, params={"user_field_names": "true", "include": "Lastname"}).json()["results"][0]
+        assert by_name == {"id": 1, "order": "1.00000000000000000000", "Lastname": "Name 1"}
+        by_id = requests.get(url, params={"user_field_names": "true", "include": f"field_{field_id}"}).json()["results"][0]
+        assert by_id == {"id": 1, "order": "1.00000000000000000000"}
+        by_id = requests.get(url, params={"include": f"field_{field_id}"}).json()["results"][0]
+        assert by_id == {"id": 1, "order": "1.00000000000000000000", f"field_{field_id}": "Name 1"}
+
+        requests.patch(f"{url}batch/", json={"items": [{"id": 1, "Lastname": "Ignored"}]})
+        requests.patch(f"{url}batch/?user_field_names=true", json={"items": [{"id": 2, f"field_{field_id}": "Ignored"}]})
+        assert [server.service.tables[1].rows[i]["Lastname"] for i in (1, 2)] == ["Name 1", "Name 2"]
+
+
+def test_fault_injection():
+    with MockServer(BaserowService(TABLES, FaultConfig(throttle_rate=1.0, retry_after=3))) as server:
+        resp = requests.get(f"{server.url}/api/database/fields/table/1/")
+        assert resp.status_code == 429
+        assert resp.headers["Retry-After"] == "3"
+
+
+def test_baserow_batches():
+    with MockServer(BaserowService(TABLES, FaultConfig())) as server:
+        client = BaserowClient(server.url, "token")
+        client.get_fields(1)
+        before = server.service.request_count
+        client.add_data_batch(1, [{"id": row_id, "Lastname": "Batch"} for row_id in range(1, 121)] * 4)
+        assert server.service.request_count - before == 3
+        assert all(row["Lastname"] == "Batch" for row in client.get_data(1, include=["Lastname"]).values())
+
+
+def test_baserow_error_status():
+    with MockServer(BaserowService(TABLES, FaultConfig(throttle_rate=1.0))) as server:
+        client = BaserowClient(server.url, "token")
+        with pytest.raises(requests.HTTPError, match="429"):
+            client._get_pages(f"{server.url}/api/database/rows/table/1/?user_field_names=true")
@@ -0,0 +1,127 @@
+import pytest
+
+from .baserow import BaserowUpdate
+from .config import settings
+from .ontology import OntologyIndex, build_index, get_ontology, normalize_term
+from .updates import update_finding_terms
+from .validation import check_ontology_terms, get_rule
+from .varfish import HPO_AD, HPO_INHERITANCE_MAPPING, hpos_to_inheritance
+
+HP_OBO = """format-version: 1.2
+ontology: hp
+
+[Term]
+id: HP:0000005
+name: Mode of inheritance
+
+[Term]
+id: HP:0000006
+name: Autosomal dominant inheritance
+alt_id: HP:0001415
+is_a: HP:0000005 ! Mode of inheritance
+
+[Term]
+id: HP:0001470
+name: Sex-limited autosomal dominant
+is_a: HP:0000006 ! Autosomal dominant inheritance
+
+[Term]
+id: HP:0001250
+name: Seizure
+
+[Term]
+id: HP:0000001
+name: obsolete Old seizure term
+is_obsolete: true
+replaced_by: HP:0000002
+
+[Term]
+id: HP:0000002
+name: obsolete Intermediate term
+is_obsolete: true
+replaced_by: HP:0001250
+
+[Term]
+id: HP:0000003
+name: obsolete Term without replacement
+is_obsolete: true
+
+[Typedef]
+id: part_of
+name: part of
+"""
+
+MONDO_OBO = """format-version: 1.2
+
+[Term]
+id: MONDO:0007739
+name: Huntington disease
+xref: OMIM:143100 {source="MONDO:equivalentTo"}
+xref: Orphanet:399 {source="MONDO:equivalentTo"}
+xref: OMIM:999999 {source="MONDO:relatedTo"}
+"""
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    (tmp_path / "hp.obo").write_text(HP_OBO)
+    (tmp_path / "mondo.obo").write_text(MONDO_OBO)
+    path = tmp_path / "ontology.idx"
+    assert build_index([tmp_path / "hp.obo", tmp_path / "mondo.obo"], path, HPO_INHERITANCE_MAPPING) == 11
+    return path
+
+
+@pytest.fixture
+def configured_ontology(index_path):
+    settings.set("ontology.index_file", str(index_path))
+    get_ontology.cache_clear()
+    yield get_ontology()
+    settings.set("ontology.index_file", "")
+    get_ontology.cache_clear()
+
+
+def test_normalize_term():
+    assert normalize_term("HPO:6") == "HP:0000006"
+    assert normalize_term("HP0001250") == "HP:0001250"
+    assert normalize_term("OMIM:0143100") == "OMIM:143100"
+    assert normalize_term("Gene ABC") is None
+
+
+def test_lookup(index_path):
+    index = OntologyIndex(index_path)
+    assert index.metadata["sources"] == ["hp.obo", "mondo.obo"]
+    assert index.is_complete("HP:9999999") and not index.is_complete("OMIM:999999")
+
+    term = index.lookup("HPO:0001470")
+    assert (term.id, term.label, term.obsolete, term.inheritance) == ("HP:0001470", "Sex-limited autosomal dominant", False, HPO_AD)
+    assert index.lookup("HP:0001415").current_id == HPO_AD
+    assert index.lookup("HP:0000001").current_id == "HP:0001250"
+    assert index.lookup("HP:0000003").obsolete and index.lookup("HP:0000003").replaced_by is None
+    assert index.lookup("OMIM:143100").label == "Huntington disease"
+    assert index.lookup("ORPHA:399").label == "Huntington disease"
+    assert "OMIM:999999" not in index
+    assert "HP:9999999" not in index
+
+    assert index.normalize_text("HPO:1415, HP0000001; OMIM:143100 unklar") == "HP:0000006, HP:0001250; OMIM:143100 unklar"
+    index.close()
+
+
+def test_configured_ontology(configured_ontology):
+    assert hpos_to_inheritance(["HP:0001470", "HP:0001250"]) == HPO_INHERITANCE_MAPPING[HPO_AD]
+
+    findings = {
+        1: {"id": 1, "HPO Terms": "HPO:0001250;HP:0000001", "OMIM": "OMIM:143100", "Cases": [10]},
+        2: {"id": 2, "HPO Terms": "HP:0001250", "OMIM": "", "Cases": [10]},
+    }
+    varfish_update = BaserowUpdate(2, findings[2], {"OMIM": "OMIM:999999;HP:0000003;HP:9999999"})
+    updates = update_finding_terms(findings, [varfish_update], configured_ontology)
+    assert [(u.id, u.updates) for u in updates] == [(1, {"HPO Terms": "HP:0001250;HP:0001250"})]
+
+    rule = get_rule("Ontologie-Terme")
+    entry = {"id": 10, "Findings": [{**findings[1], **updates[0].updates}, varfish_update.result_entry()]}
+    errors = check_ontology_terms(rule, entry)
+    # OMIM ids without MONDO equivalence are not in the index, but might exist
+    assert [(e.field, e.found, e.expected) for e in errors] == [
+        ("Findings/2", "HP:0000003", ""),
+        ("Findings/2", "HP:9999999", ""),
+    ]
@@ -0,0 +1,53 @@
+import pytest
+
+from . import CASE_TABLE_NAME, FINDINGS_TABLE_NAME, baserow, run
+from .baserow_client import BaserowClient
+from .mockserver import FaultConfig, MockServer
+from .mockserver.baserow import BaserowService
+from .synthetic import generate
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def test_write_parquet(tmp_path, monkeypatch):
+    data = generate(num_cases=30, seed=8)
+    with MockServer(BaserowService(data.baserow_tables(), FaultConfig())) as server:
+        monkeypatch.setattr(baserow, "get_client", lambda: BaserowClient(server.url, "token"))
+        full_data, _, _, errors = run(dry_run=True, get_sodar=True, get_varfish=False, get_sams=True, sources=data.sources(), parquet=tmp_path)
+        fields = {f["name"]: f for f in server.service.tables[579].fields}
+
+    cases = pq.read_table(tmp_path / "cases.parquet")
+    assert sorted(cases.column("case_id").to_pylist()) == sorted(full_data)
+    assert cases.schema.field("Case Status").metadata == {b"baserow_type": fields["Case Status"]["type"].encode()}
+    assert "Findings" not in cases.column_names
+
+    links = pq.read_table(tmp_path / "cases__findings.parquet").to_pylist()
+    expected = [{"case_id": case_id, "linked_id": f["id"]} for case_id, entry in full_data.items() for f in entry["Findings"]]
+    assert sorted(links, key=lambda r: (r["case_id"], r["linked_id"])) == sorted(expected, key=lambda r: (r["case_id"], r["linked_id"]))
+
+    findings = pq.read_table(tmp_path / "findings.parquet")
+    assert set(findings.column("finding_id").to_pylist()) == {link["linked_id"] for link in links}
+
+    validation = pq.read_table(tmp_path / "validation_errors.parquet").to_pylist()
+    assert len(validation) == len(errors)
+    assert {(v["case_id"], v["rule"]) for v in validation} == {(e.entry_id, e.source.name) for e in errors}
+
+
+def test_schema_types(tmp_path):
+    from .parquet import write_rows
+
+    fields = [
+        {"name": "Count", "type": "number", "number_decimal_places": 0},
+        {"name": "Score", "type": "number", "number_decimal_places": 2},
+        {"name": "Birthdate", "type": "date", "date_include_time": False},
+        {"name": "Tags", "type": "multiple_select"},
+    ]
+    rows = [
+        {"id": 1, "Count": "3", "Score": "1.50", "Birthdate": "1990-01-02", "Tags": ["a", "b"], "Extra": True},
+        {"id": 2, "Count": None, "Score": "", "Birthdate": None, "Tags": [], "Extra": None},
+    ]
+    write_rows(tmp_path, "cases", "case_id", rows, fields)
+    table = pq.read_table(tmp_path / "cases.parquet")
+    assert [str(t) for t in table.schema.types] == ["int64", "int64", "double", "date32[day]", "bool"]
+    assert table.to_pylist()[0]["Score"] == 1.5
+    assert pq.read_table(tmp_path / "cases__tags.parquet").to_pylist() == [{"case_id": 1, "value": "a"}, {"case_id": 1, "value": "b"}]
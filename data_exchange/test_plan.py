@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from . import CASE_TABLE_NAME, baserow, run
+from .baserow import merge_updates
+from .baserow_client import BaserowClient
+from .mockserver import FaultConfig, MockServer
+from .mockserver.baserow import BaserowService
+from .plan import PlanConflictError, apply_plan, read_plan
+from .synthetic import generate
+
+
+def test_write_and_apply_plan(tmp_path, monkeypatch):
+    data = generate(num_cases=20, seed=4)
+    plan_path = tmp_path / "plan.jsonl"
+    _, all_updates, _, _ = run(dry_run=True, get_sodar=True, get_varfish=False, get_sams=True, sources=data.sources(), plan=plan_path)
+    expected = {u.id: u.updates for u in merge_updates(all_updates) if u.has_updates}
+
+    lines = [json.loads(line) for line in plan_path.read_text().splitlines()[1:]]
+    cases = {line["id"]: line for line in lines if line["table"] == CASE_TABLE_NAME}
+    assert {row_id: line["new"] for row_id, line in cases.items()} == expected
+    assert all(line["stages"][key] for line in cases.values() for key in line["new"])
+    assert all(line["old"][key] == data.cases[row_id].get(key) for row_id, line in cases.items() for key in line["new"])
+
+    with MockServer(BaserowService(data.baserow_tables(), FaultConfig())) as server:
+        monkeypatch.setattr(baserow, "get_client", lambda: BaserowClient(server.url, "token"))
+        table = server.service.tables[579]
+        # a field changed after the plan was written is not overwritten
+        edited_id, edited_updates = next(iter(expected.items()))
+        edited_field = next(iter(edited_updates))
+        table.rows[edited_id][edited_field] = "Edited"
+        with pytest.raises(PlanConflictError) as err:
+            apply_plan(plan_path, dry_run=False)
+        assert [(c.id, c.field, c.current) for c in err.value.conflicts] == [(edited_id, edited_field, "Edited")]
+        assert table.rows[edited_id][edited_field] == "Edited"
+
+        _, conflicts = apply_plan(plan_path, dry_run=False, force=True)
+        assert len(conflicts) == 1
+        for row_id, updates in expected.items():
+            assert {key: table.rows[row_id][key] for key in updates} == {**updates, **({edited_field: "Edited"} if row_id == edited_id else {})}
+
+    assert read_plan(plan_path)[CASE_TABLE_NAME][0].entry == lines[0]["old"]
@@ -0,0 +1,32 @@
+from data_exchange import profiling
+from data_exchange.profiling import ProfileMode, profile_stage
+
+
+def busy():
+    return sum(i * i for i in range(200000))
+
+
+def test_profile_stage_disabled(tmp_path):
+    with profile_stage("noop"):
+        pass
+    assert not list(tmp_path.iterdir())
+
+
+def test_profile_stage_both(tmp_path):
+    profiling.enable(ProfileMode.BOTH, tmp_path, interval=0.001)
+    try:
+        with profile_stage("busy"):
+            data = [str(i) for i in range(10000)]
+            busy()
+        with profile_stage("second"):
+            pass
+    finally:
+        profiling.disable()
+
+    assert (tmp_path / "01_busy.prof").exists()
+    folded = (tmp_path / "01_busy.folded").read_text().splitlines()
+    assert folded and all(line.rsplit(" ", 1)[1].isdigit() for line in folded)
+    assert "busy" in (tmp_path / "01_busy.folded").read_text()
+    assert "peak traced memory" in (tmp_path / "01_busy.memory.txt").read_text()
+    assert [line.split("\t")[1] for line in (tmp_path / "stages.tsv").read_text().splitlines()] == ["busy", "second"]
+    assert len(data) == 10000
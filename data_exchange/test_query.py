@@ -0,0 +1,45 @@
+import pytest
+
+from .query import QueryEngine, connect, run_query, snapshot_tables
+from .recording import RecordingNotFoundError, record_sources
+from .synthetic import generate
+
+
+@pytest.fixture(scope="module")
+def snapshots(tmp_path_factory):
+    data = generate(num_cases=40, seed=11)
+    directory = tmp_path_factory.mktemp("snapshots")
+    sources = record_sources(data.sources(), directory, "test")
+    for name in ("baserow", "sodar", "varfish", "sams"):
+        sources[name]()
+    return data, directory
+
+
+@pytest.mark.parametrize("engine", [QueryEngine.SQLITE, QueryEngine.DUCKDB])
+def test_query_snapshots(snapshots, engine):
+    if engine == QueryEngine.DUCKDB:
+        pytest.importorskip("duckdb")
+        pytest.importorskip("pyarrow")
+    data, directory = snapshots
+    con = connect(snapshot_tables(directory), engine)
+
+    columns, rows = run_query(con, "SELECT case_status, count(*) FROM cases GROUP BY case_status")
+    assert columns[0] == "case_status"
+    expected = {}
+    for case in data.cases.values():
+        expected[case["Case Status"]] = expected.get(case["Case Status"], 0) + 1
+    assert dict(rows) == expected
+
+    _, rows = run_query(con, """
+        SELECT cf.case_id, f.finding_id FROM cases__findings cf
+        JOIN findings f ON f.finding_id = cf.linked_id
+    """)
+    assert sorted(rows) == sorted((case_id, f) for case_id, case in data.cases.items() for f in case["Findings"])
+
+    _, rows = run_query(con, "SELECT count(*) FROM varfish_cases JOIN varfish_pedigree ON varfish_pedigree.case_uuid = varfish_cases.sodar_uuid")
+    assert rows[0][0] == sum(len(c.pedigree) for p in data.varfish for c in p["cases"])
+
+
+def test_query_without_snapshot(tmp_path):
+    with pytest.raises(RecordingNotFoundError):
+        snapshot_tables(tmp_path)
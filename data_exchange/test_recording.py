@@ -0,0 +1,49 @@
+import pytest
+from .recording import RecordingNotFoundError, record_sources, replay_sources
+
+
+def test_record_and_replay(tmp_path):
+    sources = {
+        "tables": lambda: [{"id": 1, "name": "Cases", "data": {1: {"LB ID": "23-0001"}}}],
+        "findings": lambda uuids: {uuid: [{"uuid": uuid}] for uuid in uuids},
+    }
+    recording = record_sources(sources, tmp_path, "1")
+    tables = recording["tables"]()
+    recording["findings"](["a"])
+    recording["findings"](["b"])
+
+    replay = replay_sources(sources, tmp_path)
+    assert replay["tables"]() == tables
+    assert replay["findings"](["b", "a"]) == {"b": [{"uuid": "b"}], "a": [{"uuid": "a"}]}
+    with pytest.raises(RecordingNotFoundError):
+        replay["findings"](["c"])
+
+
+def test_recording_returns_getter_result(tmp_path):
+    findings = lambda uuids: {uuid: [{"uuid": uuid}] for uuid in uuids}
+    record_sources({"findings": findings}, tmp_path, "1")["findings"](["old"])
+
+    # a new recording drops the old entries, later calls of it add to the recording
+    recording = record_sources({"findings": findings}, tmp_path, "1")
+    assert recording["findings"](["a"]) == {"a": [{"uuid": "a"}]}
+    assert recording["findings"](["b"]) == {"b": [{"uuid": "b"}]}
+    with pytest.raises(RecordingNotFoundError):
+        replay_sources({"findings": findings}, tmp_path)["findings"](["old"])
+    assert replay_sources({"findings": findings}, tmp_path)["findings"](["a", "b"]) == findings(["a", "b"])
+
+
+def test_record_tables_by_name(tmp_path):
+    version = {"Cases": 1, "Personnel": 1}
+
+    def get_data(names=None):
+        return [{"name": name, "data": {1: {"version": v}}} for name, v in version.items() if names is None or name in names]
+
+    recording = record_sources({"baserow": get_data}, tmp_path, "1")
+    recording["baserow"]()
+    version["Cases"] = 2
+    assert recording["baserow"](["Cases"]) == [{"name": "Cases", "data": {1: {"version": 2}}}]
+
+    # tables fetched again by name replace these tables only
+    replay = replay_sources({"baserow": get_data}, tmp_path)["baserow"]
+    assert replay() == get_data()
+    assert replay(["Personnel"]) == [{"name": "Personnel", "data": {1: {"version": 1}}}]
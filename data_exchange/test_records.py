@@ -0,0 +1,68 @@
+import copy
+import pickle
+
+from . import run
+from .baserow import BaserowUpdate, merge_updates
+from .mockserver.baserow import infer_field
+from .records import LinkIds, Row, row_class, schema_row_class, to_plain
+from .synthetic import generate
+
+
+def to_records(table_id: int, rows: dict) -> dict:
+    names = list(dict.fromkeys(name for row in rows.values() for name in row))
+    fields = [infer_field(num, name, [row.get(name) for row in rows.values()]) for num, name in enumerate(names)]
+    cls = schema_row_class(table_id, fields)
+    return {row_id: cls.from_dict(row) for row_id, row in rows.items()}
+
+
+def test_row_dict_interface():
+    cls = row_class("Cases", ("LB ID", "Lastname", "Findings", "Teilnahmeerklärung versendet"), frozenset({"Findings"}))
+    row = cls.from_dict({"LB ID": "24-0001", "Findings": [3, 1], "Teilnahmeerklärung versendet": "Ja"})
+
+    assert row["LB ID"] == row.lb_id == "24-0001"
+    assert row.teilnahmeerklarung_versendet == "Ja"
+    assert isinstance(row["Findings"], LinkIds) and row["Findings"] == [3, 1]
+    assert row["Findings"] + [5] == [3, 1, 5]
+    assert "Lastname" not in row and row.get("Lastname", "-") == "-"
+    assert list(row) == ["LB ID", "Findings", "Teilnahmeerklärung versendet"]
+
+    row["Lastname"] = "Muster"
+    row["id"] = 7
+    assert row == {"LB ID": "24-0001", "Lastname": "Muster", "Findings": [3, 1], "Teilnahmeerklärung versendet": "Ja", "id": 7}
+    assert to_plain(row)["Findings"] == [3, 1] and type(to_plain(row)["Findings"]) is list
+
+    copied = row.copy()
+    copied["Lastname"] = "Meier"
+    assert type(copied) is cls and row["Lastname"] == "Muster"
+    del copied["id"]
+    assert "id" not in copied and "id" in row
+
+    restored = pickle.loads(pickle.dumps(row))
+    assert restored == row and type(restored) is cls
+    assert copy.deepcopy(row) == row
+
+
+def test_result_entry_keeps_records():
+    cls = row_class("Cases", ("Lastname", "Case Status"))
+    update = BaserowUpdate(1, cls.from_dict({"Lastname": "Muster", "Case Status": "Active"}))
+    update.add_update("Case Status", "Solved")
+    result = update.result_entry()
+    assert isinstance(result, Row)
+    assert result == {"Lastname": "Muster", "Case Status": "Solved", "id": 1}
+
+
+def test_pipeline_on_records():
+    data = generate(num_cases=30, seed=5)
+    _, dict_updates, dict_findings, dict_errors = run(dry_run=True, get_sodar=True, get_varfish=False, get_sams=True, sources=data.sources())
+
+    tables = [{**table, "data": to_records(table["id"], copy.deepcopy(table["data"]))} for table in data.baserow_tables()]
+    sources = {**data.sources(), "baserow": lambda: tables}
+    _, record_updates, record_findings, record_errors = run(dry_run=True, get_sodar=True, get_varfish=False, get_sams=True, sources=sources)
+
+    def updates_by_id(updates):
+        return {u.id: u.updates for u in merge_updates(updates) if u.has_updates and u.id is not None}
+
+    assert updates_by_id(dict_updates)
+    assert updates_by_id(record_updates) == updates_by_id(dict_updates)
+    assert updates_by_id(record_findings) == updates_by_id(dict_findings)
+    assert [(e.source.name, e.field, e.comment) for e in record_errors] == [(e.source.name, e.field, e.comment) for e in dict_errors]
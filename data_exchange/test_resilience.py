@@ -0,0 +1,96 @@
+import functools
+import threading
+import time
+
+import pytest
+
+from . import baserow, run
+from .recording import recording_path
+from .resilience import CircuitBreaker, DegradationReport, GuardedSource, SourceTimeoutError, SourceUnavailableError, call_with_deadline, guard_sources
+from .synthetic import generate
+
+
+def test_call_with_deadline(monkeypatch):
+    monkeypatch.setattr(baserow, "get_client", functools.cache(object))
+    release = threading.Event()
+    start = time.monotonic()
+    client = baserow.get_client()
+    with pytest.raises(SourceTimeoutError):
+        call_with_deadline("slow", release.wait, (5,), 0.05)
+    assert time.monotonic() - start < 1
+    # the abandoned worker keeps its client, later calls get a new one
+    assert baserow.get_client() is not client
+    release.set()
+
+    assert call_with_deadline("fast", lambda x: x + 1, (1,), 1) == 2
+    with pytest.raises(ValueError):
+        call_with_deadline("failing", int, ("x",), 1)
+
+
+def test_snapshot_fallback(tmp_path):
+    report = DegradationReport()
+    calls = []
+
+    def getter():
+        calls.append(1)
+        if len(calls) > 1:
+            raise ConnectionError("down")
+        return [{"uuid": "a"}]
+
+    source = GuardedSource("sams", getter, 1, CircuitBreaker(2, 60), report, tmp_path)
+    assert source() == [{"uuid": "a"}]
+    assert not report.degradations
+
+    assert source() == [{"uuid": "a"}]
+    assert source() == [{"uuid": "a"}]
+    assert [d.fallback.split(" from")[0] for d in report.degradations] == ["using snapshot"] * 2
+    assert "ConnectionError: down" in report.to_text()
+
+    # the breaker is open after two failures, so the getter is not called anymore
+    assert source.breaker.state == "open"
+    assert source() == [{"uuid": "a"}]
+    assert len(calls) == 3
+    assert "CircuitOpenError" in report.degradations[-1].reason
+
+
+def test_skip_without_snapshot(tmp_path):
+    report = DegradationReport()
+
+    def getter():
+        raise ConnectionError("down")
+
+    with pytest.raises(SourceUnavailableError):
+        GuardedSource("sodar", getter, 1, CircuitBreaker(3, 60), report, tmp_path)()
+    assert report.degradations[0].fallback == "skipped"
+
+    with pytest.raises(ConnectionError):
+        GuardedSource("baserow", getter, 1, CircuitBreaker(3, 60), report, tmp_path, required=True)()
+    assert len(report.degradations) == 1
+
+
+def test_required_snapshot(tmp_path):
+    report = DegradationReport()
+    GuardedSource("baserow", lambda: [{"id": 1}], 1, CircuitBreaker(3, 60), report, tmp_path, required=True)()
+    assert not recording_path(tmp_path, "baserow").exists()
+    GuardedSource("baserow", lambda: [{"id": 1}], 1, CircuitBreaker(3, 60), report, tmp_path, required=True, snapshot_required=True)()
+    assert recording_path(tmp_path, "baserow").exists()
+
+
+def test_run_skips_hanging_source(tmp_path):
+    data = generate(num_cases=20, seed=6)
+    release = threading.Event()
+
+    def hanging():
+        release.wait(5)
+        return data.sams
+
+    report = DegradationReport()
+    sources = guard_sources({**data.sources(), "sams": hanging}, report, {"sams": 0.1}, tmp_path)
+    try:
+        _, updates, _, _ = run(dry_run=True, get_sodar=True, get_varfish=False, get_sams=True, sources=sources)
+    finally:
+        release.set()
+    _, expected, _, _ = run(dry_run=True, get_sodar=True, get_varfish=False, get_sams=False, sources=data.sources())
+
+    assert [(d.source, d.fallback) for d in report.degradations] == [("sams", "skipped")]
+    assert len(updates) == len(expected)
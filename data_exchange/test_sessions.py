@@ -0,0 +1,62 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from .sessions import Coalescer, TokenBucket, create_session, request_key
+
+
+def test_token_bucket():
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(2, burst=2, clock=lambda: now[0], sleep=sleep)
+    assert [bucket.acquire() for _ in range(4)] == [0, 0, 0.5, 0.5]
+    now[0] += 10
+    # idle time fills the bucket up to burst only
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0.5]
+    assert waits == [0.5, 0.5, 0.5]
+
+
+def test_coalescer():
+    coalescer = Coalescer()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"rows": []}
+
+    with ThreadPoolExecutor(4) as executor:
+        first = executor.submit(coalescer.call, "key", fetch)
+        started.wait(5)
+        others = [executor.submit(coalescer.call, "key", fetch) for _ in range(3)]
+        release.set()
+        results = [f.result() for f in [first, *others]]
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+    # finished calls are not cached
+    assert coalescer.call("key", fetch) == {"rows": []}
+    assert len(calls) == 2
+
+    def fail():
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        coalescer.call("key", fail)
+
+
+def test_request_key():
+    session, other = create_session(), create_session()
+    key = request_key(session, "get", "https://varfish.bihealth.org/csq?b=2", {"a": 1})
+    assert key == request_key(session, "GET", "https://varfish.bihealth.org/csq?b=2&a=1")
+    assert key != request_key(other, "GET", "https://varfish.bihealth.org/csq?b=2&a=1")
+    assert request_key(session, "POST", "https://varfish.bihealth.org/login/") is None
@@ -0,0 +1,51 @@
+from . import create_updates
+from .baserow import normalize_lbid
+from .shards import UnionFind, plan_shards
+from .synthetic import generate
+
+
+def test_union_find():
+    families = UnionFind()
+    families.union("a", "b")
+    families.union("c", "d")
+    families.union("b", "d")
+    assert len({families.find(n) for n in "abcd"}) == 1
+    assert families.find("e") == "e"
+
+
+def test_plan_shards():
+    data = generate(num_cases=60, seed=12)
+    shards = plan_shards(data.cases, data.lb, data.findings, 4)
+    assert len(shards) == 4
+
+    case_ids = [cid for shard in shards for family in shard for _, cid in family.cases]
+    assert sorted(case_ids) == sorted(data.cases)
+    for shard in shards:
+        for family in shard:
+            family_ids = {normalize_lbid(data.cases[cid]["LB ID"]) for _, cid in family.cases}
+            family_ids |= {normalize_lbid(data.lb[lid]["Index ID"]) for lid in family.lb_ids}
+            assert {fid for _, cid in family.cases for fid in data.cases[cid]["Findings"]} <= set(family.finding_ids)
+            for other in shard:
+                if other is not family:
+                    assert not family_ids & {normalize_lbid(data.cases[cid]["LB ID"]) for _, cid in other.cases} - {None}
+
+
+def test_sharded_run_matches_serial():
+    def updates(workers):
+        # stages change source data in place, so every run gets its own
+        data = generate(num_cases=80, seed=13)
+        # cases without LB ID are matched by name to all LB entries
+        for cid in list(data.cases)[:5]:
+            data.cases[cid]["LB ID"] = ""
+        full_data, case_updates, findings_updates, relatives_updates, errors = create_updates(True, True, True, data.sources(), workers)
+        return (
+            [(u.id, u.updates, u.stage) for u in case_updates],
+            [(u.id, u.updates, u.stage) for u in findings_updates],
+            [(u.id, u.updates, u.stage) for u in relatives_updates],
+            [(e.entry_id, e.source.name, e.field, e.comment) for e in errors],
+            full_data,
+        )
+
+    serial = updates(1)
+    assert serial[0] and serial[1] and serial[2]
+    assert updates(3) == serial
@@ -0,0 +1,57 @@
+import copy
+
+import pytest
+
+from . import create_updates
+from .baserow import get_baserow_table, merge_updates
+from .single_case import CaseData, load_case, parse_case_id, sync_case
+from .synthetic import generate
+
+
+def test_parse_case_id():
+    assert parse_case_id("SV-1234") == 1234
+    assert parse_case_id("sv1234") == 1234
+    assert parse_case_id(" 42 ") == 42
+    with pytest.raises(ValueError):
+        parse_case_id("LB-1234")
+
+
+def test_sync_case_matches_full_run():
+    data = generate(num_cases=30, seed=5)
+    _, case_updates, findings_updates, _, _ = create_updates(False, False, True, sources=data.sources())
+    full_updates = {u.id: u.updates for u in merge_updates(case_updates)}
+
+    tables = copy.deepcopy(data.baserow_tables())
+    cases = get_baserow_table(tables, "Cases")
+    findings = get_baserow_table(tables, "Findings")
+    for case_id in sorted(cases)[::4]:
+        case_data = CaseData(
+            case_id=case_id,
+            cases={case_id: cases[case_id]},
+            findings={fid: findings[fid] for fid in cases[case_id]["Findings"]},
+            patients=get_baserow_table(tables, "Patients"),
+            lb=get_baserow_table(tables, "LB-Metadata"),
+            personnel=get_baserow_table(tables, "Personnel"),
+            sams=[p for p in data.sams if p["subject"]["id"] == f"SV-{case_id}"],
+            varfish_findings=data.sources()["varfish_findings"],
+        )
+        updates, _ = sync_case(case_data)
+        single_updates = {u.id: u.updates for u in merge_updates(updates["Cases"])}
+        assert single_updates == {case_id: full_updates[case_id]}
+
+
+def test_load_recorded_case():
+    data = generate(num_cases=30, seed=5)
+    _, case_updates, _, _, _ = create_updates(True, True, True, sources=data.sources())
+    full_updates = {u.id: u.updates for u in merge_updates(case_updates)}
+
+    recording = generate(num_cases=30, seed=5)
+    for case_id in sorted(recording.cases)[::4]:
+        case_data = load_case(case_id, sources=copy.deepcopy(recording).sources(), recorded=True)
+        assert list(case_data.cases) == [case_id]
+        # only the family is loaded from the recorded tables
+        assert len(case_data.patients) < len(recording.patients)
+        assert sum(len(p["data"]) for p in case_data.sodar) < sum(len(p["data"]) for p in recording.sodar)
+        updates, _ = sync_case(case_data)
+        single_updates = {u.id: u.updates for u in merge_updates(updates["Cases"])}
+        assert single_updates == {case_id: full_updates[case_id]}
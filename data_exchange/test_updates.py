@@ -0,0 +1,54 @@
+from .updates import legacy_sv_types, update_baserow_from_varfish_variants, varfish_sv_to_zygosity
+from .varfish import VARFISH_DEFAULT_LOCATION
+
+
+def make_sv(start, end, sv_type="DEL", genes=("ABC",)):
+    return {
+        "release": VARFISH_DEFAULT_LOCATION,
+        "chromosome": "1",
+        "start": start,
+        "end": end,
+        "sv_type": sv_type,
+        "sv_sub_type": sv_type,
+        "flag_final_causative": True,
+        "flag_incidental": False,
+        "flag_candidate": False,
+        "comment_text": "",
+        "variant_terms": [],
+        "case_terms": [],
+        "inheritance": None,
+        "details": {"payload": {"ovl_genes": [{"symbol": g} for g in genes], "call_info": {"index": {"genotype": "0/1"}}}},
+    }
+
+
+def test_legacy_sv_types():
+    assert legacy_sv_types({"Mutation": "Deletion Exon 3-5", "Position (VCF)": ""}) == {"DEL", "CNV"}
+    assert legacy_sv_types({"Mutation": "1:100-200DUP"}) == {"DUP", "CNV"}
+    assert legacy_sv_types({"Mutation": "c.123del p.(Leu41fs)"}) == set()
+    assert legacy_sv_types({"Mutation": "Deletion", "Position (VCF)": "GRCh37_1:100-200:DEL"}) == set()
+
+
+def test_legacy_sv_findings():
+    case = {"Varfish": "uuid", "ClinVar-Upload Status": "", "Case Status": "Solved", "Findings": [1, 2]}
+    findings = {
+        1: {"id": 1, "Genename": "ABC, DEF", "Mutation": "Deletion", "Position (VCF)": "", "Cases": [10]},
+        2: {"id": 2, "Genename": "XYZ", "Mutation": "Duplikation", "Position (VCF)": "", "Cases": [10]},
+    }
+    variants = {"uuid": [make_sv(100, 200), make_sv(5000, 9000, "DUP", genes=("OTHER",))]}
+    updates = update_baserow_from_varfish_variants({10: case}, findings, lambda ids: variants)
+    # the deletion matches by gene, the duplication is not created again next to finding 2 without position
+    assert [u.id for u in updates] == [1]
+    assert updates[0].updates["Position (VCF)"] == f"{VARFISH_DEFAULT_LOCATION}_1:100-200:DEL"
+
+
+def test_sv_zygosity():
+    def zygosity(*genotypes):
+        return varfish_sv_to_zygosity({"details": {"payload": {"call_info": {str(i): {"genotype": gt} for i, gt in enumerate(genotypes)}}}})
+
+    assert zygosity("0/1") == "Heterozygous"
+    assert zygosity("1|1", "0/1") == "Homozygous"
+    assert zygosity("1") == "Hemizygous"
+    # diploid calls with a missing allele are not haploid
+    assert zygosity("./1") == zygosity("1/.") == "Heterozygous"
+    assert zygosity("1", "./1") == "Heterozygous"
+    assert zygosity("0/0") == zygosity("./.") == ""
@@ -0,0 +1,27 @@
+"""requests session of sessions.create_session, kept apart as requests is slow to import."""
+from urllib.parse import urlsplit
+
+import requests
+
+from .sessions import coalescer, host_bucket, request_key
+
+
+class TimeoutSession(requests.Session):
+    def __init__(self, timeout: float):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        key = None
+        if not any(kwargs.get(name) for name in ("data", "json", "files", "stream")):
+            key = request_key(self, method, url, kwargs.get("params"), kwargs.get("headers"))
+        if key is None:
+            return super().request(method, url, **kwargs)
+        return coalescer.call(key, lambda: super(TimeoutSession, self).request(method, url, **kwargs))
+
+    def send(self, request, **kwargs):
+        # every sent request counts, including redirects
+        if bucket := host_bucket(urlsplit(request.url).hostname or ""):
+            bucket.acquire()
+        return super().send(request, **kwargs)
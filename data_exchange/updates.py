@@ -2,16 +2,18 @@ from collections import defaultdict
 from functools import reduce
 import re
 import datetime
-from typing import List, Callable, Optional, Tuple
+from typing import List, Callable, Optional, Set, Tuple
 from enum import Enum
 
 from loguru import logger
 from attrs import asdict, define
 
-from .baserow import VALI_FAIL, VALI_FIN, VALI_BLOCKED, VALI_OK, VALI_UPLOADED, BaserowUpdate, matchLbId, normalize_lbid, status_newer, COLUMN_CLINVAR_STATUS, COLUMN_CLINVAR_REASON
+from .baserow import VALI_FAIL, VALI_FIN, VALI_BLOCKED, VALI_OK, VALI_UPLOADED, BaserowUpdate, expand_updates, matchLbId, normalize_lbid, status_newer, COLUMN_CLINVAR_STATUS, COLUMN_CLINVAR_REASON
 from .nameinfo import NameInfo, NameInfoException
 
-from .varfish import VARFISH_STATUS_TO_BASEROW, get_findings
+from .varfish import VARFISH_DEFAULT_LOCATION, VARFISH_STATUS_TO_BASEROW, format_sv, get_findings, sv_gene_symbols, sv_genotypes
+from .index import RegionIndex
+from .ontology import get_ontology
 
 from .sams import phenopacket_to_varfish_format
 
@@ -44,7 +46,9 @@ class Mapping:
 
 
     def apply(self, source_data, dest_data) -> Optional[tuple]:
-        if not hasattr(source_data, "get"):
+        if hasattr(source_data, "model_dump"):
+            source_data = source_data.model_dump()
+        elif not hasattr(source_data, "get"):
             source_data = asdict(source_data)
         if not hasattr(dest_data, "get"):
             dest_data = asdict(dest_data)
@@ -308,20 +312,99 @@ def varfish_to_zygosity(varfish_entry):
 def varfish_to_resulttype(varfish_entry):
     if "zufallsbefund" in varfish_entry["comment_text"] or varfish_entry["flag_incidental"]:
         return "Incidental"
-    if varfish_entry["flag_candidate"] and varfish_entry["acmg_class_override"] == 3:
+    if varfish_entry["flag_candidate"] and varfish_entry.get("acmg_class_override") == 3:
         return "Candidate"
     if varfish_entry["flag_candidate"] and not varfish_entry["flag_final_causative"]:
         return "Research"
     return "Main"
 
 
-VARFISH_SV_UPDATE_MAPPINGS = [
-]
-
 def to_position_key(e):
     return f"{e['release']}_{e['chromosome']}-{e['start']}-{e['reference']}-{e['alternative']}"
 
 
+# minimum reciprocal overlap for a varfish SV to match a finding region
+SV_MIN_RECIPROCAL_OVERLAP = 0.5
+
+SV_POSITION_KEY = re.compile(r"^(?P<release>[^_]+)_(?P<chromosome>[^:]+):(?P<start>\d+)-(?P<end>\d+):(?P<sv_type>\w+)$")
+
+
+def to_sv_position_key(e):
+    return f"{e.get('release') or VARFISH_DEFAULT_LOCATION}_{e['chromosome']}:{e['start']}-{e['end']}:{e['sv_type']}"
+
+
+def parse_sv_position_key(key: Optional[str]) -> Optional[Tuple[str, str, int, int, str]]:
+    """Parse SV position key into release, chromosome, start, end and type."""
+    if key and (m := SV_POSITION_KEY.match(key)):
+        return m.group("release"), m.group("chromosome"), int(m.group("start")), int(m.group("end")), m.group("sv_type")
+    return None
+
+
+def is_sv_position_key(key: Optional[str]) -> bool:
+    return parse_sv_position_key(key) is not None
+
+
+def create_finding_region_index(findings) -> RegionIndex:
+    """Index all findings with an SV position key by their region."""
+    regions = []
+    for fid, finding in findings.items():
+        if parsed := parse_sv_position_key(finding.get("Position (VCF)")):
+            release, chrom, start, end, sv_type = parsed
+            regions.append((release, chrom, start, end, (fid, sv_type)))
+    return RegionIndex(regions)
+
+
+# SV types of words in findings entered by hand before SV position keys existed
+LEGACY_SV_TYPE_WORDS = {
+    "DEL": {"del", "deletion"},
+    "DUP": {"dup", "duplication", "duplikation"},
+    "INV": {"inv", "inversion"},
+    "INS": {"ins", "insertion"},
+    "BND": {"bnd", "translocation", "translokation"},
+    "CNV": {"cnv", "del", "deletion", "dup", "duplication", "duplikation"},
+}
+LEGACY_SV_WORD = re.compile(r"(?<![a-z])(" + "|".join(sorted({w for ws in LEGACY_SV_TYPE_WORDS.values() for w in ws})) + r")(?![a-z])", re.IGNORECASE)
+# HGVS coding or protein changes, eg c.123del, are small variants
+HGVS_SMALL_VARIANT = re.compile(r"\b[cnpr]\.")
+
+
+def legacy_sv_types(finding) -> Set[str]:
+    """SV types described by a finding without SV position key, empty for other findings."""
+    mutation = finding.get("Mutation") or ""
+    if is_sv_position_key(finding.get("Position (VCF)")) or HGVS_SMALL_VARIANT.search(mutation):
+        return set()
+    words = {w.lower() for w in LEGACY_SV_WORD.findall(mutation)}
+    return {sv_type for sv_type, type_words in LEGACY_SV_TYPE_WORDS.items() if words & type_words}
+
+
+def finding_genes(finding) -> Set[str]:
+    return {g for g in re.split(r"[\s,;/]+", finding.get("Genename") or "") if g}
+
+
+def match_legacy_sv_finding(finding_rows, varfish_variant) -> Optional[int]:
+    """Match an SV to a finding without position key by its type and an overlapped gene."""
+    genes = set(sv_gene_symbols(varfish_variant).split(",")) - {""}
+    for fid, finding in finding_rows.items():
+        if varfish_variant["sv_type"] in legacy_sv_types(finding) and genes & finding_genes(finding):
+            return fid
+    return None
+
+
+def varfish_sv_to_zygosity(varfish_entry):
+    genotypes = sv_genotypes(varfish_entry)
+    if not genotypes:
+        return ""
+    # allele slots include missing alleles, so ./1 is a diploid call
+    alleles = [re.split(r"[/|]", gt.strip()) for gt in genotypes]
+    alt_counts = [sum(1 for a in gt if a.isdigit() and int(a) > 0) for gt in alleles]
+    if max(len(gt) for gt in alleles) == 1 and max(alt_counts) == 1:
+        return "Hemizygous"
+    return {
+        2: "Homozygous",
+        1: "Heterozygous",
+    }.get(max(alt_counts), "")
+
+
 DISEASE_PREFIXES = ("OMIM", "ORPHA", "MONDO")
 PHENO_PREFIXES = ("HP",)
 
@@ -338,6 +421,8 @@ def select_terms(prefixes, mask_incidental=False):
         if mask_incidental and varfish_to_resulttype(e) == "Incidental":
             case_terms = []
         selected_terms = variant_terms or case_terms
+        if (ontology := get_ontology()) is not None:
+            selected_terms = list(dict.fromkeys(ontology.normalize_text(t) for t in selected_terms))
         return ";".join(selected_terms)
     return inner
 
@@ -402,6 +487,50 @@ VARFISH_SMALL_VARIANT_UPDATE_MAPPINGS = [
 ]
 
 
+VARFISH_SV_UPDATE_MAPPINGS = [
+    Mapping(
+        "",
+        "Genename",
+        transform=sv_gene_symbols,
+    ),
+    Mapping(
+        "",
+        "Mutation",
+        transform=format_sv,
+    ),
+    Mapping(
+        "",
+        "Zygosity",
+        transform=varfish_sv_to_zygosity,
+    ),
+    Mapping(
+        "",
+        "ResultType",
+        transform=varfish_to_resulttype,
+    ),
+    Mapping(
+        "inheritance",
+        "Inheritance",
+    ),
+    Mapping(
+        "",
+        "Position (VCF)",
+        transform=to_sv_position_key,
+    ),
+    Mapping(
+        "",
+        "OMIM",
+        transform=select_terms(DISEASE_PREFIXES),
+        when=Condition.DIFFERENT,
+    ),
+    Mapping(
+        "",
+        "HPO Terms",
+        transform=select_terms(PHENO_PREFIXES, mask_incidental=True),
+    ),
+]
+
+
 def fuzzy_match_hgvs(left_h, right_h):
     right_h = right_h.replace(" ", "")
     for d in ("del", "dup", "ins", "inv", "fs", "ext"):
@@ -416,17 +545,33 @@ def optionally_add_brackets(hgvs_p_str: str) -> str:
     return hgvs_p_str
 
 
-def update_baserow_from_varfish_variants(all_cases, findings) -> List[BaserowUpdate]:
-    def case_applicable(case) -> bool:
-        included_status = ["Solved", "VUS", "Unsolved"]
-        return case["Varfish"] and case[COLUMN_CLINVAR_STATUS] != VALI_UPLOADED and case[BASEROW_FIELD_STATUS] in included_status
+def varfish_variants_applicable(case) -> bool:
+    """Check whether findings of a case are updated from its flagged VarFish variants."""
+    included_status = ["Solved", "VUS", "Unsolved"]
+    return case["Varfish"] and case[COLUMN_CLINVAR_STATUS] != VALI_UPLOADED and case[BASEROW_FIELD_STATUS] in included_status
+
+
+def update_baserow_from_varfish_variants(all_cases, findings, findings_getter: Callable = get_findings) -> List[BaserowUpdate]:
+    finding_regions = create_finding_region_index(findings)
 
     def match_finding_id(finding_rows, varfish_variant):
         """Match varfish variant to finding rows.
         """
         if "sv_type" in varfish_variant:
-            logger.warning("SV not supported yet.")
-            return None
+            def accept(value):
+                fid, sv_type = value
+                return fid in finding_rows and sv_type == varfish_variant["sv_type"]
+
+            if match := finding_regions.best_match(
+                varfish_variant.get("release") or VARFISH_DEFAULT_LOCATION,
+                varfish_variant["chromosome"],
+                varfish_variant["start"],
+                varfish_variant["end"],
+                SV_MIN_RECIPROCAL_OVERLAP,
+                accept=accept,
+            ):
+                return match[0]
+            return match_legacy_sv_finding(finding_rows, varfish_variant)
         else:
             gene_symbol = varfish_variant["gene_symbol"]
             hgvs_c = varfish_variant["hgvs_c"]
@@ -495,10 +640,10 @@ def update_baserow_from_varfish_variants(all_cases, findings) -> List[BaserowUpd
                 unmatched_variants.append(varfish_variant)
         return matched_variants, unmatched_variants
 
-    included_cases = {cid: case for cid, case in all_cases.items() if case_applicable(case)}
+    included_cases = {cid: case for cid, case in all_cases.items() if varfish_variants_applicable(case)}
 
     varfish_ids = [case["Varfish"] for case in included_cases.values() if case["Varfish"]]
-    all_varfish_variants = get_findings(varfish_ids)
+    all_varfish_variants = findings_getter(varfish_ids)
 
     all_updates = []
     for cid, case in included_cases.items():
@@ -511,13 +656,40 @@ def update_baserow_from_varfish_variants(all_cases, findings) -> List[BaserowUpd
             if update := create_update_variant(cid, fid, case_finding, varfish_variant):
                 all_updates.append(update)
 
+        # SV findings without position and a matching gene might still be one of the unmatched SVs
+        unmatched_legacy_svs = [fid for fid, finding in case_findings.items() if fid not in mapped_case_variants and legacy_sv_types(finding)]
         for varfish_variant in unmapped:
+            if "sv_type" in varfish_variant and unmatched_legacy_svs:
+                logger.warning(f"Not creating a finding for SV {format_sv(varfish_variant)} of case {cid}, it might be one of the findings {unmatched_legacy_svs} without position")
+                continue
             if update := create_update_variant(cid, None, {}, varfish_variant):
                 all_updates.append(update)
 
     return all_updates
 
 
+ONTOLOGY_TERM_FIELDS = ("HPO Terms", "OMIM")
+
+
+def update_finding_terms(findings, findings_updates, ontology) -> List[BaserowUpdate]:
+    """Rewrite obsolete and differently written ontology terms of findings to their current ids.
+
+    New findings are left out, their terms are already normalized by select_terms.
+    """
+    updates = []
+    for update in expand_updates(findings, findings_updates):
+        if update.id is None:
+            continue
+        result = update.result_entry()
+        normalized = {
+            name: text for name in ONTOLOGY_TERM_FIELDS
+            if result.get(name) and (text := ontology.normalize_text(result[name])) != result[name]
+        }
+        if normalized:
+            updates.append(BaserowUpdate(update.id, findings[update.id], normalized))
+    return updates
+
+
 def update_baserow_relatives(
     cases_data,
     relatives_data,
@@ -587,14 +759,35 @@ def update_baserow_relatives(
                 if not entry.get(key):
                     entry[key] = value
 
-        for added_entry in added_entries.copy():
-            if match_entry(entry, added_entry):
-                merge_into(added_entry, entry)
+        # only entries with the same LB ID or name can match, all others are skipped
+        lbid = normalize_lbid(entry["LB ID"])
+        candidates = set(by_name.get(name_key(entry), []))
+        if lbid is not None:
+            candidates.update(by_lbid.get(lbid, []))
+        for pos in sorted(candidates):
+            if match_entry(entry, added_entries[pos]):
+                merge_into(added_entries[pos], entry)
+                # merging fills empty fields, which changes the keys of the entry
+                index_entry(added_entries, pos)
                 break
         else:
             added_entries.append(entry)
+            index_entry(added_entries, len(added_entries) - 1)
         return added_entries
 
+    def name_key(entry):
+        return entry["Firstname"], entry["Lastname"], entry["Birthdate"]
+
+    # positions of merged entries by their current LB ID and name, outdated keys are rejected by match_entry
+    by_lbid = defaultdict(list)
+    by_name = defaultdict(list)
+
+    def index_entry(added_entries, pos):
+        entry = added_entries[pos]
+        if (lbid := normalize_lbid(entry["LB ID"])) is not None:
+            by_lbid[lbid].append(pos)
+        by_name[name_key(entry)].append(pos)
+
     def add_index_ids(existing_ids, new_ids):
         return [i for i in set(existing_ids) | set(new_ids) if i]
 
@@ -1,11 +1,12 @@
 from collections import defaultdict
 from enum import Enum
-from typing import Any, Callable, List
+from typing import Any, Callable, Dict, List, Tuple
 from attrs import define, field
 
 from loguru import logger
 
 from data_exchange.baserow import COLUMN_CLINVAR_REASON, REASON_AUTOVALIDATION, VALI_BLOCKED, BaserowUpdate, expand_updates, VALI_OK, COLUMN_CLINVAR_STATUS
+from data_exchange.ontology import TERM_PATTERN, format_term, get_ontology
 
 
 class PersonRole(str, Enum):
@@ -24,6 +25,10 @@ class ValidationRule:
     checks: Callable
     table_view_id: int
 
+    def __reduce__(self):
+        # rules contain lambdas, so they are pickled by name, eg for checkpoints
+        return get_rule, (self.name,)
+
 
 @define
 class ValidationError:
@@ -185,6 +190,30 @@ def check_clinvar(rule, entry) -> List[ValidationError]:
     return errors
 
 
+def applies_to_cases_with_findings(entry):
+    return bool(entry["Findings"]) and get_ontology() is not None
+
+
+def check_ontology_terms(rule, entry) -> List[ValidationError]:
+    ontology = get_ontology()
+    errors = []
+    for finding in entry["Findings"]:
+        for field_name in ("HPO Terms", "OMIM"):
+            for match in TERM_PATTERN.finditer(finding.get(field_name) or ""):
+                term = ontology.lookup(match.group(0))
+                if term is None and ontology.is_complete(format_term(*match.groups())):
+                    errors.append(ValidationError(
+                        rule, entry,
+                        f"Findings/{finding['id']}", match.group(0), "", f" {field_name} {match.group(0)} unbekannt"
+                    ))
+                elif term is not None and term.obsolete:
+                    errors.append(ValidationError(
+                        rule, entry,
+                        f"Findings/{finding['id']}", term.id, term.replaced_by or "", f" {field_name} {term.id} veraltet"
+                    ))
+    return errors
+
+
 RULES = [
     ValidationRule(
         name="Ausfüllen vor Probenversand",
@@ -226,25 +255,41 @@ RULES = [
         checks=check_clinvar,
         table_view_id=-1
     ),
+    ValidationRule(
+        name="Ontologie-Terme",
+        responsible=PersonRole.FIRST_LOOK,
+        message="Befund enthält unbekannte oder veraltete HPO/OMIM Terme",
+        applies=applies_to_cases_with_findings,
+        checks=check_ontology_terms,
+        table_view_id=-1
+    ),
 ]
 
 
+def get_rule(name: str) -> ValidationRule:
+    for rule in RULES:
+        if rule.name == name:
+            return rule
+    raise KeyError(f"No validation rule {name}")
+
+
 def use_rule(rule, entry):
     if rule.applies(entry):
         return rule.checks(rule, entry)
 
 
-def apply_validations(personnel_data, cases_data, cases_updates, findings_data, findings_updates):
-    all_case_updates = expand_updates(cases_data, cases_updates)
-    all_finding_updates = expand_updates(findings_data, findings_updates)
-    all_errors = []
-
+def group_findings_by_case(findings_data, findings_updates) -> Dict[int, List[dict]]:
     findings_by_case_id = defaultdict(list)
-    for finding_update in all_finding_updates:
+    for finding_update in expand_updates(findings_data, findings_updates):
         f = finding_update.result_entry()
         for cid in f["Cases"]:
             findings_by_case_id[cid].append(f)
+    return findings_by_case_id
 
+
+def validate_cases(personnel_data, all_case_updates, findings_by_case_id) -> Tuple[List[ValidationError], Dict[str, Dict[str, int]]]:
+    """Check all rules on the results of case updates, returns the errors and the checked and failed cases of each rule."""
+    all_errors = []
     rule_totals = {
         rule.name: {"total": 0, "failed": 0} for rule in RULES
     }
@@ -255,13 +300,20 @@ def apply_validations(personnel_data, cases_data, cases_updates, findings_data,
             result[personnel_type] = [
                 {"id": person_id, **personnel_data[person_id]} for person_id in result[personnel_type]
             ]
-        result["Findings"] = findings_by_case_id[result["id"]]
+        result["Findings"] = findings_by_case_id.get(result["id"], [])
         for rule in RULES:
             if rule.applies(result):
                 rule_totals[rule.name]["total"] += 1
                 if errors := rule.checks(rule, result):
                     rule_totals[rule.name]["failed"] += 1
                     all_errors += errors
+    return all_errors, rule_totals
+
+
+def apply_validations(personnel_data, cases_data, cases_updates, findings_data, findings_updates):
+    all_case_updates = expand_updates(cases_data, cases_updates)
+    findings_by_case_id = group_findings_by_case(findings_data, findings_updates)
+    all_errors, rule_totals = validate_cases(personnel_data, all_case_updates, findings_by_case_id)
     logger.info(rule_totals)
     return all_errors
 
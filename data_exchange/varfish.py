@@ -1,21 +1,25 @@
 import re
+import functools
 import itertools
-from collections import defaultdict
-from typing import List, Dict
+from collections import OrderedDict, defaultdict
+from typing import TYPE_CHECKING, List, Dict
 from loguru import logger
-import requests
-from lxml import html
 
 from attrs import define, field
 
-from varfish_cli import api
-
 from data_exchange.myvariant import MyVariantAPI
 
 from .config import settings
+from .sessions import create_session
+
+if TYPE_CHECKING:
+    import requests
 # from requests_cache import CachedSession
 
 VARFISH_DEFAULT_LOCATION = "GRCh37"
+CASE_LIST_URL = "/cases/api/case/list/{project_uuid}/"
+# Mehari consequences kept per client, the least recently used are dropped first
+MEHARI_CACHE_SIZE = 20000
 
 HPO_AD = "HP:0000006"
 HPO_AR = "HP:0000007"
@@ -58,11 +62,6 @@ def create_key(request, **kwargs) -> str:
     return request.method + request.url
 
 
-def create_session():
-    return requests.Session()
-    # return CachedSession(allowable_methods=["GET", "HEAD", "POST"], filter_fn=lambda r: True, key_fn=create_key)
-
-
 def get_inheritance_status(genotypes, pedigree):
     def parse_gt(gt):
         geno_nums = re.findall(r"\d+", gt)
@@ -142,9 +141,20 @@ def get_case_phenotype_info(case_data, case_comment_data):
 
 
 def hpos_to_inheritance(terms):
+    """Get the inheritance of the first HPO mode of inheritance in terms.
+
+    With an ontology index, more specific modes like sex-limited autosomal
+    dominant inheritance are mapped by their nearest ancestor in
+    HPO_INHERITANCE_MAPPING.
+    """
+    from .ontology import get_ontology
+
+    ontology = get_ontology()
     terms = list(set(terms))
     inheritances = []
     for term in terms:
+        if ontology is not None and (ontology_term := ontology.lookup(term)) and ontology_term.inheritance:
+            term = ontology_term.inheritance
         if mapped := HPO_INHERITANCE_MAPPING.get(term):
             inheritances.append(mapped)
     if len(inheritances) > 1:
@@ -163,7 +173,9 @@ class Varfish:
         'origin': 'https://varfish.bihealth.org',
     }
     login_url = "/login/"
-    session: requests.Session = field(factory=create_session)
+    session: "requests.Session" = field(factory=create_session)
+    # mehari consequences by variant, kept as long as the client is reused, dropped with its session
+    mehari_cache: "OrderedDict[tuple, dict]" = field(factory=OrderedDict)
 
     case_info_url = "/variants/api/case/retrieve/{varfish_uuid}/"
     case_comment_url = "/cases/api/case-comment/list-create/{varfish_uuid}"
@@ -184,6 +196,8 @@ class Varfish:
         return self.hostname + urlstr
 
     def login(self, username, password):
+        from lxml import html
+
         self.session.headers = self.headers  # type: ignore
         resp = self.session.get(self.url(self.login_url))
         root = html.fromstring(resp.text)
@@ -217,6 +231,10 @@ class Varfish:
         """Get Mehari results for variant."""
         if not hgnc:
             hgnc = None
+        key = (chrom, pos, ref, alt, hgnc)
+        if key in self.mehari_cache:
+            self.mehari_cache.move_to_end(key)
+            return self.mehari_cache[key]
         params = {
             "genome_release": VARFISH_DEFAULT_LOCATION.lower(),
             "chromosome": chrom,
@@ -227,7 +245,24 @@ class Varfish:
         }
         resp = self.session.get(self.url(self.mehari_url), params=params)
         resp.raise_for_status()
-        return resp.json()
+        self.mehari_cache[key] = resp.json()
+        if len(self.mehari_cache) > MEHARI_CACHE_SIZE:
+            self.mehari_cache.popitem(last=False)
+        return self.mehari_cache[key]
+
+    def get_sv_details(self, sv_uuid: str) -> dict:
+        """Get query result details for a flagged SV.
+
+        Details are only available while a query result for the SV exists, so
+        a missing result is not an error.
+        """
+        import requests
+
+        try:
+            return self._get(self.svs_details_url, sv_uuid=sv_uuid)
+        except requests.HTTPError as err:
+            logger.warning(f"No SV details for {sv_uuid}: {err}")
+            return {}
 
     def get_final_variants(self, varfish_uuid: str):
         case_data = self._get(self.case_info_url, varfish_uuid=varfish_uuid)
@@ -309,23 +344,23 @@ class Varfish:
 
             final_variants.append(variant)
 
-        sv_pos_to_comment = {
-            to_pos_sv(entry): "\n".join([entry["text"]])
-            for entry in
-            self._get(self.svs_comment_url, varfish_uuid=varfish_uuid)
-        }
-
-        final_sv_variants = [
-            {"comment": sv_pos_to_comment.get(to_pos_sv(entry), ""), **entry} for entry in
-            self._get(self.svs_flags_url, varfish_uuid=varfish_uuid)
-            if entry["flag_final_causative"] or entry["flag_incidental"]
-        ]
-
-        resp = self.session.get(self.url(self.svs_flags_url).format(varfish_uuid=varfish_uuid))
-        resp.raise_for_status()
-        final_sv_variants = [
-            entry for entry in resp.json() if entry["flag_final_causative"] or entry["flag_incidental"]
-        ]
+        sv_comments_by_pos = defaultdict(list)
+        for entry in self._get(self.svs_comment_url, varfish_uuid=varfish_uuid):
+            sv_comments_by_pos[to_pos_sv(entry)].append(entry["text"])
+
+        final_sv_variants = []
+        for entry in self._get(self.svs_flags_url, varfish_uuid=varfish_uuid):
+            if not (entry["flag_final_causative"] or entry["flag_incidental"]):
+                continue
+            entry["comment_text"] = "\n".join(sv_comments_by_pos.get(to_pos_sv(entry), []))
+            entry["comment"] = entry["comment_text"]
+            variant_terms = get_terms_from_text(entry["comment_text"])
+            entry["release"] = entry.get("release") or VARFISH_DEFAULT_LOCATION
+            entry["variant_terms"] = variant_terms
+            entry["case_terms"] = all_person_terms
+            entry["inheritance"] = hpos_to_inheritance(list(set(variant_terms or all_person_terms)))
+            entry["details"] = self.get_sv_details(entry["sodar_uuid"])
+            final_sv_variants.append(entry)
 
         return final_variants + final_sv_variants
 
@@ -335,6 +370,21 @@ def format_sv(sv_data):
     return fmt_str
 
 
+def sv_gene_symbols(sv_data) -> str:
+    payload = (sv_data.get("details") or {}).get("payload") or {}
+    symbols = []
+    for gene in payload.get("ovl_genes") or []:
+        if (symbol := gene.get("symbol")) and symbol not in symbols:
+            symbols.append(symbol)
+    return ",".join(symbols)
+
+
+def sv_genotypes(sv_data) -> List[str]:
+    payload = (sv_data.get("details") or {}).get("payload") or {}
+    call_info = payload.get("call_info") or {}
+    return [info["genotype"] for info in call_info.values() if info.get("genotype")]
+
+
 def format_smallvar(data):
     acmg_class = max(data['acmg_class_auto'] or 0, data['acmg_class_override'] or 0)
     fmt_str = f"{data['symbol']}({data['transcript_id']}):{data['hgvs_c']} {data['hgvs_p']} ({'/'.join(data['effect'])} ACMG {acmg_class})"
@@ -348,6 +398,8 @@ def format_var(data):
 
 
 def get_data():
+    from varfish_cli import api
+
     all_data = []
 
     for project in settings.sodar.project:
@@ -360,10 +412,42 @@ def get_data():
     return all_data
 
 
-def get_findings(varfish_uuids: List[str]) -> Dict[str, List[dict]]:
-    logger.debug("Loading varfish variants")
+def search_cases(query: str) -> List[dict]:
+    """Get the cases of all projects whose name or pedigree members contain query, like get_data."""
+    from varfish_cli.api.models import Case
+
+    session = create_session()
+    session.headers["Authorization"] = f"Token {settings.varfish_token}"
+    all_data = []
+    for project in settings.sodar.project:
+        url = settings.varfish.url.rstrip("/") + CASE_LIST_URL.format(project_uuid=project.id)
+        params = {"q": query, "page_size": 100}
+        cases = []
+        while url:
+            resp = session.get(url, params=params)
+            resp.raise_for_status()
+            page = resp.json()
+            cases += page["results"]
+            # the next url already contains all parameters
+            url, params = page["next"], None
+        all_data.append({
+            "uuid": project.id,
+            "cases": [Case.model_validate(case) for case in cases],
+        })
+    return all_data
+
+
+@functools.cache
+def get_client() -> Varfish:
+    """Logged in VarFish client, reused by all later calls."""
     v = Varfish(settings.varfish.url)
     v.login(settings.varfish_user, settings.varfish_password)
+    return v
+
+
+def get_findings(varfish_uuids: List[str]) -> Dict[str, List[dict]]:
+    logger.debug("Loading varfish variants")
+    v = get_client()
     results = {}
     for uuid in varfish_uuids:
         results[uuid] = v.get_final_variants(uuid)
@@ -0,0 +1,186 @@
+"""Receive Baserow row webhooks and queue touched rows for incremental syncs.
+
+Webhooks have to be created in Baserow with user field names enabled for the
+Cases and Findings tables and point to http://<host>:<port>/webhook.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from . import CASE_TABLE_NAME, FINDINGS_TABLE_NAME
+from .baserow import BaserowUpdate, get_client, get_table_config
+
+WEBHOOK_PATH = "/webhook"
+TOKEN_HEADER = "X-Webhook-Token"
+
+# rows of these tables are synced incrementally
+WEBHOOK_TABLES = (CASE_TABLE_NAME, FINDINGS_TABLE_NAME)
+
+
+def writable_field_names(table_name: str) -> Set[str]:
+    return {f["name"] for f in get_client().writable_fields(get_table_config(table_name).id)}
+
+
+class RecentWrites:
+    """Fields we wrote per row, to ignore the webhooks caused by our own writes."""
+
+    def __init__(self, ttl: float, field_names: Callable[[str], Set[str]] = writable_field_names):
+        self.ttl = ttl
+        self.field_names = field_names
+        self._writes: Dict[Tuple[str, int], Tuple[float, Set[str]]] = {}
+        self._lock = threading.Lock()
+
+    def _fields(self, key) -> Set[str]:
+        written_at, fields = self._writes.get(key, (0.0, set()))
+        if time.monotonic() - written_at > self.ttl:
+            return set()
+        return fields
+
+    def record(self, table_name: str, updates: List[BaserowUpdate]):
+        now = time.monotonic()
+        with self._lock:
+            for update in updates:
+                if update.id is not None:
+                    key = (table_name, update.id)
+                    self._writes[key] = (now, self._fields(key) | set(update.updates))
+            self._writes = {k: v for k, v in self._writes.items() if now - v[0] <= self.ttl}
+
+    def is_own_write(self, table_name: str, item: dict, old_item: Optional[dict]) -> bool:
+        """Check if all changed fields of a row were written by us recently."""
+        if old_item is None:
+            return False
+        with self._lock:
+            fields = self._fields((table_name, item["id"]))
+        if not fields:
+            return False
+        # formula and last modified fields change with every write
+        writable = self.field_names(table_name)
+        changed = {k for k in writable if item.get(k) != old_item.get(k)}
+        return changed <= fields
+
+
+class DebouncedQueue:
+    """Collect row ids by table and flush them once no new ids arrived for debounce seconds.
+
+    Rows are flushed at the latest max_delay seconds after the first queued row.
+    """
+
+    def __init__(self, flush: Callable[[Dict[str, Set[int]]], None], debounce: float, max_delay: float):
+        self.flush = flush
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._pending: Dict[str, Set[int]] = defaultdict(set)
+        self._first: Optional[float] = None
+        self._last: Optional[float] = None
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="webhook-queue", daemon=True)
+
+    def add(self, table_name: str, row_ids: List[int]):
+        with self._cond:
+            now = time.monotonic()
+            self._pending[table_name].update(row_ids)
+            self._first = self._first or now
+            self._last = now
+            self._cond.notify()
+
+    def _take(self) -> Optional[Dict[str, Set[int]]]:
+        with self._cond:
+            while not self._stopped:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                deadline = min(self._last + self.debounce, self._first + self.max_delay)
+                if (wait := deadline - time.monotonic()) > 0:
+                    self._cond.wait(wait)
+                    continue
+                rows = dict(self._pending)
+                self._pending.clear()
+                self._first = self._last = None
+                return rows
+        return None
+
+    def _run(self):
+        while (rows := self._take()) is not None:
+            try:
+                self.flush(rows)
+            except Exception:
+                logger.exception("Incremental sync of {rows} failed", rows=rows)
+
+    def start(self) -> "DebouncedQueue":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+
+class WebhookReceiver:
+    """Queue rows from Baserow webhook payloads."""
+
+    def __init__(self, queue: DebouncedQueue, recent_writes: RecentWrites, token: Optional[str] = None):
+        self.queue = queue
+        self.recent_writes = recent_writes
+        self.token = token
+        self.tables = {get_table_config(name).id: name for name in WEBHOOK_TABLES}
+        self.received = 0
+        self.ignored = 0
+
+    def handle(self, payload: dict) -> int:
+        """Queue touched rows of a webhook payload, returns the number of queued rows."""
+        self.received += 1
+        table_name = self.tables.get(payload.get("table_id"))
+        items = payload.get("items")
+        if table_name is None or not items:
+            # deleted rows are handled by the next full sync
+            self.ignored += 1
+            return 0
+
+        old_items = {item["id"]: item for item in payload.get("old_items") or []}
+        row_ids = [
+            item["id"] for item in items
+            if not self.recent_writes.is_own_write(table_name, item, old_items.get(item["id"]))
+        ]
+        if not row_ids:
+            self.ignored += 1
+            return 0
+        logger.debug("Webhook {event} queued {table} rows {row_ids}", event=payload.get("event_type"), table=table_name, row_ids=row_ids)
+        self.queue.add(table_name, row_ids)
+        return len(row_ids)
+
+
+def create_webhook_server(receiver: WebhookReceiver, host: str, port: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != WEBHOOK_PATH:
+                return self._respond(404, {"detail": "Not found"})
+            if receiver.token and self.headers.get(TOKEN_HEADER) != receiver.token:
+                return self._respond(403, {"detail": "Invalid token"})
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            except ValueError:
+                return self._respond(400, {"detail": "Invalid JSON"})
+            self._respond(200, {"queued": receiver.handle(payload)})
+
+        def _respond(self, status: int, data: dict):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.trace(format % args)
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    return httpd
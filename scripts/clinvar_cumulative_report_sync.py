@@ -3,30 +3,26 @@ Synchronize clinvar cumulative report with findings in Baserow.
 """
 import csv
 from pathlib import Path
-from typing import List
+from typing import Iterator
 from xml.etree import ElementTree as ET
 
 from loguru import logger
 import typer
 
 from data_exchange.baserow import apply_updates, get_table, BaserowUpdate
+from data_exchange.index import create_position_index
 
 
-def read_clinvar_tsv(clinvar_tsv_path: Path) -> List[dict]:
-    """Read clinvar tsv into list of dicts format."""
-    entries = []
+def read_clinvar_tsv(clinvar_tsv_path: Path) -> Iterator[dict]:
+    """Stream entries from the clinvar tsv as dicts."""
     with clinvar_tsv_path.open("r") as f:
-        prev_pos = None
         for row in f:
             if row.startswith("#Your_variant_id\tVariationID"):
-                headers = row.split("\t")
+                headers = row.rstrip("\n").split("\t")
                 break
         else:
             raise RuntimeError(f"Failed to find header")
-        dr = csv.DictReader(f, fieldnames=headers, delimiter="\t")
-        for entry in dr:
-            entries.append(entry)
-    return entries
+        yield from csv.DictReader(f, fieldnames=headers, delimiter="\t")
 
 
 def coords_to_position(clinvar_entry):
@@ -55,34 +51,37 @@ BASEROW_CLINVAR_ID = "Clinvar-ID"
 
 
 def main(clinvar_tsv: Path, dry_run: bool = False):
-    logger.info("Reading", clinvar_tsv)
+    logger.info("Reading {}", clinvar_tsv)
 
-    clinvar_data = read_clinvar_tsv(clinvar_tsv)
-    from pprint import pprint
-    pprint(clinvar_data[0])
-
-    finding_data = get_table("Findings")
+    finding_data = get_table(
+        "Findings",
+        include=["Position (VCF)", BASEROW_FINDING_KEY_FIELD, BASEROW_CLINVAR_ID],
+        filters=[("Position (VCF)", "not_empty", "")],
+    )
+    findings_by_position = create_position_index(finding_data)
 
     matched = 0
     unmatched = 0
     updates = []
-    for clinvar_entry in clinvar_data:
+    for clinvar_entry in read_clinvar_tsv(clinvar_tsv):
+        position = coords_to_position(clinvar_entry)
+        matched_ids = findings_by_position.get(position, []) if position else []
+        if not matched_ids:
+            unmatched += 1
+            continue
+
+        matched += 1
         clinvar_key = clinvar_entry["Your_record_id"]
         clinvar_id = clinvar_entry["SCV"]
-        if position := coords_to_position(clinvar_entry):
-            for fid, finding in finding_data.items():
-                vcf_position_key = finding["Position (VCF)"]
-                if position == vcf_position_key:
-                    update = BaserowUpdate(fid, finding)
-                    if not finding[BASEROW_FINDING_KEY_FIELD]:
-                        update.add_update(BASEROW_FINDING_KEY_FIELD, clinvar_key)
-                    if clinvar_id and (not finding[BASEROW_CLINVAR_ID] or "SCV" not in finding[BASEROW_CLINVAR_ID]):
-                        update.add_update(BASEROW_CLINVAR_ID, clinvar_id)
-                    if update.has_updates:
-                        updates.append(update)
-                    matched += 1
-            else:
-                unmatched += 1
+        for fid in matched_ids:
+            finding = finding_data[fid]
+            update = BaserowUpdate(fid, finding)
+            if not finding[BASEROW_FINDING_KEY_FIELD]:
+                update.add_update(BASEROW_FINDING_KEY_FIELD, clinvar_key)
+            if clinvar_id and (not finding[BASEROW_CLINVAR_ID] or "SCV" not in finding[BASEROW_CLINVAR_ID]):
+                update.add_update(BASEROW_CLINVAR_ID, clinvar_id)
+            if update.has_updates:
+                updates.append(update)
 
     logger.info(f"Matched {matched} clinvar entries. {unmatched} unmatched entries remaining")
 
@@ -3,6 +3,7 @@ from loguru import logger
 import typer
 import re
 from data_exchange.baserow import get_table
+from data_exchange.updates import is_sv_position_key
 
 from csv import DictWriter
 
@@ -10,10 +11,34 @@ from csv import DictWriter
 FINDINGS = "Findings"
 CASES = "Cases"
 
+CASE_FIELDS = ["Case Status", "AutoValidation", "Findings", "Datenverarbeitung"]
+CASE_FILTERS = [("Case Status", "single_select_is_any_of", ["Solved", "VUS"])]
+
+FINDING_FIELDS = [
+    "ResultType",
+    "Position (VCF)",
+    "OMIM",
+    "Multiple Condition Explanation",
+    "Inheritance",
+    "ACMG Classification",
+    "EvaluationDate",
+    "HPO Terms",
+    "Interpretation (ClinVar)",
+    "Clinvar-Upload-Key",
+    "Clinvar-ID",
+    "Clinvar-Errors",
+    "PMIDs",
+]
+FINDING_FILTERS = [
+    ("ResultType", "single_select_is_any_of", ["Main", "Incidental"]),
+    ("Position (VCF)", "not_empty", ""),
+]
+
 
 def finding_is_exportable(finding):
     correct_result_type = finding["ResultType"] in ("Main", "Incidental")
-    has_position = bool(finding["Position (VCF)"])
+    # SV findings can not be exported in the clinvar-this smallvar format
+    has_position = bool(finding["Position (VCF)"]) and not is_sv_position_key(finding["Position (VCF)"])
     return correct_result_type and has_position
 
 
@@ -97,12 +122,14 @@ def write_to_tsv(data, path):
 
 
 def main(output_tsv_file: Path):
-    findings_data = get_table(FINDINGS)
-    cases_data = get_table(CASES)
+    # only exportable findings are fetched, all others are irrelevant for the
+    # export decision
+    findings_data = get_table(FINDINGS, include=FINDING_FIELDS, filters=FINDING_FILTERS)
+    cases_data = get_table(CASES, include=CASE_FIELDS, filters=CASE_FILTERS)
 
     for case in cases_data.values():
         case["Findings"] = [
-            {"id": fid, **findings_data[fid]} for fid in case["Findings"]
+            {"id": fid, **findings_data[fid]} for fid in case["Findings"] if fid in findings_data
         ]
 
     exportable_cases = [c for c in cases_data.values() if is_exportable(c)]
@@ -10,6 +10,7 @@ from typing import List
 import typer
 
 from data_exchange.baserow import apply_updates, BaserowUpdate, get_table
+from data_exchange.index import create_position_index
 from data_exchange.updates import to_position_key
 
 
@@ -22,7 +23,7 @@ def read_clinvar_this_export(path: Path):
     return entries
 
 
-def match_finding(entry, base_data) -> int:
+def match_finding(entry, findings_by_position) -> int:
     """Returns the matching entry ID."""
     vcf_key = to_position_key({
         "release": entry["ASSEMBLY"],
@@ -32,9 +33,8 @@ def match_finding(entry, base_data) -> int:
         "alternative": entry["ALT"],
     })
 
-    for fid, base_entry in base_data.items():
-        if vcf_key == base_entry["Position (VCF)"]:
-            return fid
+    if matched_ids := findings_by_position.get(vcf_key):
+        return matched_ids[0]
 
 
 def parse_existing_error_msg(error_msg):
@@ -44,10 +44,15 @@ def parse_existing_error_msg(error_msg):
 
 
 def create_findings_updates(ct_entries: List[dict]):
-    findings_data = get_table(FINDINGS)
+    findings_data = get_table(
+        FINDINGS,
+        include=["Position (VCF)", "Clinvar-Upload-Key", "Clinvar-ID", "Clinvar-Errors"],
+        filters=[("Position (VCF)", "not_empty", "")],
+    )
+    findings_by_position = create_position_index(findings_data)
     updates = []
     for entry in ct_entries:
-        if fid := match_finding(entry, findings_data):
+        if fid := match_finding(entry, findings_by_position):
             update = BaserowUpdate(fid, findings_data[fid])
             if entry["KEY"]:
                 update.add_update("Clinvar-Upload-Key", entry["KEY"])